@@ -0,0 +1,205 @@
+# asyncio runner for the pipeline
+# gr-iridium and iridium-parser run as asyncio subprocesses, so several capture sources share one event loop
+# without a thread per process, and SIGTERM/SIGINT drain the sources instead of killing them mid-batch
+import asyncio
+import os
+import signal
+
+from parser_worker import PARSER_CMD, MAX_RESTARTS
+from stages import Batcher
+
+EXTRACTOR_CMD = ["iridium-extractor", "-D", "4"]
+TICK = 0.05  # Seconds between checks for batches that are due by age
+
+
+class AsyncParser:
+    """
+    asyncio counterpart of ParserWorker, feeds iridium-parser line by line and awaits on_line(line) for every parsed frame.
+    """
+
+    def __init__(self, on_line, cmd=None, debug=False, max_restarts=MAX_RESTARTS):
+        self.on_line = on_line
+        self.cmd = cmd or PARSER_CMD
+        self.debug = debug
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.process = None
+        self.tasks = []
+
+    async def start(self):
+        # iridium-parser is a python script, without this it block buffers its stdout when piped
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        if self.debug: print("iridium-parser PID: ", self.process.pid)
+        self.tasks = [
+            asyncio.create_task(self._read_stdout(self.process)),
+            asyncio.create_task(self._read_stderr(self.process)),
+        ]
+
+    async def _read_stdout(self, process):
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                return
+            line = line.decode(errors="replace").strip()
+            if line:
+                await self.on_line(line)
+
+    async def _read_stderr(self, process):
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                return
+            line = line.decode(errors="replace").strip()
+            if not line:
+                continue
+            if "Warning" in line:
+                if self.debug: print("Warning from iridium-toolkit:", line)
+            else:
+                print("Error from iridium-toolkit:", line)
+
+    async def restart(self):
+        if self.restarts >= self.max_restarts:
+            print(f"iridium-parser crashed {self.restarts} times, not restarting.")
+            return False
+        self.restarts += 1
+        print(f"iridium-parser exited with code {self.process.returncode}, restarting ({self.restarts}/{self.max_restarts})...")
+        await asyncio.gather(*self.tasks)
+        await self.start()
+        return True
+
+    async def send(self, line):
+        for _ in range(2):
+            if self.process.returncode is not None and not await self.restart():
+                return False
+            try:
+                self.process.stdin.write((line + "\n").encode())
+                await self.process.stdin.drain()
+                return True
+            except (BrokenPipeError, ConnectionResetError):
+                await self.process.wait()
+        return False
+
+    async def close(self):
+        """
+        Closes the parser stdin and waits until all parsed frames have been handed to on_line.
+        """
+        if self.process.returncode is None:
+            self.process.stdin.close()
+        await self.process.wait()
+        await asyncio.gather(*self.tasks)
+
+
+class AsyncSource:
+    """
+    One capture source: an iridium-extractor process whose bursts are fed to its own iridium-parser.
+    RAW lines are handed to on_raw(batch, final) and parsed frames to on_parsed(batch, final),
+    batched by line count, byte size or age as configured by flush. final is set for the last batch.
+    """
+
+    def __init__(self, name, cmd, on_parsed, on_raw, flush=None, debug=False):
+        self.name = name
+        self.cmd = cmd
+        self.on_parsed = on_parsed
+        self.on_raw = on_raw
+        self.debug = debug
+        self.parsed = Batcher(**(flush or {}))
+        self.raw = Batcher(**(flush or {}))
+        self.lines = 0
+
+    def _flush(self, batcher, handler, reason):
+        try:
+            handler(batcher.take(reason), reason == "final")
+        except Exception as e:
+            print(f"Error processing {self.name}: {e}")
+
+    async def _add_parsed(self, line):
+        reason = self.parsed.add(line)
+        if reason:
+            self._flush(self.parsed, self.on_parsed, reason)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(TICK)
+            for batcher, handler in ((self.parsed, self.on_parsed), (self.raw, self.on_raw)):
+                reason = batcher.due()
+                if reason:
+                    self._flush(batcher, handler, reason)
+
+    async def _drain_stderr(self, process):
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                return
+            if self.debug: print(f"{self.name}:", line.decode(errors="replace").strip())
+
+    async def run(self, stop):
+        """
+        Runs the source until the extractor exits or stop is set, then drains the parser and flushes the batches.
+        """
+        extractor = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        if self.debug: print(f"{self.name}: gr-iridium PID: ", extractor.pid)
+        parser = AsyncParser(self._add_parsed, debug=self.debug)
+        await parser.start()
+
+        async def stop_extractor():
+            await stop.wait()
+            if extractor.returncode is None:
+                print(f"{self.name}: stopping capture...")
+                extractor.terminate()
+
+        helpers = [
+            asyncio.create_task(self._drain_stderr(extractor)),
+            asyncio.create_task(self._tick()),
+            asyncio.create_task(stop_extractor()),
+        ]
+        try:
+            while True:
+                line = await extractor.stdout.readline()
+                if not line:
+                    break
+                line = line.decode(errors="replace").strip()
+                if not line:
+                    continue
+                self.lines += 1
+                await parser.send(line)
+                reason = self.raw.add(line)
+                if reason:
+                    self._flush(self.raw, self.on_raw, reason)
+
+            await extractor.wait()
+            await parser.close()
+        finally:
+            for task in helpers:
+                task.cancel()
+            await asyncio.gather(*helpers, return_exceptions=True)
+
+        self._flush(self.parsed, self.on_parsed, "final")
+        self._flush(self.raw, self.on_raw, "final")
+        print(f"{self.name}: {self.lines} lines, flushes: parsed {self.parsed.report()}, raw {self.raw.report()}")
+
+
+async def run_sources(sources, stop=None):
+    """
+    Runs all sources concurrently in the current event loop until they finish.
+    SIGTERM and SIGINT set stop, which makes every source drain and exit.
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        return await asyncio.gather(*(source.run(stop) for source in sources))
+    finally:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
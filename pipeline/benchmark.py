@@ -0,0 +1,631 @@
+# Microbenchmarks for the hot paths of the pipeline
+# Every benchmark compares the current implementation against the one it replaced and reports its throughput
+#   python benchmark.py tokenizer [--corpus parsed.txt] [--lines 200000]
+#   python benchmark.py payload [--sessions 20] [--frames 5000]
+#   python benchmark.py channelize [--corpus parsed.txt] [--lines 200000] [--batch 1000]
+#   python benchmark.py entropy [--messages 1000] [--batches 20]
+#   python benchmark.py classifiers [--corpus labelled.txt] [--messages 20000] [--batch 1000]
+#   python benchmark.py persist [--flushes 50]
+#   python benchmark.py ber [--corpus raw.bits] [--lines 50000]
+#   python benchmark.py batch [--corpus raw.bits] [--lines 50000] [--batch 1000]
+#   python benchmark.py frames [--corpus raw.bits] [--lines 50000]
+import argparse
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import ber
+import util
+import pipeline
+from bch import nndivide, nrepair1, bch_repair, bch_repair1
+from classifiers import CLASSIFIERS, get_classifier
+from reassembly import Message
+
+SAMPLE_BITS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gr-iridiumtx", "sample_data", "ring-alerts.bits")
+
+
+def timed(fn, items, repeat=3):
+    """
+    Runs fn over all items repeat times and returns the best throughput in items/s.
+    """
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for item in items:
+            fn(item)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return len(items) / best
+
+def report(name, before, after, unit="lines/s"):
+    print(f"{name}: before {before:,.0f} {unit}, after {after:,.0f} {unit}, speedup {after / before:.1f}x")
+
+def read_lines(path, n=None):
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if n:
+        lines = (lines * (n // max(len(lines), 1) + 1))[:n]
+    return lines
+
+def sample_parsed_lines(n, path=SAMPLE_BITS, seed=1):
+    """
+    Builds iridium-toolkit style frames from the timestamps and frequencies of the sample_data recording,
+    with the frame type mix and payload formats the pipeline extracts.
+    """
+    rng = random.Random(seed)
+    headers = [line.split()[1:4] for line in read_lines(path)]
+    payloads = {
+        "IRA": lambda: "sat:52 beam:28 xyz=(-0254,+0098,+1058) pos=(+75.35/+021.06) alt=009 RAI:48 ?00 bc_sb:13 PAGE(tmsi:0c4a27ab msc_id:03)",
+        "IBC": lambda: "bc:0 sat:052 cell:28 0 slot:1 sv_blkn:0 aq_cl:1111111111111111 aq_sb:13 aq_ch:2 00 0000 time:2025-02-20T12:08:36.13Z",
+        "ITL": lambda: "V2 OK P06 S4",
+        "IDA": lambda: "cont=0 le:0 ctr=000 len=20 0:0000 [" + ".".join("%02x" % rng.randrange(256) for _ in range(20)) + "]  ---- 0000 CRC:OK",
+        "VOC": lambda: "[" + "".join("%02x" % rng.randrange(256) for _ in range(39)) + "]",
+        "IIU": lambda: "[" + "".join(rng.choice("01") for _ in range(248)) + "]",
+        "IIQ": lambda: "[" + "".join("%02x" % rng.randrange(256) for _ in range(31)) + "]",
+        "MSG": lambda: "ric:0123456 fmt:05 seq:12 msg:" + "".join("%02x" % rng.randrange(256) for _ in range(24)) + ".",
+        "NXT": lambda: "> " + " ".join("".join(rng.choice("01") for _ in range(8)) for _ in range(12)),
+    }
+    types = list(payloads)
+    lines = []
+    for i in range(n):
+        name, offset, freq = headers[i % len(headers)]
+        frame_type = rng.choice(types)
+        lines.append(f"{frame_type}: {name} {float(offset) + i:012.4f} {freq} 100% -44.05|-99.41|22.47 179 DL {payloads[frame_type]()}")
+    return lines
+
+
+# Frame extraction as it was done by pipeline.process_line before the dispatch table
+def legacy_tokenize(line):
+    parts = line.strip().split()
+    if len(parts) < 3:
+        return None
+    frame_type = parts[0][:-1]
+    if frame_type == "ERR":
+        return None
+    time = parts[1]
+    if time.split("-")[1].isdigit():
+        seconds = int(time.split("-")[1])
+        offset = float(parts[2])/1000
+        time = seconds + offset
+    else:
+        time = float(parts[2])/1000
+    freq = parts[3]
+    idx = util.channelize_str(int(freq))
+    if idx < 0 or idx >= len(pipeline.channel_map) or idx is None:
+        return None
+    if frame_type not in pipeline.lcw_types:
+        return frame_type, time, idx, None
+    data = None
+    if frame_type == "IIP" or frame_type == "IDA" or frame_type == "VOC" or frame_type == "VDA" or frame_type == "VOZ":
+        data_match = re.search(r'\[([0-9a-fA-F.][0-9a-fA-F.]+)\]', line)
+        if data_match:
+            data = data_match.group(1)
+            data = data.replace(".", "")
+    elif frame_type == "IIQ" or frame_type == "IIR":
+        data_match = re.search(r'\[([0-9a-fA-F][0-9a-fA-F]+)\]', line)
+        if data_match:
+            data = data_match.group(1)
+            data = data.replace(" ", "")
+    elif frame_type == "IIU" or frame_type == "VO6":
+        data_match = re.search(r'\[([0-1]+)\]', line)
+        if data_match:
+            data = data_match.group(1)
+            data = data.replace(" ", "")
+            try:
+                data = hex(int(data, 2))[2:]
+            except ValueError:
+                pass
+    elif frame_type == "MSG":
+        data_match = re.search(r'msg:([0-9a-fA-F]+).', line)
+        if data_match:
+            data = data_match.group(1)
+    elif frame_type == "NXT":
+        data_match = re.search(r'\> ([0-1 ]+)', line)
+        if data_match:
+            data = data_match.group(1)
+            data = data.replace(" ", "")
+            try:
+                data = hex(int(data, 2))[2:]
+            except ValueError:
+                data = None
+    return frame_type, time, idx, data
+
+def bench_tokenizer(args):
+    if args.corpus:
+        lines = read_lines(args.corpus, args.lines)
+    else:
+        lines = sample_parsed_lines(args.lines)
+    print(f"Tokenizing {len(lines)} frames")
+
+    # Both versions have to agree on everything but the zero padding of payloads decoded from bits
+    for line in lines[:1000]:
+        old, new = legacy_tokenize(line), pipeline.tokenize_line(line)
+        if old is None or new is None:
+            assert old == new, line
+            continue
+        assert old[:3] == new[:3], line
+        assert (old[3] is None) == (new[3] is None) and (old[3] is None or int(old[3], 16) == int(new[3], 16)), line
+
+    report("tokenizer", timed(legacy_tokenize, lines), timed(pipeline.tokenize_line, lines))
+
+
+def bench_channelize(args):
+    if args.corpus:
+        lines = read_lines(args.corpus, args.lines)
+    else:
+        lines = sample_parsed_lines(args.lines)
+    batches = [lines[i:i + args.batch] for i in range(0, len(lines), args.batch)]
+    print(f"Tokenizing {len(lines)} frames in batches of {args.batch}")
+
+    for batch in batches[:2]:
+        assert [pipeline.tokenize_line(line) for line in batch] == list(pipeline.tokenize_lines(batch))
+
+    def per_line(batch):
+        for line in batch:
+            pipeline.tokenize_line(line)
+
+    def batched(batch):
+        for _ in pipeline.tokenize_lines(batch):
+            pass
+
+    report("channelize", timed(per_line, batches) * args.batch, timed(batched, batches) * args.batch)
+
+
+def synthetic_sessions(sessions, frames, frame_bytes=39, seed=1):
+    """
+    Long voice-like sessions: lists of hex frame payloads (VOC frames carry 39 bytes).
+    """
+    rng = random.Random(seed)
+    return [[rng.randbytes(frame_bytes).hex() for _ in range(frames)] for _ in range(sessions)]
+
+# Entropy classification as it was done per message by util.is_hex_encrypted before the classifiers
+def legacy_entropy(data):
+    if not data or len(data) < util.MIN_ENTROPY_BYTES:
+        return None
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return util.counts_entropy(counts, len(data))
+
+def legacy_is_hex_encrypted(hex_string):
+    try:
+        data = bytes.fromhex(hex_string)
+    except ValueError:
+        return False
+    entropy_value = legacy_entropy(data)
+    return bool(entropy_value) and entropy_value > util.ENTROPY_THRESHOLD
+
+# Payload accumulation as it was done by pipeline.reconstruct_packets before the byte buffer
+def legacy_session(frames):
+    msg = {"type": "", "data": ""}
+    for data in frames:
+        msg["type"] = "VOC"
+        msg["data"] += data
+    return legacy_is_hex_encrypted(msg["data"])
+
+def buffered_session(frames, classifier=get_classifier("entropy")):
+    msg = Message(0, 0.0)
+    for data in frames:
+        msg.append(data)
+    return bool(classifier.classify([msg.tail()], msg.hist.counts[None, :])[0])
+
+def bench_payload(args):
+    sessions = synthetic_sessions(args.sessions, args.frames)
+    print(f"Accumulating {args.sessions} sessions of {args.frames} frames")
+    for frames in sessions[:2]:
+        assert legacy_session(frames) == buffered_session(frames)
+    report("payload", timed(legacy_session, sessions, repeat=1) * args.frames, timed(buffered_session, sessions, repeat=1) * args.frames, unit="frames/s")
+
+
+def synthetic_messages(n, seed=1):
+    """
+    Closed messages of the common 128-512 byte sizes, half random (encrypted-like) and half plain text.
+    """
+    rng = random.Random(seed)
+    text = b"sat:52 beam:28 pos=(+75.35/+021.06) alt=009 RAI:48 PAGE(tmsi:0c4a27ab msc_id:03) "
+    messages = []
+    for i in range(n):
+        size = rng.randrange(128, 513)
+        if i % 2:
+            messages.append(rng.randbytes(size))
+        else:
+            start = rng.randrange(len(text))
+            messages.append((text * (size // len(text) + 2))[start:start + size])
+    return messages
+
+def bench_entropy(args):
+    batches = [[message.hex() for message in synthetic_messages(args.messages, seed)] for seed in range(args.batches)]
+    print(f"Classifying {args.batches} batches of {args.messages} messages")
+
+    classifier = get_classifier("entropy")
+
+    def per_message(batch):
+        return [legacy_is_hex_encrypted(message) for message in batch]
+
+    def batched(batch):
+        return classifier.classify([bytes.fromhex(message) for message in batch])
+
+    for batch in batches[:2]:
+        assert per_message(batch) == batched(batch).tolist()
+
+    report("entropy", timed(per_message, batches) * args.messages, timed(batched, batches) * args.messages, unit="msgs/s")
+
+
+def read_labelled(path):
+    """
+    Labelled corpus of reconstructed messages, one per line: "enc <hex>" or "plain <hex>" (1/0 work as well).
+    """
+    messages, labels = [], []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 2:
+                continue
+            labels.append(parts[0].lower() in ("enc", "1", "true"))
+            messages.append(bytes.fromhex(parts[1]))
+    return messages, labels
+
+def labelled_messages(n, seed=1):
+    """
+    Synthetic fallback corpus: random bytes stand for encrypted messages, the rest is plain text,
+    structured records, text in a substituted alphabet and zlib compressed text (the hard case).
+    """
+    rng = random.Random(seed)
+    text = b"sat:52 beam:28 pos=(+75.35/+021.06) alt=009 RAI:48 PAGE(tmsi:0c4a27ab msc_id:03) ring alert "
+    alphabet = list(range(256))
+    rng.shuffle(alphabet)
+    substitution = bytes(alphabet)
+    plain = [
+        lambda size, start: (text * (size // len(text) + 2))[start:start + size],
+        lambda size, start: b"".join(bytes([0x7e, i & 0xff, start & 0xff, 0, 0, rng.randrange(16), 0, 0])
+                                     for i in range(size // 8 + 1))[:size],
+        lambda size, start: (text * (size // len(text) + 2))[start:start + size].translate(substitution),
+        lambda size, start: zlib.compress(rng.randbytes(size // 4) * 4 + text * (size // len(text) + 1))[:size],
+    ]
+    messages, labels = [], []
+    for i in range(n):
+        size = rng.randrange(128, 513)
+        if i % 2:
+            messages.append(rng.randbytes(size))
+            labels.append(True)
+        else:
+            messages.append(rng.choice(plain)(size, rng.randrange(len(text))))
+            labels.append(False)
+    return messages, labels
+
+def bench_classifiers(args):
+    if args.corpus:
+        messages, labels = read_labelled(args.corpus)
+    else:
+        messages, labels = labelled_messages(args.messages)
+    batches = [messages[i:i + args.batch] for i in range(0, len(messages), args.batch)]
+    print(f"Classifying {len(messages)} messages ({sum(labels)} encrypted) in batches of {args.batch}")
+
+    for name in CLASSIFIERS:
+        classifier = get_classifier(name)
+        predicted = [bool(enc) for batch in batches for enc in classifier.classify(batch)]
+        rate = timed(classifier.classify, batches) * args.batch
+        tp = sum(p and l for p, l in zip(predicted, labels))
+        fp = sum(p and not l for p, l in zip(predicted, labels))
+        fn = sum(l and not p for p, l in zip(predicted, labels))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        print(f"{name}: precision {precision:.3f}, recall {recall:.3f}, {rate:,.0f} msgs/s")
+
+
+# Statistics update as it was done by PipelineState.update_db before the persistent connection
+def legacy_update_db(state):
+    conn = sqlite3.connect(state.db_path)
+    cursor = conn.cursor()
+    for lcw_type, counts in state.all_types.items():
+        cursor.execute('''UPDATE all_stats SET count = ? WHERE type = ?''', (counts, lcw_type))
+    for lcw_type, counts in state.total_type_counts.items():
+        cursor.execute('''UPDATE encryption_stats SET enc = ?, total =  ? WHERE type = ?''',
+                       (counts["enc"], counts["total"], lcw_type))
+    for idx in range(pipeline.GRANULARITY):
+        cursor.execute('''UPDATE prr_stats SET prr_sum = ?, count = ? WHERE id = ?''',
+                       (float(state.prr_buf[idx]), int(state.prr_count_frames[idx]), idx + 1))
+    conn.commit()
+    conn.close()
+
+def bench_persist(args):
+    """
+    Flushes after a batch that touched a few frame types and SNR bins, as during a live capture.
+    """
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for name, flush in (("legacy", legacy_update_db), ("current", pipeline.PipelineState.update_db)):
+            state = pipeline.PipelineState(os.path.join(tmp, f"{name}.db"))
+            state.init_db()
+
+            def batch_and_flush(_):
+                for _ in range(20):
+                    state.all_types[rng.choice(pipeline.frame_types)] += 1
+                    snr = rng.randrange(100, 300)
+                    state.prr_buf[snr] += 0.9
+                    state.prr_count_frames[snr] += 1
+                flush(state)
+            results.append(timed(batch_and_flush, range(args.flushes), repeat=1))
+            state.close_db()
+    report("persist", *results, unit="flushes/s")
+
+
+def interleave(odd, even):
+    """
+    Inverse of block_de_interleave for two 32 bit strings.
+    """
+    symbols = [None] * 32
+    for k in range(16):
+        symbols[31 - 2 * k] = odd[2 * k:2 * k + 2]
+        symbols[30 - 2 * k] = even[2 * k:2 * k + 2]
+    return "".join(symbols)
+
+def block_de_interleave(group):
+    """
+    ber.de_interleave without swapping the bits of every symbol, the order of ber.BLOCK_ORDER.
+    """
+    symbols = [group[z:z + 2] for z in range(0, len(group), 2)]
+    even = "".join(symbols[x] for x in range(len(symbols) - 2, -1, -2))
+    odd = "".join(symbols[x] for x in range(len(symbols) - 1, -1, -2))
+    return odd, even
+
+def ringalert_block(rng):
+    """
+    Random BCH(31,21) codeword of the ring alert polynomial with an even parity bit.
+    """
+    data = rng.getrandbits(21) << 10
+    word = format(data | nndivide(ber.ringalert_bch_poly, data), "031b")
+    return word + str(word.count("1") % 2)
+
+def synthetic_raw_lines(n, seed=1):
+    """
+    RAW lines of IBC bursts with a few bit errors, mixed with uplink bursts, damaged unique words
+    and the bursts of the sample_data recording.
+    """
+    rng = random.Random(seed)
+    headers = [h for h in range(64) if nrepair1(ber.hdr_poly, format(h, "06b"))[0] == 0]
+    samples = read_lines(SAMPLE_BITS)
+    lines = []
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.1:
+            lines.append(samples[i % len(samples)])
+            continue
+        if kind < 0.2:
+            bits = ber.uplink_access + "".join(rng.choice("01") for _ in range(200))
+        else:
+            bits = format(rng.choice(headers), "06b")
+            for _ in range(4):
+                bits += interleave(ringalert_block(rng), ringalert_block(rng))
+            bits = list(ber.iridium_access + bits + "".join(rng.choice("01") for _ in range(rng.randrange(0, 80))))
+            # Bit errors, sometimes in the unique word
+            for _ in range(rng.choice((0, 0, 1, 2, 3, 6))):
+                pos = rng.randrange(0 if kind > 0.9 else len(ber.iridium_access), len(bits))
+                bits[pos] = "1" if bits[pos] == "0" else "0"
+            bits = "".join(bits)
+        lines.append(f"RAW: i-1740053316-t1 {1000.0 + i:012.4f} 1626299928 N:{rng.uniform(5, 30):.2f}{rng.uniform(-110, -95):+.2f} "
+                     f"I:{i:011d} {rng.randrange(60, 100):3d}% 0.00197 {len(bits) // 2:3d} {bits}")
+    return lines
+
+# BER calculation as it was done by ber.calculate_ber before the packed integer engine, in the block order of ber.BLOCK_ORDER
+def legacy_calculate_ber(line, type="IBC"):
+    p = re.compile(r'(RAW): ([^ ]*) (\S+) (\d+) (?:N:([+-]?\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)|A:(\w+)) [IL]:(\w+) +(\d+)% ([\d.]+|inf|nan) +(\d+) ([\[\]<> 01]+)(.*)')
+    bit_errors = 0
+    m = p.match(line)
+    if m is None:
+        return
+    if m.group(5) is not None:
+        snr = float(m.group(5))
+        noise = float(m.group(6))
+    bitstream_raw = (re.sub(r"[\[\]<> ]", "", m.group(12)))
+    uplink = -1
+    if bitstream_raw.startswith(ber.iridium_access):
+        uplink = 0
+    elif bitstream_raw.startswith(ber.uplink_access):
+        uplink = 1
+    elif len(bitstream_raw) >= len(ber.iridium_access):
+        access = ber.de_dqpsk(bitstream_raw[:len(ber.iridium_access)])
+        if ber.bitdiff(access, ber.UW_DOWNLINK) < 4:
+            uplink = 0
+            bit_errors += ber.bitdiff(access, ber.UW_DOWNLINK)
+        elif ber.bitdiff(access, ber.UW_UPLINK) < 4:
+            uplink = 1
+            bit_errors += ber.bitdiff(access, ber.UW_UPLINK)
+    if uplink == 1:
+        data = bitstream_raw[len(ber.uplink_access):]
+    elif uplink == 0:
+        data = bitstream_raw[len(ber.iridium_access):]
+    else:
+        return
+    if type == "IBC":
+        msgtype = ""
+        if len(data) >= 70 and not uplink:
+            (e1, _, _) = bch_repair1(ber.hdr_poly, data[:6])
+            (o_bc1, o_bc2) = block_de_interleave(data[6:70])
+            (e2, d2, b2) = bch_repair(ber.ringalert_bch_poly, o_bc1[:31])
+            (e3, d3, b3) = bch_repair(ber.ringalert_bch_poly, o_bc2[:31])
+            if e1 >= 0 and e2 >= 0 and e3 >= 0:
+                if ((d2 + b2 + o_bc1[31]).count('1') % 2) == 0:
+                    if ((d3 + b3 + o_bc2[31]).count('1') % 2) == 0:
+                        msgtype = "BC"
+            if e1 < 0 or e2 < 0 or e3 < 0:
+                return
+        if msgtype == "BC":
+            (e, d, bch) = bch_repair1(ber.hdr_poly, data[:6])
+            bit_errors += e
+            ibclen = 131 * 2
+            descrambled = []
+            (blocks, descramble_extra) = ber.slice_extra(data[6:ibclen], 64)
+            for x in blocks:
+                descrambled += block_de_interleave(x)
+            for block in descrambled:
+                parity = block[31:]
+                block = block[:31]
+                (errs, data, bch) = bch_repair(ber.ringalert_bch_poly, block)
+                if errs < 0:
+                    return
+                bit_errors += errs
+                if ((data + bch + parity).count('1') % 2) == 1:
+                    bit_errors += 1
+    return bit_errors, snr, noise, len(bitstream_raw)
+
+def compare_ber(name, lines):
+    legacy = [legacy_calculate_ber(line) for line in lines]
+    current = [ber.calculate_ber(line) for line in lines]
+    mismatches = sum(a != b for a, b in zip(legacy, current))
+    measured = sum(result is not None for result in current)
+    print(f"ber: {name}: {measured} of {len(lines)} lines measured, {mismatches} results differ from the legacy calculation")
+
+def bench_ber(args):
+    # The synthetic bursts come from the same BCH code the tables are built from, so recorded lines are always checked too
+    compare_ber("recorded", read_lines(SAMPLE_BITS))
+    lines = read_lines(args.corpus, args.lines) if args.corpus else synthetic_raw_lines(args.lines)
+    compare_ber(args.corpus or "synthetic", lines)
+    report("ber", timed(legacy_calculate_ber, lines), timed(ber.calculate_ber, lines))
+
+
+def random_block(check, rng, values=()):
+    """
+    Bits of a random valid block for the BCH words of a ber.BlockCheck, unsent bits left out.
+    values optionally holds the data bits of the first words.
+    """
+    block = ["0"] * check.bits
+    for k, (poly, positions, parity) in enumerate(check.words):
+        width = poly.bit_length() - 1
+        value = values[k] if k < len(values) else rng.getrandbits(len(positions) - width)
+        data = value << width
+        word = format(data | nndivide(poly, data), f"0{len(positions)}b")
+        for position, bit in zip(positions, word):
+            if position is not None:
+                block[position] = bit
+        if parity is not None:
+            block[parity] = str(word.count("1") % 2)
+    return "".join(block)
+
+def random_lcw(rng):
+    """
+    Bits of an LCW with a random known frame type, LCW type and code.
+    """
+    lcw_type = rng.choice(list(ber.LCW_CODES))
+    return random_block(ber.LCW, rng, (rng.choice(ber.LCW_FT), lcw_type << 4 | rng.choice(ber.LCW_CODES[lcw_type])))
+
+def synthetic_frame_lines(n, seed=1):
+    """
+    RAW lines of IBC, IRA and traffic channel (LCW) bursts, downlink and uplink, with a few bit errors.
+    """
+    rng = random.Random(seed)
+    fill = format(ber.IRA_FILL, "064b")
+    lines = []
+    for i in range(n):
+        kind = rng.random()
+        access = ber.iridium_access
+        if kind < 0.3:
+            bits = "000000" + "".join(random_block(ber.BLOCK, rng) for _ in range(4))
+        elif kind < 0.55:
+            pages = rng.randrange(1, 4)
+            bits = random_block(ber.IRA_HEAD, rng) + "".join(random_block(ber.BLOCK, rng) for _ in range(pages)) + fill * (11 - pages)
+        else:
+            bits = random_lcw(rng) + "".join(rng.choice("01") for _ in range(266))
+            if kind > 0.85:
+                access = ber.uplink_access
+        bits = list(access + bits)
+        for _ in range(rng.choice((0, 0, 1, 2, 3))):
+            pos = rng.randrange(len(access), len(bits))
+            bits[pos] = "1" if bits[pos] == "0" else "0"
+        bits = "".join(bits)
+        lines.append(f"RAW: i-1740053316-t1 {1000.0 + i:012.4f} 1626299928 N:{rng.uniform(5, 30):.2f}{rng.uniform(-110, -95):+.2f} "
+                     f"I:{i:011d} {rng.randrange(60, 100):3d}% 0.00197 {len(bits) // 2:3d} {bits}")
+    return lines
+
+def bench_frames(args):
+    lines = read_lines(args.corpus, args.lines) if args.corpus else synthetic_frame_lines(args.lines) + read_lines(SAMPLE_BITS)
+    ibc_only = sum(ber.calculate_ber(line) is not None for line in lines)
+    types = {}
+    for line in lines:
+        res = ber.measure_ber(line)
+        if res is not None:
+            types[res[0]] = types.get(res[0], 0) + 1
+    measured = sum(types.values())
+    print(f"frames: {len(lines)} lines, IBC only measures {ibc_only}, all types measure {measured} "
+          f"({', '.join(f'{frame_type} {count}' for frame_type, count in sorted(types.items()))})")
+    after = timed(ber.measure_ber, lines) * measured / len(lines)
+    if not ibc_only:
+        print(f"frames: after {after:,.0f} samples/s")
+        return
+    report("frames", timed(ber.calculate_ber, lines) * ibc_only / len(lines), after, unit="samples/s")
+
+def bench_batch(args):
+    lines = read_lines(args.corpus, args.lines) if args.corpus else synthetic_frame_lines(args.lines) + read_lines(SAMPLE_BITS)
+    batches = [lines[i:i + args.batch] for i in range(0, len(lines), args.batch)]
+    print(f"Measuring {len(lines)} lines in batches of {args.batch}")
+
+    def per_line(batch):
+        return [ber.measure_ber(line) for line in batch]
+
+    for batch in batches:
+        types, bit_errors, checked = ber.batch_measure_ber(batch)[:3]
+        for row, res in enumerate(per_line(batch)):
+            expected = (-1, -1, 0) if res is None else (ber.FRAME_TYPES.index(res[0]), res[1], res[2])
+            assert (types[row], bit_errors[row], checked[row]) == expected
+
+    report("batch", timed(per_line, batches) * args.batch, timed(ber.batch_measure_ber, batches) * args.batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the Iridium pipeline.")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    tokenizer = benchmarks.add_parser("tokenizer", help="Frame tokenizer of pipeline.process_line.")
+    tokenizer.add_argument("--corpus", type=str, help="iridium-toolkit output to tokenize, defaults to frames built from sample_data.")
+    tokenizer.add_argument("--lines", type=int, default=200000, help="Number of lines to tokenize.")
+    tokenizer.set_defaults(run=bench_tokenizer)
+
+    channelize = benchmarks.add_parser("channelize", help="Per-line against batch tokenizing with vectorized channelization.")
+    channelize.add_argument("--corpus", type=str, help="iridium-toolkit output to tokenize, defaults to frames built from sample_data.")
+    channelize.add_argument("--lines", type=int, default=200000, help="Number of lines to tokenize.")
+    channelize.add_argument("--batch", type=int, default=1000, help="Lines per batch, as buffered by the parse stage.")
+    channelize.set_defaults(run=bench_channelize)
+
+    entropy = benchmarks.add_parser("entropy", help="Per-message against batch entropy classification.")
+    entropy.add_argument("--messages", type=int, default=1000, help="Closed messages per batch.")
+    entropy.add_argument("--batches", type=int, default=20, help="Number of batches.")
+    entropy.set_defaults(run=bench_entropy)
+
+    classifiers = benchmarks.add_parser("classifiers", help="Precision, recall and throughput of the encryption classifiers.")
+    classifiers.add_argument("--corpus", type=str, help="Labelled messages (\"enc|plain <hex>\" per line), defaults to a synthetic corpus.")
+    classifiers.add_argument("--messages", type=int, default=20000, help="Size of the synthetic corpus.")
+    classifiers.add_argument("--batch", type=int, default=1000, help="Messages per classifier call.")
+    classifiers.set_defaults(run=bench_classifiers)
+
+    persist = benchmarks.add_parser("persist", help="Statistics flush to SQLite.")
+    persist.add_argument("--flushes", type=int, default=50, help="Number of flushes.")
+    persist.set_defaults(run=bench_persist)
+
+    ber_parser = benchmarks.add_parser("ber", help="Bit error measurement of RAW lines for the PRR statistics.")
+    ber_parser.add_argument("--corpus", type=str, help="gr-iridium output (RAW lines), defaults to synthetic IBC bursts.")
+    ber_parser.add_argument("--lines", type=int, default=50000, help="Number of lines to measure.")
+    ber_parser.set_defaults(run=bench_ber)
+
+    batch = benchmarks.add_parser("batch", help="Per-line against batch BER measurement of RAW lines, as in get_prr.")
+    batch.add_argument("--corpus", type=str, help="gr-iridium output (RAW lines), defaults to synthetic IBC, IRA and LCW bursts.")
+    batch.add_argument("--lines", type=int, default=50000, help="Number of lines to measure.")
+    batch.add_argument("--batch", type=int, default=1000, help="Lines per batch, as buffered by the parse stage.")
+    batch.set_defaults(run=bench_batch)
+
+    frames = benchmarks.add_parser("frames", help="PRR samples of the IBC only BER measurement against all frame types.")
+    frames.add_argument("--corpus", type=str, help="gr-iridium output (RAW lines), defaults to synthetic IBC, IRA and LCW bursts.")
+    frames.add_argument("--lines", type=int, default=50000, help="Number of lines to measure.")
+    frames.set_defaults(run=bench_frames)
+
+    payload = benchmarks.add_parser("payload", help="Payload accumulation and encryption check of reassembled messages.")
+    payload.add_argument("--sessions", type=int, default=20, help="Number of synthetic sessions.")
+    payload.add_argument("--frames", type=int, default=5000, help="Frames per session.")
+    payload.set_defaults(run=bench_payload)
+
+    args = parser.parse_args()
+    args.run(args)
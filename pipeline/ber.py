@@ -5,9 +5,12 @@
 # Slightly editted to fit use case
 
 
-from bch import ndivide, nrepair, bch_repair, bch_repair1
+from array import array
+from bch import nndivide, nrepair1, syndromes
 import re
 
+import numpy as np
+
 iridium_access="001100000011000011110011" # Actually 0x789h in BPSK
 uplink_access= "110011000011110011111100" # BPSK: 0xc4b
 next_access_dl = "110011110011111111111100" # 0xdab
@@ -55,97 +58,568 @@ def slice_extra(string, n):
 def slice(string, n):
     return [string[x:x+n] for x in range(0, len(string),n)]
 
-# Parse a line to recover the number of bits with errors
-# Only gives the number of errors that can be corrected, so the calculation is skewed towards perfect transmissions
-def calculate_ber(line, type="IBC"):
-    p = re.compile(r'(RAW): ([^ ]*) (\S+) (\d+) (?:N:([+-]?\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)|A:(\w+)) [IL]:(\w+) +(\d+)% ([\d.]+|inf|nan) +(\d+) ([\[\]<> 01]+)(.*)')
+# Packed integer BER engine
+# A RAW line is parsed by one precompiled regex and its bits are turned into a single int right away,
+# everything after that (UW check, header, de-interleaving, BCH syndromes) works on ints with lookup tables
+# built once at import, so no bit strings are sliced or concatenated per burst.
+RAW_LINE = re.compile(r'(RAW): ([^ ]*) (\S+) (\d+) (?:N:([+-]?\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)|A:(\w+)) [IL]:(\w+) +(\d+)% ([\d.]+|inf|nan) +(\d+) ([\[\]<> 01]+)(.*)')
+BITSTREAM_JUNK = str.maketrans("", "", "[]<> ")
+NAN = float("nan")
+
+ACCESS_BITS = len(iridium_access)
+DOWNLINK_ACCESS = int(iridium_access, 2)
+UPLINK_ACCESS = int(uplink_access, 2)
+UW_MAX_ERRORS = 3  # Symbol errors tolerated in a differentially decoded unique word
+IBC_HEADER_BITS = 6
+IBC_BLOCK_BITS = 64
+IBC_BITS = 131 * 2  # Max IBC length, their 64 symbol preamble leaves 131 of the 179 symbols of a duplex slot
+MASK64 = (1 << 64) - 1
+
+
+def _dqpsk_table(uw_down, uw_up):
+    """
+    Differential decoding of 3 symbols (6 bits) for each start phase, entry phase << 6 | bits:
+    (end phase, symbol errors against uw_down, symbol errors against uw_up).
+    """
+    imap = [0, 1, 3, 2]
+    table = []
+    for phase in range(4):
+        for bits in range(1 << 6):
+            symbol = phase
+            down = up = 0
+            for x in range(3):
+                symbol = (symbol + imap[bits >> (4 - 2 * x) & 3]) % 4
+                down += symbol != uw_down[x]
+                up += symbol != uw_up[x]
+            table.append((symbol, down, up))
+    return table
+
+# Unique word in chunks of 3 symbols, most significant first, the first chunk starts at phase 0
+UW_TABLES = [_dqpsk_table(UW_DOWNLINK[x:x + 3], UW_UPLINK[x:x + 3]) for x in range(0, 12, 3)]
+# Bit errors repaired in each 6 bit IBC header, -1 if it cannot be repaired
+HEADER_ERRORS = [nrepair1(hdr_poly, format(v, "06b"))[0] for v in range(1 << IBC_HEADER_BITS)]
+
+
+class BlockCheck:
+    """
+    Checks all BCH words of a block of bits in one pass, without taking the block apart.
+    Syndromes and parities are linear in the bits of the block, so they are XORed together from one
+    precomputed table per 16 bits of the block and the syndromes are looked up in the tables of bch.py.
+    words holds (poly, positions, parity) per word: positions are the bits of the codeword in the block,
+    most significant first (None for a bit that is not sent, an erasure whose repair is not counted),
+    parity the bit completing the word to even parity or None.
+    Bit 0 of a block is its first bit, i.e. the most significant bit of the int.
+    """
+
+    def __init__(self, bits, words):
+        self.bits = bits
+        self.words = words
+        self.fields = []  # (shift, syndrome mask, syndrome lookup, parity shift or None, word bit) per word
+        self.repairs = []  # (syndrome shift, syndrome mask, error locations, word shift, word mask) per word
+        self.gathers = None  # Chunk tables packing the codewords of a block, built by the first repair
+        self.batch_tables = None  # Byte tables and numpy lookups for batch_check, built by the first use
+        self.contributions = contributions = [0] * bits  # What a set block bit adds to the packed syndromes and parities
+        shift = 0
+        word_shift = sum(len(positions) for _, positions, _ in words)
+        for i, (poly, positions, parity) in enumerate(words):
+            width = poly.bit_length() - 1
+            word_shift -= len(positions)
+            for k, position in enumerate(positions):
+                if position is not None:
+                    contributions[position] ^= nndivide(poly, 1 << (len(positions) - 1 - k)) << shift
+            locations = [None if entry is None else entry[1] for entry in syndromes[poly]]
+            locations[0] = 0
+            self.repairs.append((shift, (1 << width) - 1, locations, word_shift, (1 << len(positions)) - 1))
+            erased = sum(1 << (len(positions) - 1 - k) for k, position in enumerate(positions) if position is None)
+            lookup = [None if entry is None else (entry[0] - (entry[1] & erased).bit_count(), entry[1].bit_count() & 1)
+                      for entry in syndromes[poly]]
+            lookup[0] = (0, 0)
+            parity_shift = None
+            if parity is not None:
+                parity_shift = shift + width
+                for position in list(positions) + [parity]:
+                    if position is not None:
+                        contributions[position] ^= 1 << parity_shift
+            self.fields.append((shift, (1 << width) - 1, lookup, parity_shift, 1 << i))
+            shift += width + (parity is not None)
+
+        self.chunks = self._tables(contributions, "I" if shift <= 32 else "Q")
+
+    def _tables(self, contributions, typecode):
+        """
+        (shift, table) per 16 bits of the int, least significant first, each table XORing together
+        the contributions of the set bits of its chunk.
+        """
+        chunks = []
+        for low in range(0, self.bits, 16):
+            table = [0]
+            for t in range(16):
+                position = self.bits - 1 - (low + t)
+                contribution = contributions[position] if position >= 0 else 0
+                table += [v ^ contribution for v in table]
+            chunks.append((low, array(typecode, table) if typecode else table))
+        return chunks
+
+    def check(self, block):
+        """
+        Returns (bit errors repaired, mask of the words with bad parity after the repair,
+        mask of the words that cannot be repaired), bit i of a mask standing for word i.
+        """
+        v = 0
+        for shift, table in self.chunks:
+            v ^= table[block >> shift & 0xFFFF]
+        if not v:
+            return 0, 0, 0
+        errors = bad = failed = 0
+        for shift, mask, lookup, parity_shift, word in self.fields:
+            entry = lookup[v >> shift & mask]
+            if entry is None:
+                failed |= word
+                continue
+            errors += entry[0]
+            if parity_shift is not None and (v >> parity_shift ^ entry[1]) & 1:
+                bad |= word
+        return errors, bad, failed
+
+    def repair(self, block):
+        """
+        Repaired codewords of a block as ints, most significant bit first, None for a word that cannot be repaired.
+        Bits that are not sent are taken as 0.
+        """
+        if self.gathers is None:
+            gather = [0] * self.bits  # Where a set block bit goes in the packed codewords
+            positions = [p for _, word_positions, _ in self.words for p in word_positions]
+            for k, position in enumerate(positions):
+                if position is not None:
+                    gather[position] |= 1 << (len(positions) - 1 - k)
+            self.gathers = self._tables(gather, "Q" if len(positions) <= 64 else None)
+        v = packed = 0
+        for (shift, table), (_, gather) in zip(self.chunks, self.gathers):
+            chunk = block >> shift & 0xFFFF
+            v ^= table[chunk]
+            packed |= gather[chunk]
+        repaired = []
+        for shift, mask, locations, word_shift, word_mask in self.repairs:
+            location = locations[v >> shift & mask]
+            repaired.append(None if location is None else (packed >> word_shift & word_mask) ^ location)
+        return repaired
+
+    def _batch_syndromes(self, bits):
+        if self.batch_tables is None:
+            fields = []
+            for (shift, mask, lookup, parity_shift, _), (_, _, locations, _, _) in zip(self.fields, self.repairs):
+                errors = np.array([-1 if entry is None else entry[0] for entry in lookup], dtype=np.int64)
+                parities = np.array([0 if entry is None else entry[1] for entry in lookup], dtype=np.uint64)
+                repairs = np.array([0 if location is None else location for location in locations], dtype=np.uint64)
+                fields.append((shift, mask, errors, parities, parity_shift, repairs))
+            # What every value of every byte of the packed rows adds to the packed syndromes and parities
+            tables = np.zeros(((self.bits + 7) // 8, 256), dtype=np.uint64)
+            for position, contribution in enumerate(self.contributions):
+                byte, bit = divmod(position, 8)
+                tables[byte, np.arange(256) >> (7 - bit) & 1 == 1] ^= np.uint64(contribution)
+            self.batch_tables = tables, fields
+        tables, fields = self.batch_tables
+        packed = np.packbits(bits, axis=1)
+        v = tables[0][packed[:, 0]]
+        for byte in range(1, len(tables)):
+            v ^= tables[byte][packed[:, byte]]
+        return v, fields
+
+    def batch_check(self, bits):
+        """
+        check of every row of an (n, bits) 0/1 matrix. Returns arrays of the bit errors repaired, the number of
+        words with bad parity after the repair and the number of words that cannot be repaired.
+        """
+        v, fields = self._batch_syndromes(bits)
+        errors = np.zeros(len(bits), dtype=np.int64)
+        bad = np.zeros(len(bits), dtype=np.int64)
+        failed = np.zeros(len(bits), dtype=np.int64)
+        for shift, mask, word_errors, parities, parity_shift, _ in fields:
+            syndrome = (v >> shift & mask).astype(np.intp)
+            entry = word_errors[syndrome]
+            repaired = entry >= 0
+            errors += np.where(repaired, entry, 0)
+            failed += ~repaired
+            if parity_shift is not None:
+                bad += repaired & ((v >> parity_shift ^ parities[syndrome]) & 1 == 1)
+        return errors, bad, failed
+
+    def batch_repair(self, bits):
+        """
+        repair of every row of an (n, bits) 0/1 matrix: one uint64 array of repaired codewords per word,
+        whose entries are only meaningful where the word can be repaired.
+        """
+        v, fields = self._batch_syndromes(bits)
+        repaired = []
+        for (poly, positions, _), (shift, mask, _, _, _, locations) in zip(self.words, fields):
+            word = np.zeros(len(bits), dtype=np.uint64)
+            for position in positions:
+                word <<= 1
+                if position is not None:
+                    word |= bits[:, position]
+            repaired.append(word ^ locations[(v >> shift & mask).astype(np.intp)])
+        return repaired
+
+# Source bit of every bit of the two BCH(31,21) + parity words of a 64 bit IBC / IRA block: the symbols run
+# backwards through the odd word, then the even word, in transmitted bit order. This is the inverse of the
+# interleaver gr-iridiumtx builds IBC and IRA blocks with (interleave2). de_interleave also swaps the bits of
+# every symbol: of the 30 page blocks recorded in sample_data 25 decode in this order, only 12 with de_interleave,
+# all of which decode in this order as well.
+BLOCK_ORDER = [i for z in range(15, -1, -1) for i in (4 * z + 2, 4 * z + 3)] + \
+              [i for z in range(15, -1, -1) for i in (4 * z, 4 * z + 1)]
+BLOCK = BlockCheck(IBC_BLOCK_BITS, [
+    (ringalert_bch_poly, BLOCK_ORDER[0:31], BLOCK_ORDER[31]),
+    (ringalert_bch_poly, BLOCK_ORDER[32:63], BLOCK_ORDER[63]),
+])
+
+
+def ibc_errors(data, data_bits):
+    """
+    Bit errors of the IBC after the unique word, None if a block cannot be repaired.
+    Bursts whose header and first block do not check out as IBC count no errors.
+    """
+    header = HEADER_ERRORS[data >> (data_bits - IBC_HEADER_BITS)]
+    if header < 0:
+        return None
+    blocks = (min(data_bits, IBC_BITS) - IBC_HEADER_BITS) // IBC_BLOCK_BITS
+    end = data_bits - IBC_HEADER_BITS
+    bit_errors = header
+    for i in range(blocks):
+        end -= IBC_BLOCK_BITS
+        errors, bad, failed = BLOCK.check(data >> end & MASK64)
+        if failed:
+            return None
+        # The first block decides whether this is an IBC at all
+        if bad and i == 0:
+            return 0
+        bit_errors += errors + bad.bit_count()
+    return bit_errors
+
+# Multi frame type measurement
+# Besides the IBC, ring alerts (IRA) and the link control word (LCW) at the start of every traffic channel burst,
+# downlink and uplink, carry BCH words. All of them are checked on the same packed int, the first type whose
+# identifying words decode is measured. 64 bit blocks are taken apart in BLOCK_ORDER as in calculate_ber.
+IRA_HEAD_BITS = 96  # Three BCH(31,21) + parity words interleaved 3 ways, then 64 bit blocks as in the IBC
+# IRA fill block as transmitted, not a BCH codeword, so it is compared against as a known pattern
+IRA_FILL = int("1001011110101101101100110011111001110100001101010010010001100110", 2)
+FILL_MAX_ERRORS = 8  # Bit errors up to which a block is taken as fill
+# Bit errors repaired in the identifying words up to which a burst is taken as that frame type. Random bits
+# repair into BCH words often, mostly with more errors than that: of random bursts these caps let through
+# about 3e-5 as IBC, 1.2e-4 as IRA and 1.3e-3 as LCW
+IBC_HEAD_MAX_ERRORS = 2  # IBC header and first block
+IRA_HEAD_MAX_ERRORS = 4  # Three IRA head words
+LCW_MAX_ERRORS = 2
+LCW_BITS = 46
+LCW_FT = (0, 1, 2, 3, 6, 7)  # Frame types in the first LCW word
+# Codes of the second LCW word by LCW type (maint, acchl, hndof), the reserved type 3 is not sent
+LCW_CODES = {
+    0: (0, 1, 3, 6, 12, 15),  # sync, switch, maint[2], geoloc, maint[1], <silent>
+    1: (1,),  # acchl
+    2: (3, 12, 15),  # handoff_resp, handoff_cand, <silent>
+}
+# Bit of the LCW after swapping the bits of every symbol, 1 based, in codeword order: 7 bits BCH(7,3),
+# 13 bits BCH(14,6) whose last bit is not sent, 26 bits BCH(26,21)
+LCW_ORDER = [40, 39, 36, 35, 32, 31, 28, 27, 24, 23, 20, 19, 16, 15, 12, 11, 8, 7, 4, 3,
+             41, 38, 37, 34, 33, 30, 29, 26, 25, 22, 21, 18, 17, 14, 13, 10, 9, 6, 5, 2,
+             1, 46, 45, 44, 43, 42]
+
+# Source bit of every bit of the three IRA head words, the transmitted symbols run backwards through
+# the words in turn, the bits of each symbol swapped
+DEINTERLEAVE3_ORDER = [IRA_HEAD_BITS - 1 - (6 * (j // 2) + 2 * w + (1 - j % 2)) for w in range(3) for j in range(32)]
+IRA_HEAD = BlockCheck(IRA_HEAD_BITS, [
+    (ringalert_bch_poly, DEINTERLEAVE3_ORDER[0:31], DEINTERLEAVE3_ORDER[31]),
+    (ringalert_bch_poly, DEINTERLEAVE3_ORDER[32:63], DEINTERLEAVE3_ORDER[63]),
+    (ringalert_bch_poly, DEINTERLEAVE3_ORDER[64:95], DEINTERLEAVE3_ORDER[95]),
+])
+_lcw_positions = [(x - 1) ^ 1 for x in LCW_ORDER]
+LCW = BlockCheck(LCW_BITS, [
+    (29, _lcw_positions[0:7], None),
+    (465, _lcw_positions[7:20] + [None], None),
+    (41, _lcw_positions[20:46], None),
+])
+
+
+def blocks_errors(data, end, blocks, fill=None):
+    """
+    Bit errors of the 64 bit blocks of data that follow the bit end bits above its least
+    significant bit, -1 if one cannot be repaired. Blocks close to fill count their distance to it.
+    """
     bit_errors = 0
+    for _ in range(blocks):
+        end -= IBC_BLOCK_BITS
+        block = data >> end & MASK64
+        if fill is not None:
+            distance = (block ^ fill).bit_count()
+            if distance <= FILL_MAX_ERRORS:
+                bit_errors += distance
+                continue
+        errors, bad, failed = BLOCK.check(block)
+        if failed:
+            return -1
+        bit_errors += errors + bad.bit_count()
+    return bit_errors
+
+def ibc_frame(data, data_bits):
+    """
+    (bit errors, bits checked) of an IBC, errors -1 if a block cannot be repaired.
+    None unless the header and first block decode.
+    """
+    if data_bits < IBC_HEADER_BITS + IBC_BLOCK_BITS:
+        return None
+    header = HEADER_ERRORS[data >> (data_bits - IBC_HEADER_BITS)]
+    if header < 0:
+        return None
+    end = data_bits - IBC_HEADER_BITS - IBC_BLOCK_BITS
+    errors, bad, failed = BLOCK.check(data >> end & MASK64)
+    if failed or bad or header + errors > IBC_HEAD_MAX_ERRORS:
+        return None
+    blocks = (min(data_bits, IBC_BITS) - IBC_HEADER_BITS) // IBC_BLOCK_BITS - 1
+    rest = blocks_errors(data, end, blocks)
+    return -1 if rest < 0 else header + errors + rest, IBC_HEADER_BITS + IBC_BLOCK_BITS * (blocks + 1)
 
-    m=p.match(line)
+def ira_frame(data, data_bits):
+    """
+    (bit errors, bits checked) of an IRA, errors -1 if a block cannot be repaired.
+    None unless the three head words decode.
+    """
+    if data_bits < IRA_HEAD_BITS:
+        return None
+    end = data_bits - IRA_HEAD_BITS
+    errors, bad, failed = IRA_HEAD.check(data >> end)
+    if failed or bad or errors > IRA_HEAD_MAX_ERRORS:
+        return None
+    blocks = end // IBC_BLOCK_BITS
+    rest = blocks_errors(data, end, blocks, IRA_FILL)
+    return -1 if rest < 0 else errors + rest, IRA_HEAD_BITS + IBC_BLOCK_BITS * blocks
+
+def lcw_frame(data, data_bits):
+    """
+    (bit errors, bits checked) of the LCW of a traffic channel burst,
+    None unless its three words decode into a known frame type, LCW type and code.
+    """
+    if data_bits < LCW_BITS:
+        return None
+    lcw = data >> (data_bits - LCW_BITS)
+    errors, bad, failed = LCW.check(lcw)
+    if failed or errors > LCW_MAX_ERRORS:
+        return None
+    lcw1, lcw2, _ = LCW.repair(lcw)
+    if lcw1 >> 4 not in LCW_FT or lcw2 >> 8 & 15 not in LCW_CODES.get(lcw2 >> 12, ()):
+        return None
+    return errors, LCW_BITS
+
+# Frame types tried in turn, by direction
+DOWNLINK_FRAMES = (("IBC", ibc_frame), ("IRA", ira_frame), ("LCW", lcw_frame))
+UPLINK_FRAMES = (("LCW", lcw_frame),)
+
+
+def parse_raw(line):
+    """
+    Parses a RAW line down to its unique word: (SNR, noise, length in bits, data after the unique word as int,
+    data bits, uplink, unique word symbol errors), None if it is no burst.
+    """
+    m = RAW_LINE.match(line)
     if m is None:
-        return
+        return None
     if m.group(5) is not None:
-        snr=float(m.group(5))
-        noise=float(m.group(6))
-    
-    bitstream_raw=(re.sub(r"[\[\]<> ]","",m.group(12)))
-    uplink = -1
-    if(bitstream_raw.startswith(iridium_access)):
-        uplink=0
-    elif(bitstream_raw.startswith(uplink_access)):
-        uplink=1
+        snr = float(m.group(5))
+        noise = float(m.group(6))
     else:
-        if len(bitstream_raw)>=len(iridium_access):
-                access=de_dqpsk(bitstream_raw[:len(iridium_access)])
-                if bitdiff(access, UW_DOWNLINK) < 4:
-                    uplink=0
-                    ec_uw=bitdiff(access,UW_DOWNLINK)
-                    bit_errors += ec_uw
-                elif bitdiff(access, UW_UPLINK) < 4:
-                    uplink=1
-                    ec_uw=bitdiff(access,UW_UPLINK)
-                    bit_errors += ec_uw
-
-    if uplink == 1:
-        data=bitstream_raw[len(uplink_access):]
-    elif uplink == 0:
-        data=bitstream_raw[len(iridium_access):]
-    else:
-        return
-        
-    if type == "IBC":
-        hdrlen=6
-        blocklen=64
-        msgtype=""
-        if len(data)>=70 and not uplink:
-            hdrlen=6
-            blocklen=64
-            (e1,_,_)=bch_repair1(hdr_poly,data[:hdrlen])
-            (o_bc1,o_bc2)=de_interleave(data[hdrlen:hdrlen+blocklen])
-            (e2,d2,b2)=bch_repair(ringalert_bch_poly,o_bc1[:31])
-            (e3,d3,b3)=bch_repair(ringalert_bch_poly,o_bc2[:31])
-            if e1>=0 and e2>=0 and e3>=0:
-                if ((d2+b2+o_bc1[31]).count('1') % 2)==0:
-                    if ((d3+b3+o_bc2[31]).count('1') % 2)==0:
-                        msgtype="BC"
-                        ec_lcw=e1
-
-            if e1 < 0 or e2 < 0 or e3 < 0:
-                return
-
-        if msgtype == "BC":
-            hdrlen=6
-            header=data[:hdrlen]
-            (e,d,bch)=bch_repair1(hdr_poly,header)
-            bit_errors += e
-
-
-            # Duplex slot packets have a maximum length of 179 symbols
-            # but IBC have a 64 sym preamble instead of 16 sym, which reduces
-            # their max len to 131 sym.
-
-            ibclen = 131 * 2
-
-            descrambled=[]
-            (blocks,descramble_extra)=slice_extra(data[hdrlen:ibclen],64)
-            for x in blocks:
-                descrambled+=de_interleave(x)
-            descramble_extra += data[ibclen:]
-
-            poly=ringalert_bch_poly
-
-            for block in descrambled:
-                assert len(block)==32, "unknown BCH block len:%d"%len(block)
-
-                parity=block[31:]
-                block=block[:31]
-
-                (errs,data,bch)=bch_repair(poly, block)
-                if errs < 0:
-                    return
-                bit_errors += errs
-
-                if ((data+bch+parity).count('1') % 2)==1:
-                    bit_errors += 1
-                    errs+=1
-    return bit_errors, snr, noise, len(bitstream_raw)
+        snr = noise = NAN
+
+    bits = m.group(12)
+    # Most bitstreams are plain 0/1, membership tests are cheaper than always translating
+    if " " in bits or "[" in bits or "]" in bits or "<" in bits or ">" in bits:
+        bits = bits.translate(BITSTREAM_JUNK)
+    if len(bits) < ACCESS_BITS:
+        return None
+    value = int(bits, 2)
+    data_bits = len(bits) - ACCESS_BITS
+    access = value >> data_bits
+    data = value & ((1 << data_bits) - 1)
+
+    if access == DOWNLINK_ACCESS:
+        return snr, noise, len(bits), data, data_bits, False, 0
+    if access == UPLINK_ACCESS:
+        return snr, noise, len(bits), data, data_bits, True, 0
+    phase = down = up = 0
+    for shift, table in zip((18, 12, 6, 0), UW_TABLES):
+        phase, chunk_down, chunk_up = table[phase << 6 | access >> shift & 63]
+        down += chunk_down
+        up += chunk_up
+    if down <= UW_MAX_ERRORS:
+        return snr, noise, len(bits), data, data_bits, False, down
+    if up <= UW_MAX_ERRORS:
+        return snr, noise, len(bits), data, data_bits, True, up
+    return None
+
+# Parse a line to recover the number of bits with errors
+# Only gives the number of errors that can be corrected, so the calculation is skewed towards perfect transmissions
+# Returns (bit errors, SNR, noise, length in bits), SNR and noise are NaN for lines without them (A:)
+def calculate_ber(line, type="IBC"):
+    burst = parse_raw(line)
+    if burst is None:
+        return None
+    snr, noise, len_bits, data, data_bits, uplink, bit_errors = burst
+    if type == "IBC" and not uplink and data_bits >= IBC_HEADER_BITS + IBC_BLOCK_BITS:
+        errors = ibc_errors(data, data_bits)
+        if errors is None:
+            return None
+        bit_errors += errors
+    return bit_errors, snr, noise, len_bits
+
+# Measures the bit errors of a RAW line of any frame type in DOWNLINK_FRAMES / UPLINK_FRAMES
+# Returns (frame type, bit errors, bits checked including the unique word, SNR, noise, length in bits),
+# None if no frame type decodes or a block of the frame cannot be repaired
+def measure_ber(line):
+    burst = parse_raw(line)
+    if burst is None:
+        return None
+    snr, noise, len_bits, data, data_bits, uplink, uw_errors = burst
+    for frame_type, frame in (UPLINK_FRAMES if uplink else DOWNLINK_FRAMES):
+        result = frame(data, data_bits)
+        if result is not None:
+            errors, checked = result
+            if errors < 0:
+                return None
+            return frame_type, uw_errors + errors, ACCESS_BITS + checked, snr, noise, len_bits
+    return None
+
+# Batch decoding
+# Bursts share a fixed structure (24 bit UW, then words and 64 bit blocks at fixed offsets), so a flush of them
+# is decoded together as the rows of a uint8 bit matrix in a few vectorized operations
+DQPSK_IMAP = np.array([0, 1, 3, 2], dtype=np.uint8)
+FRAME_TYPES = tuple(frame_type for frame_type, _ in DOWNLINK_FRAMES)  # Frame types of batch_measure_ber by index
+HEADER_ERRORS_ARRAY = np.array(HEADER_ERRORS, dtype=np.int64)
+HEADER_WEIGHTS = 1 << np.arange(IBC_HEADER_BITS - 1, -1, -1)
+IRA_FILL_BITS = np.array([int(bit) for bit in format(IRA_FILL, "064b")], dtype=np.uint8)
+LCW_FT_KNOWN = np.isin(np.arange(8), LCW_FT)
+LCW_CODE_KNOWN = np.array([code & 15 in LCW_CODES.get(code >> 4, ()) for code in range(64)])
+
+
+def batch_bits(bitstreams, width):
+    """
+    (len(bitstreams), width) uint8 matrix of the 0/1 bits of cleaned bitstreams, shorter ones padded with 0,
+    and their lengths.
+    """
+    n = len(bitstreams)
+    lengths = np.fromiter(map(len, bitstreams), dtype=np.int64, count=n)
+    joined = "".join(bitstream[:width].ljust(width, "0") for bitstream in bitstreams)
+    bits = np.frombuffer(joined.encode("ascii"), dtype=np.uint8).reshape(n, width) - ord("0")
+    return bits, lengths
+
+def batch_de_dqpsk(bits):
+    """
+    de_dqpsk of every row of a bit matrix: (n, width // 2) uint8 symbols.
+    """
+    end = bits.shape[1] // 2 * 2
+    symbols = DQPSK_IMAP[bits[:, 0:end:2] * 2 + bits[:, 1:end:2]]
+    # uint8 sums wrap modulo 256, a multiple of 4
+    return np.cumsum(symbols, axis=1, dtype=np.uint8) % 4
+
+def batch_uw_errors(bits):
+    """
+    Symbol errors of the differentially decoded unique word of every row against the downlink and
+    the uplink unique word.
+    """
+    symbols = batch_de_dqpsk(bits[:, :ACCESS_BITS])
+    return (symbols != UW_DOWNLINK).sum(axis=1), (symbols != UW_UPLINK).sum(axis=1)
+
+def batch_blocks_errors(data, start, blocks, fill=None):
+    """
+    blocks_errors of every row of a bit matrix: bit errors of the blocks[i] 64 bit blocks of row i from column start,
+    and whether one of them cannot be repaired.
+    """
+    errors = np.zeros(len(data), dtype=np.int64)
+    failed = np.zeros(len(data), dtype=bool)
+    for k in range(int(blocks.max(initial=0))):
+        rows = np.flatnonzero(blocks > k)
+        block = data[rows, start + k * IBC_BLOCK_BITS:start + (k + 1) * IBC_BLOCK_BITS]
+        block_errors, bad, block_failed = BLOCK.batch_check(block)
+        block_errors += bad
+        if fill is not None:
+            distance = (block != fill).sum(axis=1)
+            is_fill = distance <= FILL_MAX_ERRORS
+            block_errors = np.where(is_fill, distance, block_errors)
+            block_failed = np.where(is_fill, 0, block_failed)
+        errors[rows] += block_errors
+        failed[rows] |= block_failed > 0
+    return errors, failed
+
+def batch_measure_ber(lines):
+    """
+    measure_ber of a list of RAW lines at once. Returns arrays with one entry per line: (frame type as index into
+    FRAME_TYPES, bit errors, bits checked including the unique word, SNR, noise, length in bits),
+    the frame type -1 where measure_ber returns None.
+    """
+    n = len(lines)
+    snr = [NAN] * n
+    noise = [NAN] * n
+    bitstreams = [""] * n
+    for i, line in enumerate(lines):
+        m = RAW_LINE.match(line)
+        if m is None:
+            continue
+        snr_text, noise_text, bits = m.group(5, 6, 12)
+        if snr_text is not None:
+            snr[i] = float(snr_text)
+            noise[i] = float(noise_text)
+        if " " in bits or "[" in bits or "]" in bits or "<" in bits or ">" in bits:
+            bits = bits.translate(BITSTREAM_JUNK)
+        bitstreams[i] = bits
+    snr = np.array(snr)
+    noise = np.array(noise)
+
+    # Wide enough for the IBC and IRA heads of every row, rows are cut by their own length below
+    width = max([ACCESS_BITS + IBC_BITS, ACCESS_BITS + IRA_HEAD_BITS] + [len(bits) for bits in bitstreams])
+    bits, len_bits = batch_bits(bitstreams, width)
+    down, up = batch_uw_errors(bits)
+    burst = len_bits >= ACCESS_BITS
+    downlink = burst & (down <= UW_MAX_ERRORS)
+    uplink = burst & ~downlink & (up <= UW_MAX_ERRORS)
+    uw_errors = np.where(downlink, down, up)
+    data = bits[:, ACCESS_BITS:]
+    data_bits = len_bits - ACCESS_BITS
+
+    types = np.full(n, -1, dtype=np.int64)
+    bit_errors = np.full(n, -1, dtype=np.int64)
+    checked = np.zeros(n, dtype=np.int64)
+    untyped = downlink.copy()  # Downlink rows no frame type claimed yet
+
+    def claim(frame_type, rows, errors, bits_checked, failed):
+        untyped[rows] = False
+        rows, errors, bits_checked = rows[~failed], errors[~failed], bits_checked[~failed]
+        types[rows] = frame_type
+        bit_errors[rows] = uw_errors[rows] + errors
+        checked[rows] = ACCESS_BITS + bits_checked
+
+    # IBC: header and first block
+    rows = np.flatnonzero(untyped & (data_bits >= IBC_HEADER_BITS + IBC_BLOCK_BITS))
+    header = HEADER_ERRORS_ARRAY[data[rows, :IBC_HEADER_BITS] @ HEADER_WEIGHTS]
+    errors, bad, failed = BLOCK.batch_check(data[rows, IBC_HEADER_BITS:IBC_HEADER_BITS + IBC_BLOCK_BITS])
+    ok = (header >= 0) & (bad == 0) & (failed == 0) & (header + errors <= IBC_HEAD_MAX_ERRORS)
+    rows, errors = rows[ok], header[ok] + errors[ok]
+    blocks = (np.minimum(data_bits[rows], IBC_BITS) - IBC_HEADER_BITS) // IBC_BLOCK_BITS
+    rest, failed = batch_blocks_errors(data[rows], IBC_HEADER_BITS + IBC_BLOCK_BITS, blocks - 1)
+    claim(0, rows, errors + rest, IBC_HEADER_BITS + IBC_BLOCK_BITS * blocks, failed)
+
+    # IRA: head words, then pages and fill
+    rows = np.flatnonzero(untyped & (data_bits >= IRA_HEAD_BITS))
+    errors, bad, failed = IRA_HEAD.batch_check(data[rows, :IRA_HEAD_BITS])
+    ok = (bad == 0) & (failed == 0) & (errors <= IRA_HEAD_MAX_ERRORS)
+    rows, errors = rows[ok], errors[ok]
+    blocks = (data_bits[rows] - IRA_HEAD_BITS) // IBC_BLOCK_BITS
+    rest, failed = batch_blocks_errors(data[rows], IRA_HEAD_BITS, blocks, IRA_FILL_BITS)
+    claim(1, rows, errors + rest, IRA_HEAD_BITS + IBC_BLOCK_BITS * blocks, failed)
+
+    # LCW, the only frame type of uplink bursts
+    rows = np.flatnonzero((untyped | uplink) & (data_bits >= LCW_BITS))
+    lcw = data[rows, :LCW_BITS]
+    errors, _, failed = LCW.batch_check(lcw)
+    lcw1, lcw2, _ = LCW.batch_repair(lcw)
+    ok = (failed == 0) & (errors <= LCW_MAX_ERRORS) & LCW_FT_KNOWN[(lcw1 >> 4).astype(np.intp) & 7] & \
+        LCW_CODE_KNOWN[(lcw2 >> 8).astype(np.intp) & 63]
+    rows = rows[ok]
+    claim(2, rows, errors[ok], np.full(len(rows), LCW_BITS), np.zeros(len(rows), dtype=bool))
+
+    return types, bit_errors, checked, snr, noise, len_bits
@@ -0,0 +1,125 @@
+# Encryption classifiers for reassembled messages
+# Every classifier decides for a batch of messages at once and returns a boolean mask, True meaning encrypted
+# Messages shorter than MIN_ENTROPY_BYTES are never judged encrypted
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+import util
+from util import MIN_ENTROPY_BYTES, ENTROPY_THRESHOLD
+
+CHI_SQUARE_SIGMAS = 4  # Max deviation of the chi-square statistic from its mean under uniform bytes, in standard deviations
+ZLIB_RATIO = 0.95  # Min compressed/original size of encrypted data
+ZLIB_LEVEL = 1
+BYTE_PAIR_RATIO = 0.93  # Min byte pair entropy relative to the maximum possible for the message length
+
+
+class Classifier(ABC):
+    """
+    classify(payloads, counts=None) returns a boolean mask with one entry per payload.
+    Classifiers with histogram set only look at byte histograms: counts may then hold a (n, 256) histogram
+    of earlier bytes of each message and payloads just the bytes not counted yet.
+    The others need the complete payloads and get no counts.
+    """
+    name = None
+    histogram = False
+
+    @abstractmethod
+    def classify(self, payloads, counts=None):
+        pass
+
+
+class EntropyClassifier(Classifier):
+    """
+    Shannon entropy of the bytes above a threshold in bits per byte.
+    """
+    name = "entropy"
+    histogram = True
+
+    def __init__(self, threshold=ENTROPY_THRESHOLD):
+        self.threshold = threshold
+
+    def classify(self, payloads, counts=None):
+        if not payloads:
+            return np.zeros(0, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            return util.batch_entropy(payloads, counts) > self.threshold
+
+
+class ChiSquareClassifier(Classifier):
+    """
+    Chi-square test of the byte histogram against uniform bytes, which encrypted data should pass.
+    """
+    name = "chi-square"
+    histogram = True
+
+    def __init__(self, sigmas=CHI_SQUARE_SIGMAS):
+        # Under uniform bytes the statistic has mean 255 and variance 2 * 255
+        self.limit = 255 + sigmas * np.sqrt(2 * 255)
+
+    def classify(self, payloads, counts=None):
+        if not payloads:
+            return np.zeros(0, dtype=bool)
+        hist = util.batch_histograms(payloads, counts).astype(np.float64)
+        totals = hist.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = totals / 256
+            chi2 = (hist * hist).sum(axis=1) / expected - totals
+        return (chi2 < self.limit) & (totals >= MIN_ENTROPY_BYTES)
+
+
+class ZlibClassifier(Classifier):
+    """
+    Encrypted data does not compress: zlib output at least ZLIB_RATIO of the input size.
+    """
+    name = "zlib"
+
+    def __init__(self, ratio=ZLIB_RATIO, level=ZLIB_LEVEL):
+        self.ratio = ratio
+        self.level = level
+
+    def classify(self, payloads, counts=None):
+        return np.array([
+            len(payload) >= MIN_ENTROPY_BYTES and len(zlib.compress(payload, self.level)) >= self.ratio * len(payload)
+            for payload in payloads
+        ], dtype=bool)
+
+
+class BytePairClassifier(Classifier):
+    """
+    Entropy of overlapping byte pairs, relative to the most a message of that length can reach.
+    Catches structure that a byte histogram misses, e.g. text in a shuffled alphabet.
+    """
+    name = "byte-pair"
+
+    def __init__(self, ratio=BYTE_PAIR_RATIO):
+        self.ratio = ratio
+
+    def classify(self, payloads, counts=None):
+        n = len(payloads)
+        if not n:
+            return np.zeros(0, dtype=bool)
+        lengths = np.fromiter((len(payload) for payload in payloads), dtype=np.int64, count=n)
+        data = np.frombuffer(b"".join(payloads), dtype=np.uint8).astype(np.int64)
+        owner = np.repeat(np.arange(n, dtype=np.int64), lengths)
+
+        # Pairs of neighbouring bytes, without the pairs that span two messages
+        same = owner[1:] == owner[:-1]
+        keys = (owner[1:] << 16 | data[:-1] << 8 | data[1:])[same]
+        unique, pair_counts = np.unique(keys, return_counts=True)
+        c = pair_counts.astype(np.float64)
+        sums = np.bincount(unique >> 16, weights=c * np.log2(c), minlength=n)
+
+        pairs = np.maximum(lengths - 1, 1).astype(np.float64)
+        entropy = np.log2(pairs) - sums / pairs
+        return (entropy >= self.ratio * np.minimum(16.0, np.log2(pairs))) & (lengths >= MIN_ENTROPY_BYTES)
+
+
+CLASSIFIERS = {cls.name: cls for cls in (EntropyClassifier, ChiSquareClassifier, ZlibClassifier, BytePairClassifier)}
+
+def get_classifier(name, **kwargs):
+    try:
+        return CLASSIFIERS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown classifier: {name}, choose from {', '.join(CLASSIFIERS)}")
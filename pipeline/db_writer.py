@@ -0,0 +1,111 @@
+# Background database writer for the pipeline
+# Ingestion only computes what changed and queues it, a dedicated thread merges whatever is pending into one
+# transaction, so an fsync stall or a reader holding the database lock never blocks the capture
+import queue
+import sqlite3
+import threading
+import time
+
+RETRY_DELAY = 0.05  # Seconds before the first retry of a write that found the database locked
+MAX_RETRY_DELAY = 2.0  # Retries back off up to this delay
+
+_STOP = object()
+
+
+class DbWriter:
+    """
+    Calls write(changes) in a dedicated thread for the changes queued with put().
+    Changes that queue up while a write is running or retried are combined with merge(pending, changes)
+    and written together. A write that fails with "database is locked" is retried with backoff,
+    merging newly queued changes in between. Tracks queue depth, write latency and retries.
+    """
+
+    def __init__(self, name, write, merge):
+        self.name = name
+        self.write = write
+        self.merge = merge
+        # Unbounded on purpose: put() must never block ingestion and pending changes are merged on every pass
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        self.writes = 0
+        self.merged = 0
+        self.retries = 0
+        self.failed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, changes):
+        if changes:
+            self.queue.put(changes)
+
+    def stop(self, timeout=None):
+        """
+        Writes everything still queued and waits for the thread.
+        """
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    def _drain(self, changes):
+        # Merges everything queued right now into changes, returns whether stop was requested
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return changes, False
+            if item is _STOP:
+                return changes, True
+            changes = item if changes is None else self.merge(changes, item)
+            self.merged += 1
+
+    def _write(self, changes):
+        stop = False
+        delay = RETRY_DELAY
+        while True:
+            t0 = time.monotonic()
+            try:
+                self.write(changes)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    print(f"Error in {self.name}: {e}")
+                    self.failed += 1
+                    return stop
+                self.retries += 1
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                changes, stopped = self._drain(changes)
+                stop = stop or stopped
+                continue
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+                self.failed += 1
+                return stop
+            self.last_latency = time.monotonic() - t0
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.total_latency += self.last_latency
+            self.writes += 1
+            return stop
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            changes, stop = self._drain(item)
+            # A stop request seen while retrying is written with the merged changes
+            if self._write(changes) or stop:
+                return
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def report(self):
+        avg = self.total_latency / self.writes if self.writes else 0.0
+        return (f"{self.name}: depth {self.depth()}, writes {self.writes}, merged {self.merged}, "
+                f"retries {self.retries}, failed {self.failed}, latency last {self.last_latency * 1000:.1f} ms / "
+                f"avg {avg * 1000:.1f} ms / max {self.max_latency * 1000:.1f} ms")
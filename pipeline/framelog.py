@@ -0,0 +1,96 @@
+# Append-only binary log of every frame the pipeline sees
+# Records are fixed size numpy structured records, so analysis scripts can np.memmap the whole log
+# and aggregate hundreds of millions of frames without parsing text:
+#   log = framelog.read_log("frames.log")
+#   raw = log[log["type"] == framelog.type_code("RAW")]
+import os
+
+import numpy as np
+
+MAGIC = b"IRIDIUM-FRAMES1\n"  # File header, 16 bytes so the records stay aligned
+FRAME_BLOCK = 65536  # Records buffered before they are written as one block
+
+FRAME_DTYPE = np.dtype([
+    ("time", "<f8"),  # Seconds since the epoch
+    ("channel", "<i2"),  # Channel index, see pipeline.channel_map
+    ("type", "u1"),  # Index in FRAME_TYPES
+    ("encrypted", "i1"),  # 1/0 on the record of a reassembled message, -1 on frame records
+    ("snr", "<f4"),  # dB, NaN if unknown
+    ("noise", "<f4"),  # dBFS, NaN if unknown
+    ("length", "<i4"),  # Bits for frames (bits checked for bit errors on RAW frames), bytes for reassembled messages
+    ("bit_errors", "<i4"),  # Corrected bit errors of RAW frames, -1 if unknown
+])
+
+# Append only, codes of existing types must never change
+FRAME_TYPES = ["IBC", "IDA", "IIP", "IIQ", "IIU", "IIR", "IMS", "IRA", "IRI", "ISY", "ITL", "IU3", "I36", "I38",
+               "MSG", "VDA", "VO6", "VOC", "VOD", "MS3", "VOZ", "IAQ", "NXT", "RAW", "UNK"]
+TYPE_CODES = {frame_type: code for code, frame_type in enumerate(FRAME_TYPES)}
+
+
+def type_code(frame_type):
+    return TYPE_CODES.get(frame_type, TYPE_CODES["UNK"])
+
+
+class FrameLog:
+    """
+    Appends records to a frame log, buffering them into blocks of FRAME_BLOCK records.
+    A new file gets the header, an existing one is appended to.
+    """
+
+    def __init__(self, path, block=FRAME_BLOCK):
+        self.path = path
+        self.block = block
+        self.pending = []
+        self.buffered = 0
+        self.written = 0
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new:
+            self.file.write(MAGIC)
+        else:
+            # Drop a record cut short by a crash, so the records stay aligned
+            size = os.path.getsize(path) - len(MAGIC)
+            if size % FRAME_DTYPE.itemsize:
+                self.file.truncate(len(MAGIC) + size - size % FRAME_DTYPE.itemsize)
+
+    def append(self, records):
+        """
+        Adds a FRAME_DTYPE array.
+        """
+        if not len(records):
+            return
+        self.pending.append(records)
+        self.buffered += len(records)
+        if self.buffered >= self.block:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(np.concatenate(self.pending).tobytes())
+            self.file.flush()
+            self.written += self.buffered
+            self.pending = []
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def records(rows):
+    """
+    FRAME_DTYPE array from (time, channel, type, encrypted, snr, noise, length, bit_errors) tuples.
+    """
+    return np.array(rows, dtype=FRAME_DTYPE)
+
+def read_log(path):
+    """
+    Memory maps a frame log read-only, ignoring a record that is still being written.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a frame log")
+    count = (os.path.getsize(path) - len(MAGIC)) // FRAME_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=FRAME_DTYPE)
+    return np.memmap(path, dtype=FRAME_DTYPE, mode="r", offset=len(MAGIC), shape=(count,))
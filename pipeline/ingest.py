@@ -0,0 +1,92 @@
+# Reading of recorded gr-iridium (.bits) and iridium-toolkit (parsed) output for offline processing
+# Files are split into chunks at line boundaries so the chunks can be processed in parallel
+import gzip
+import itertools
+import lzma
+import os
+
+CHUNK_BYTES = 16 * 1024 * 1024  # Chunk size for uncompressed files
+CHUNK_LINES = 100000  # Chunk size for compressed files, which can only be read sequentially
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def compression(path):
+    """
+    Returns "gzip", "xz" or None based on the magic bytes of the file.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(XZ_MAGIC):
+        return "xz"
+    return None
+
+def open_text(path):
+    kind = compression(path)
+    if kind == "gzip":
+        return gzip.open(path, "rt", errors="replace")
+    if kind == "xz":
+        return lzma.open(path, "rt", errors="replace")
+    return open(path, "r", errors="replace")
+
+def range_chunks(path, chunk_bytes=CHUNK_BYTES, start=0):
+    """
+    Splits an uncompressed file from start on into (start, end) byte ranges that begin and end on line boundaries.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return []
+    bounds = [start]
+    with open(path, "rb") as f:
+        while bounds[-1] + chunk_bytes < size:
+            f.seek(bounds[-1] + chunk_bytes)
+            f.readline()  # Move to the start of the next line
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def plan_chunks(paths, chunk_bytes=CHUNK_BYTES, chunk_lines=CHUNK_LINES, offsets=None):
+    """
+    Yields the chunks of all files in order.
+    Uncompressed files give ("range", path, start, end) tasks which workers read themselves,
+    compressed files are decompressed here and give ("lines", path, lines) tasks.
+    offsets maps paths to the position to resume from: a byte offset on a line boundary for uncompressed files,
+    the number of lines already processed for compressed ones.
+    """
+    offsets = offsets or {}
+    for path in paths:
+        offset = offsets.get(path, 0)
+        if compression(path) is None:
+            for start, end in range_chunks(path, chunk_bytes, offset):
+                yield ("range", path, start, end)
+            continue
+
+        lines = []
+        with open_text(path) as f:
+            for line in itertools.islice(f, offset, None):
+                lines.append(line)
+                if len(lines) >= chunk_lines:
+                    yield ("lines", path, lines)
+                    lines = []
+        if lines:
+            yield ("lines", path, lines)
+
+def read_chunk(task):
+    """
+    Returns the non-empty lines of a chunk planned by plan_chunks.
+    """
+    if task[0] == "range":
+        _, path, start, end = task
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+        lines = data.decode("utf-8", errors="replace").splitlines()
+    else:
+        lines = task[2]
+    return [line.strip() for line in lines if line.strip()]
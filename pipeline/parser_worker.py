@@ -0,0 +1,151 @@
+# Long-lived iridium-parser process for the pipeline
+# Lines are written to the parser stdin one per line and parsed frames are collected from its stdout,
+# so the interpreter startup and import cost of iridium-toolkit is only paid once per run
+import os
+import queue
+import subprocess
+import threading
+
+PARSER_CMD = ["iridium-parser.py", "--harder", "--uw-ec"]
+MAX_RESTARTS = 10  # Give up after this many parser crashes
+
+
+class ParserWorker:
+    """
+    Wraps a single iridium-parser process fed over stdin/stdout.
+    Input is framed per line, every parsed frame comes back as one output line.
+    The parser is restarted if it exits while the pipeline is still running.
+    """
+
+    def __init__(self, cmd=None, debug=False, max_restarts=MAX_RESTARTS):
+        self.cmd = cmd or PARSER_CMD
+        self.debug = debug
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.process = None
+        self.output = queue.Queue()
+        self._readers = []
+
+    def start(self):
+        """
+        Starts the parser process and the threads draining its stdout and stderr.
+        """
+        # iridium-parser is a python script, without this it block buffers its stdout when piped
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=env
+        )
+        if self.debug: print("iridium-parser PID: ", self.process.pid)
+
+        self._readers = [
+            threading.Thread(target=self._read_stdout, args=(self.process,), daemon=True),
+            threading.Thread(target=self._read_stderr, args=(self.process,), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _read_stdout(self, process):
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                self.output.put(line)
+
+    def _read_stderr(self, process):
+        for line in process.stderr:
+            line = line.strip()
+            if not line:
+                continue
+            if "Warning" in line:
+                if self.debug: print("Warning from iridium-toolkit:", line)
+            else:
+                print("Error from iridium-toolkit:", line)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def restart(self):
+        """
+        Replaces a dead parser process with a fresh one.
+        Returns False once the restart budget is used up.
+        """
+        if self.restarts >= self.max_restarts:
+            print(f"iridium-parser crashed {self.restarts} times, not restarting.")
+            return False
+        self.restarts += 1
+        returncode = self.process.poll() if self.process else None
+        print(f"iridium-parser exited with code {returncode}, restarting ({self.restarts}/{self.max_restarts})...")
+        self._join_readers()
+        self.start()
+        return True
+
+    def send(self, line):
+        """
+        Feeds a single line to the parser, restarting it if it has died.
+        """
+        line = line.replace("\n", " ").strip()
+        if not line:
+            return True
+        for _ in range(2):
+            if not self.alive() and not self.restart():
+                return False
+            try:
+                self.process.stdin.write(line + "\n")
+                return True
+            except (BrokenPipeError, OSError):
+                # The parser died between the liveness check and the write, retry once on a new process
+                continue
+        return False
+
+    def send_lines(self, lines):
+        for line in lines:
+            if not self.send(line):
+                return False
+        return True
+
+    def flush(self):
+        if self.alive():
+            try:
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def read(self):
+        """
+        Returns all parsed lines received so far without blocking.
+        """
+        lines = []
+        while True:
+            try:
+                lines.append(self.output.get_nowait())
+            except queue.Empty:
+                return lines
+
+    def _join_readers(self, timeout=None):
+        for reader in self._readers:
+            reader.join(timeout)
+        self._readers = []
+
+    def close(self, timeout=None):
+        """
+        Closes the parser stdin, waits for it to finish and returns the remaining parsed lines.
+        """
+        if self.process is None:
+            return self.read()
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print("iridium-parser did not exit in time, killing it.")
+            self.process.kill()
+            self.process.wait()
+        self._join_readers()
+        return self.read()
@@ -6,384 +6,1012 @@ import subprocess
 import argparse
 import re
 import util
+import ingest
+import framelog
 import sqlite3
+import json
 import sys
 import select
-from ber import calculate_ber
+import signal
+import asyncio
+import threading
+import time
+import queue
+import os
+import multiprocessing as mp
+from collections import deque
+from ber import batch_measure_ber, FRAME_TYPES
+from parser_worker import ParserWorker
+from stages import Stage, Batcher
+from shards import ShardPool, MP_START_METHOD
+from async_runner import AsyncSource, run_sources, EXTRACTOR_CMD
+from db_writer import DbWriter
+from classifiers import CLASSIFIERS, get_classifier
+from reassembly import Reassembler, dump_checkpoint, IDLE_TIMEOUT, MAX_MESSAGE_BYTES, MAX_OPEN_BYTES, OVERFLOW_POLICIES, REORDER_WINDOW
 import numpy as np
 
-BUFFER_SIZE = 1000  # Number of lines to buffer before processing
+BUFFER_SIZE = 1000  # Max number of lines to buffer before processing
+FLUSH_BYTES = 512 * 1024  # Max size of the buffered lines before processing
+FLUSH_AGE_MS = 5000  # Max time a line waits in the buffer before processing
+REPORT_INTERVAL = 10  # Seconds between stage queue reports in debug mode
+MERGE_INTERVAL = 5  # Seconds between counter merges from shard workers
+
+DB_PATH = "iridium_metadata.db"
+SERIES_WINDOW = 60  # Seconds per row of the time series tables, rolled up into hours and days as they age
+ROLLUP_AFTER = {60: (3600, 2 * 86400), 3600: (86400, 60 * 86400)}  # Window length: (rolled up length, age in seconds)
+ROLLUP_INTERVAL = 3600  # Seconds between rollups during a capture
+SERIES_TABLES = {  # Time series table: (key column, columns summed per window and key)
+    "type_series": ("type", ("count", "enc", "total")),
+    "prr_series": ("snr", ("prr_sum", "count")),
+    "channel_series": ("channel", ("count",)),
+}
+DB_BUSY_TIMEOUT = 0.5  # Seconds a write waits for a locked database before DbWriter retries it
+DB_SYNCHRONOUS = "NORMAL"  # With WAL a commit only waits for the log write, a power loss can lose the last flushes but not corrupt the database
+CHECKPOINT_INTERVAL = 60  # Seconds between checkpoints of the open messages, see PipelineState.take_checkpoint
+BACKPRESSURE_WAIT = 10  # Max seconds the parse stage holds back its input while the open messages are over the watermark
 
 lcw_types = ["IIP", "IIQ", "IIU", "IIR", "IDA", "MSG", "VDA", "VO6", "VOC", "VOD", "MS3", "VOZ", "NXT"]
-total_type_counts = {lcw_type: {"enc":0, "total": 0} for lcw_type in lcw_types}
-
-
-all_types = {
-        "total": 0,
-        "IBC": 0,
-        "IDA": 0,
-        "IIP": 0,
-        "IIQ": 0,
-        "IIR": 0,
-        "IIU": 0,
-        "IMS": 0,
-        "IRA": 0,
-        "IRI": 0,
-        "ISY": 0,
-        "ITL": 0,
-        "IU3": 0,
-        "I36": 0,
-        "I38": 0,
-        "MSG": 0,
-        "VDA": 0,
-        "VO6": 0,
-        "VOC": 0,
-        "VOD": 0,
-        "MS3": 0,
-        "VOZ": 0,
-        "IAQ": 0,
-        "NXT": 0,
-        "RAW": 0
-    }
 
-channel_map = [f"{i}.{j}" for i in range(1, 40) for j in range(1, 9)]
+frame_types = ["total", "IBC", "IDA", "IIP", "IIQ", "IIR", "IIU", "IMS", "IRA", "IRI", "ISY", "ITL", "IU3",
+               "I36", "I38", "MSG", "VDA", "VO6", "VOC", "VOD", "MS3", "VOZ", "IAQ", "NXT", "RAW"]
 
-channels_buf = [[] for _ in channel_map]
+channel_map = [f"{i}.{j}" for i in range(1, 40) for j in range(1, 9)]
 
 GRANULARITY = 1000
-prr_buf = np.array([0.0 for _ in range(0,GRANULARITY)])
-prr_count_frames = np.array([0 for _ in range(0,GRANULARITY)])
-
-def init_db():
-    """
-    Initializes the SQLite database for storing Iridium metadata.
-    """
-    conn = sqlite3.connect('iridium_metadata.db')
-    cursor = conn.cursor()
-    
-    # Create a table for storing Iridium metadata
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS all_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT,
-            count INTEGER
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS encryption_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT,
-            enc INTEGER,
-            total INTEGER
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS prr_stats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            prr_sum REAL,
-            count INTEGER
-        )
-    ''')
-
-    # if data already exists take the data out of database
-    cursor.execute('SELECT type, count FROM all_stats')
-    rows = cursor.fetchall()
-    if rows:
-        for row in rows:
-            lcw_type, count = row
-            if lcw_type in all_types:
-                all_types[lcw_type] = count
-            else:
-                print(f"Unknown LCW type in database: {lcw_type}")
-    else:
-        # Initialize all_stats table with all LCW types
-        for lcw_type in all_types.keys():
-            cursor.execute('''
-                INSERT INTO all_stats (type, count) VALUES (?, ?)
-            ''', (lcw_type, 0))
-    
-    cursor.execute('SELECT type, enc, total FROM encryption_stats')
-    rows = cursor.fetchall()
-    if rows:
-        for row in rows:
-            lcw_type, enc, total = row
-            if lcw_type in total_type_counts:
-                total_type_counts[lcw_type] = {"enc": enc, "total": total}
-            else:
-                print(f"Unknown LCW type in encryption stats: {lcw_type}")
-    else:
-        # Initialize encryption_stats table with all LCW types
-        for lcw_type in lcw_types:
-            cursor.execute('''
-                INSERT INTO encryption_stats (type, enc, total) VALUES (?, ?, ?)
-            ''', (lcw_type, 0, 0))
-
-    cursor.execute('SELECT prr_sum, count FROM prr_stats')
-    rows = cursor.fetchall()
-    if rows:
-        for idx, row in enumerate(rows):
-            prr_sum, count = row
-            prr_buf[idx] = prr_sum
-            prr_count_frames[idx] = count
-    else:
-        # Initialize prr_stats table
-        for _ in range(GRANULARITY):
-            cursor.execute('''
-                INSERT INTO prr_stats (prr_sum, count) VALUES (?, ?)
-            ''', (0.0, 0))
-        
-    conn.commit()
-    conn.close()
+NAN = float("nan")
 
-def update_db():
+
+class PipelineState:
     """
-    Updates the SQLite database with the current statistics.
+    Counters, reassembly buffers and database of one receiver.
+    Several states can live in one process, e.g. one per SDR, each persisting to its own database.
     """
-    conn = sqlite3.connect('iridium_metadata.db')
-    cursor = conn.cursor()
-    
-    # Update all_stats table
-    for lcw_type, counts in all_types.items():
+
+    def __init__(self, db_path=DB_PATH, reassembly=None, classifier="entropy", log_frames=False):
+        self.db_path = db_path
+        self.reassembly = reassembly or {}  # Reassembler arguments, handed on to worker processes
+        self.classifier = get_classifier(classifier)
+        if classifier != "entropy" and self.reassembly.get("early_decision"):
+            # The early decision is taken on the running entropy
+            print(f"Early decision is only available with the entropy classifier, ignored for {classifier}.")
+            self.reassembly = dict(self.reassembly, early_decision=None)
+
+        # Counters are updated by the parse and PRR stages, changes are taken from them for the DbWriter
+        self.lock = threading.Lock()
+
+        self.total_type_counts = {lcw_type: {"enc":0, "total": 0} for lcw_type in lcw_types}
+        self.all_types = {frame_type: 0 for frame_type in frame_types}
+        self.reassembler = Reassembler(**self.reassembly)
+        self.prr_buf = np.zeros(GRANULARITY)
+        self.prr_count_frames = np.zeros(GRANULARITY, dtype=np.int64)
+        self.channel_counts = np.zeros(len(channel_map), dtype=np.int64)  # Frames per channel, summing up to all_types["total"]
+        # Time series deltas not taken yet, bucketed by the time of the frames rather than of the flush:
+        # (window number, frame type, channel): frames, and per series table (window start, key): counts
+        self.frame_series = {}
+        self.pending_series = {table: {} for table in SERIES_TABLES}
+
+        # One connection for the whole run and the counters as last written, to only write rows that changed
+        self.conn = None
+        self.saved = None
+        self.last_rollup = time.time()
+
+        # Checkpoint entries are written in the same transaction as the counters, so a restart resumes where they stopped
+        self.pending_checkpoint = {}
+        self.saved_open = []  # Ids of the open messages as last written
+        self.last_checkpoint = time.monotonic()
+
+        # Frame log records, written to frame_log if this state owns one, otherwise handed on with take_stats()
+        self.log_frames = log_frames
+        self.frame_rows = []
+        self.frame_log = None
+
+    def open_frame_log(self, path):
+        self.frame_log = framelog.FrameLog(path)
+        self.log_frames = True
+
+    def flush_frames(self):
+        if self.frame_log is not None and self.frame_rows:
+            self.frame_log.append(framelog.records(self.frame_rows))
+            self.frame_rows = []
+
+    def connect(self):
+        if self.conn is None:
+            # Writes run in the DbWriter thread, a short busy timeout lets it retry and merge instead of waiting
+            self.conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        return self.conn
+
+    def close_db(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.frame_log is not None:
+            self.frame_log.close()
+            self.frame_log = None
+
+    def snapshot(self):
+        return {
+            "all_types": dict(self.all_types),
+            "total_type_counts": {lcw_type: dict(counts) for lcw_type, counts in self.total_type_counts.items()},
+            "prr_buf": self.prr_buf.copy(),
+            "prr_count_frames": self.prr_count_frames.copy(),
+            "channel_counts": self.channel_counts.copy(),
+        }
+
+    def init_db(self):
+        """
+        Initializes the SQLite database for storing Iridium metadata.
+        """
+        conn = self.connect()
+        cursor = conn.cursor()
+
+        # Create a table for storing Iridium metadata
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS all_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                count INTEGER
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS encryption_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                enc INTEGER,
+                total INTEGER
+            )
+        ''')
+
         cursor.execute('''
-            UPDATE all_stats SET count = ? WHERE type = ?
-        ''', (counts, lcw_type))
+            CREATE TABLE IF NOT EXISTS prr_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prr_sum REAL,
+                count INTEGER
+            )
+        ''')
+
+        # Time series with one row per window and key, every flush adds to the rows of the windows its frames fall in:
+        # frame type counts, PRR per SNR and frames per channel
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS type_series (
+                window_start INTEGER,
+                window_length INTEGER,
+                type TEXT,
+                count INTEGER,
+                enc INTEGER,
+                total INTEGER
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prr_series (
+                window_start INTEGER,
+                window_length INTEGER,
+                snr INTEGER,
+                prr_sum REAL,
+                count INTEGER
+            )
+        ''')
+
 
-    # Update encryption_stats table
-    for lcw_type, counts in total_type_counts.items():
         cursor.execute('''
-            UPDATE encryption_stats
-            SET enc = ?, total =  ?
-            WHERE type = ?
-        ''', (counts["enc"], counts["total"], lcw_type)) 
-
-    # Update prr_stats table
-    for idx in range(GRANULARITY):
-        prr_val = prr_buf[idx]
-        prr_count = prr_count_frames[idx]
+            CREATE TABLE IF NOT EXISTS channel_series (
+                window_start INTEGER,
+                window_length INTEGER,
+                channel INTEGER,
+                count INTEGER
+            )
+        ''')
+        # One row per window and key, flushes add to it with series_upsert()
+        for table, (key, _) in SERIES_TABLES.items():
+            cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_key ON {table} (window_start, window_length, {key})')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_stats (
+                channel INTEGER PRIMARY KEY,
+                name TEXT,
+                count INTEGER
+            )
+        ''')
+
+        # Resume state: open messages and positions in offline input files, see take_checkpoint()
         cursor.execute('''
-            UPDATE prr_stats
-            SET prr_sum = ?, count = ?
-            WHERE id = ?
-        ''', (float(prr_val), int(prr_count), idx + 1))
-    
-
-    conn.commit()
-    conn.close()
-
-
-def reconstruct_packets():
-    global channels_buf
-    reconstructed_data = []
-    # Reconstructs a packet from the frames - given heuristic - same channel, at most 10 seconds apart, same frame type
-    # Reconstruct messages from the buffered data
-    for channel_buf in channels_buf:
-        msg = {"type": "","data": ""}
-        for idx, line in enumerate(channel_buf):
-                
-            if line["time"] > channel_buf[idx-1]["time"] + 10:
-                # print(line["time"], channel_buf[idx-1]["time"])
-                if msg["data"] and len(msg["data"]) > 256: #124:
-                    reconstructed_data.append(msg)
-                msg = {"type": "","data": ""}
-                continue
-            
-            if line["data"] and (msg["type"] == "" or msg["type"] == line["type"]):
-                msg["type"] = line["type"]
-                msg["data"] += line["data"]
-                # print(len(msg["data"]))
-
-        if msg["data"] and len(msg["data"]) > 256: # 124:
-            reconstructed_data.append(msg) 
-    
-    
-    channels_buf = [[] for _ in channel_map]  # Clear the buffer for the next round
-    
-    # check if reconstructed data is encrypted
-    for msg in reconstructed_data:
-        if msg["type"] in total_type_counts:
-            total_type_counts[msg["type"]]["total"] += 1
-            if util.is_hex_encrypted(msg["data"]):
-                total_type_counts[msg["type"]]["enc"] += 1
+            CREATE TABLE IF NOT EXISTS checkpoint (
+                key TEXT PRIMARY KEY,
+                value BLOB
+            )
+        ''')
+
+        # if data already exists take the data out of database
+        cursor.execute('SELECT type, count FROM all_stats')
+        rows = cursor.fetchall()
+        if rows:
+            for row in rows:
+                lcw_type, count = row
+                if lcw_type in self.all_types:
+                    self.all_types[lcw_type] = count
+                else:
+                    print(f"Unknown LCW type in database: {lcw_type}")
         else:
-            print(f"Unknown message type: {msg['type']}")
+            # Initialize all_stats table with all LCW types
+            for lcw_type in self.all_types.keys():
+                cursor.execute('''
+                    INSERT INTO all_stats (type, count) VALUES (?, ?)
+                ''', (lcw_type, 0))
 
-    reconstructed_data.clear()  # Clear the reconstructed data for the next round
+        cursor.execute('SELECT type, enc, total FROM encryption_stats')
+        rows = cursor.fetchall()
+        if rows:
+            for row in rows:
+                lcw_type, enc, total = row
+                if lcw_type in self.total_type_counts:
+                    self.total_type_counts[lcw_type] = {"enc": enc, "total": total}
+                else:
+                    print(f"Unknown LCW type in encryption stats: {lcw_type}")
+        else:
+            # Initialize encryption_stats table with all LCW types
+            for lcw_type in lcw_types:
+                cursor.execute('''
+                    INSERT INTO encryption_stats (type, enc, total) VALUES (?, ?, ?)
+                ''', (lcw_type, 0, 0))
 
-def process_line(line):
-    """
-    Processes a line of data, extracts frequency and timestamp, and groups it.
-    """
-    try:
-        parts = line.strip().split()
-        if len(parts) < 3:
-            print(f"Skipping line due to insufficient parts: {line.strip()}")
+        cursor.execute('SELECT prr_sum, count FROM prr_stats')
+        rows = cursor.fetchall()
+        if rows:
+            for idx, row in enumerate(rows):
+                prr_sum, count = row
+                self.prr_buf[idx] = prr_sum
+                self.prr_count_frames[idx] = count
+        else:
+            # Initialize prr_stats table
+            for _ in range(GRANULARITY):
+                cursor.execute('''
+                    INSERT INTO prr_stats (prr_sum, count) VALUES (?, ?)
+                ''', (0.0, 0))
+
+        cursor.execute('SELECT channel, count FROM channel_stats')
+        rows = cursor.fetchall()
+        if rows:
+            for channel, count in rows:
+                self.channel_counts[channel] = count
+        else:
+            cursor.executemany('INSERT INTO channel_stats (channel, name, count) VALUES (?, ?, ?)',
+                               [(idx, name, 0) for idx, name in enumerate(channel_map)])
+
+        conn.commit()
+        self.saved = self.snapshot()
+
+    def take_changes(self):
+        """
+        Returns the rows that changed since the last call, or None, and marks them as written.
+        Cheap enough to run under the lock after every batch, the rows are written by write_changes().
+        """
+        saved = self.saved or {}
+        all_stats = {
+            lcw_type: count for lcw_type, count in self.all_types.items()
+            if saved.get("all_types", {}).get(lcw_type) != count
+        }
+        encryption_stats = {
+            lcw_type: (counts["enc"], counts["total"]) for lcw_type, counts in self.total_type_counts.items()
+            if saved.get("total_type_counts", {}).get(lcw_type) != counts
+        }
+        if saved:
+            changed = np.flatnonzero((self.prr_buf != saved["prr_buf"]) | (self.prr_count_frames != saved["prr_count_frames"]))
+        else:
+            changed = np.arange(GRANULARITY)
+        prr_stats = {int(idx) + 1: (float(self.prr_buf[idx]), int(self.prr_count_frames[idx])) for idx in changed}
+        if saved:
+            channels = np.flatnonzero(self.channel_counts != saved["channel_counts"])
+        else:
+            channels = np.arange(len(channel_map))
+        channel_stats = {int(idx): int(self.channel_counts[idx]) for idx in channels}
+        checkpoint = self.take_checkpoint()
+        if not (all_stats or encryption_stats or prr_stats or checkpoint):
+            return None
+        self.saved = self.snapshot()
+        changes = {
+            "all_stats": all_stats,
+            "encryption_stats": encryption_stats,
+            "prr_stats": prr_stats,
+            "channel_stats": channel_stats,
+            "checkpoint": checkpoint,
+        }
+        changes.update(self.take_series())
+        return changes
+
+    def take_checkpoint(self):
+        """
+        Checkpoint entries to write along with the counters, called by take_changes() under the lock:
+          open_messages - ids of the open messages, whenever they changed. Cheap, and always as new as the counters
+          reassembly    - a snapshot of the open messages every CHECKPOINT_INTERVAL seconds, serialized by write_changes()
+          offset <path> - position in an offline input file, set by run_offline() as chunks are merged
+        On resume only the checkpointed messages that are still open by open_messages are restored,
+        the others were closed and counted after the checkpoint was taken.
+        """
+        checkpoint, self.pending_checkpoint = self.pending_checkpoint, {}
+        open_ids = self.reassembler.open_ids()
+        if open_ids and time.monotonic() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            checkpoint["reassembly"] = self.reassembler.checkpoint()
+            self.last_checkpoint = time.monotonic()
+        if open_ids != self.saved_open or "reassembly" in checkpoint:
+            checkpoint["open_messages"] = json.dumps(open_ids)
+            self.saved_open = open_ids
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint, cursor=None):
+        """
+        Writes checkpoint entries, in the transaction of the given cursor if there is one. None deletes an entry.
+        """
+        if cursor is None:
+            with self.connect() as conn:
+                self.save_checkpoint(checkpoint, conn.cursor())
             return
-        
-        frame_type = parts[0][:-1]
+        cursor.executemany('INSERT OR REPLACE INTO checkpoint VALUES (?, ?)',
+                           [(key, value) for key, value in checkpoint.items() if value is not None])
+        cursor.executemany('DELETE FROM checkpoint WHERE key = ?',
+                           [(key,) for key, value in checkpoint.items() if value is None])
+
+    def load_checkpoint(self):
+        return dict(self.connect().execute('SELECT key, value FROM checkpoint').fetchall())
+
+    def clear_checkpoint(self):
+        """
+        Forgets the checkpoint of an earlier run, for a run that starts over instead of resuming.
+        """
+        with self.connect() as conn:
+            conn.execute('DELETE FROM checkpoint')
 
-        if frame_type == "ERR":
-            # Skip error lines
+    def resume(self):
+        """
+        Reopens the messages that were open when the counters were last written.
+        """
+        checkpoint = self.load_checkpoint()
+        if "reassembly" not in checkpoint:
+            print(f"No open messages to resume in {self.db_path}.")
             return
-        
-        # Extract timestamp
-        time = parts[1]
-        if time.split("-")[1].isdigit():
-            seconds = int(time.split("-")[1])
-            offset = float(parts[2])/1000
-            time = seconds + offset
-        else: # fallback if the timestamp is not in expected format, and just use milisecond offset
-            time = float(parts[2])/1000
-
-        # Extract frequency and channel index
-        freq = parts[3]
-        idx = util.channelize_str(int(freq))
-        if idx < 0 or idx >= len(channel_map) or idx is None:
-            print(f"Invalid channel index: {idx} for frequency {freq}")
+        try:
+            restored = self.reassembler.restore(checkpoint["reassembly"], json.loads(checkpoint.get("open_messages", "[]")))
+        except ValueError as e:
+            print(f"Ignoring the open messages checkpointed in {self.db_path}: {e}")
             return
+        self.saved_open = self.reassembler.open_ids()
+        print(f"Resumed {restored} open messages from {self.db_path}.")
+
+    def write_changes(self, changes):
+        """
+        Writes rows from take_changes() in one transaction.
+        """
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+            # Update all_stats table
+            cursor.executemany('''
+                UPDATE all_stats SET count = ? WHERE type = ?
+            ''', [(count, lcw_type) for lcw_type, count in changes["all_stats"].items()])
+
+            # Update encryption_stats table
+            cursor.executemany('''
+                UPDATE encryption_stats
+                SET enc = ?, total =  ?
+                WHERE type = ?
+            ''', [(enc, total, lcw_type) for lcw_type, (enc, total) in changes["encryption_stats"].items()])
+
+            # Update prr_stats table
+            cursor.executemany('''
+                UPDATE prr_stats
+                SET prr_sum = ?, count = ?
+                WHERE id = ?
+            ''', [(prr_sum, count, idx) for idx, (prr_sum, count) in changes["prr_stats"].items()])
+
+            cursor.executemany('UPDATE channel_stats SET count = ? WHERE channel = ?',
+                               [(count, idx) for idx, count in changes["channel_stats"].items()])
+
+            for table, (key, columns) in SERIES_TABLES.items():
+                cursor.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, {", ".join("?" * len(columns))}) {series_upsert(table)}',
+                                   [(window, SERIES_WINDOW, row_key) + counts for (window, row_key), counts in changes[table].items()])
+
+            # Serialized here in the writer thread, the snapshot was taken under the lock of the pipeline
+            checkpoint = changes["checkpoint"]
+            if "reassembly" in checkpoint and not isinstance(checkpoint["reassembly"], str):
+                checkpoint = dict(checkpoint, reassembly=dump_checkpoint(checkpoint["reassembly"]))
+            self.save_checkpoint(checkpoint, cursor)
+
+        # The changes are committed, errors of the rollup must not reach the DbWriter, whose retry would write them again
+        if time.time() - self.last_rollup >= ROLLUP_INTERVAL:
+            try:
+                self.rollup()
+            except sqlite3.Error as e:
+                print(f"Error rolling up {self.db_path}, retried with the next write: {e}")
+
+    def update_db(self):
+        """
+        Updates the SQLite database with the statistics that changed since the last update, in one transaction.
+        """
+        changes = self.take_changes()
+        if changes:
+            self.write_changes(changes)
+
+    def count_series(self, table, timestamp, key, counts):
+        """
+        Adds counts to the row of key in the time series window of timestamp, the time of the frames counted.
+        """
+        row = (int(timestamp) // SERIES_WINDOW * SERIES_WINDOW, key)
+        pending = self.pending_series[table]
+        previous = pending.get(row)
+        pending[row] = counts if previous is None else tuple(a + b for a, b in zip(previous, counts))
+
+    def take_series(self):
+        """
+        Returns the time series rows counted since the last call, by table, and resets them.
+        """
+        frame_series, self.frame_series = self.frame_series, {}
+        for (window, frame_type, idx), count in frame_series.items():
+            timestamp = window * SERIES_WINDOW
+            self.count_series("type_series", timestamp, frame_type, (count, 0, 0))
+            self.count_series("type_series", timestamp, "total", (count, 0, 0))
+            self.count_series("channel_series", timestamp, idx, (count,))
+        series, self.pending_series = self.pending_series, {table: {} for table in SERIES_TABLES}
+        return series
 
+    def rollup(self, now=None):
+        """
+        Compacts old rows of the time series tables: minutes older than two days into hours,
+        hours older than 60 days into days (see ROLLUP_AFTER). Only whole target windows are rolled up.
+        """
+        now = time.time() if now is None else now
+        conn = self.connect()
+        with conn:
+            for length, (target, age) in ROLLUP_AFTER.items():
+                cutoff = int(now - age) // target * target
+                for table, (key, columns) in SERIES_TABLES.items():
+                    conn.execute(f'''
+                        INSERT INTO {table}
+                        SELECT window_start - window_start % ?, ?, {key}, {", ".join(f"SUM({column})" for column in columns)}
+                        FROM {table} WHERE window_length = ? AND window_start < ?
+                        GROUP BY 1, {key} {series_upsert(table)}
+                    ''', (target, target, length, cutoff))
+                    conn.execute(f'DELETE FROM {table} WHERE window_length = ? AND window_start < ?', (length, cutoff))
+        self.last_rollup = time.time()
+
+    def take_stats(self):
+        """
+        Returns the counters accumulated since the last call and resets them, used by workers to report deltas.
+        """
+        delta = self.snapshot()
+        delta["series"] = self.take_series()
+        delta["reassembly"] = dict(self.reassembler.stats)
+        delta["frames"] = framelog.records(self.frame_rows) if self.frame_rows else None
+        self.reset_stats()
+        return delta
+
+    def reset_stats(self):
+        for frame_type in self.all_types:
+            self.all_types[frame_type] = 0
+        for counts in self.total_type_counts.values():
+            counts["enc"] = 0
+            counts["total"] = 0
+        self.prr_buf[:] = 0.0
+        self.prr_count_frames[:] = 0
+        self.channel_counts[:] = 0
+        self.frame_series = {}
+        self.pending_series = {table: {} for table in SERIES_TABLES}
+        self.reassembler.stats.clear()
+        self.frame_rows = []
+
+    def merge_stats(self, delta):
+        """
+        Adds counter deltas from a worker to these statistics.
+        """
+        for frame_type, count in delta["all_types"].items():
+            self.all_types[frame_type] = self.all_types.get(frame_type, 0) + count
+        for lcw_type, counts in delta["total_type_counts"].items():
+            self.total_type_counts[lcw_type]["enc"] += counts["enc"]
+            self.total_type_counts[lcw_type]["total"] += counts["total"]
+        self.prr_buf += delta["prr_buf"]
+        self.prr_count_frames += delta["prr_count_frames"]
+        self.channel_counts += delta["channel_counts"]
+        for table, rows in delta["series"].items():
+            for (window, key), counts in rows.items():
+                self.count_series(table, window, key, counts)
+        self.reassembler.stats.update(delta["reassembly"])
+        if delta.get("frames") is not None and self.frame_log is not None:
+            self.frame_log.append(delta["frames"])
+
+    def reconstruct_packets(self, final=False):
+        """
+        Classifies the messages the reassembler closed since the last call.
+        Open messages carry over to the next batch unless they went idle, or final is set.
+        """
+        if final:
+            self.reassembler.close_all()
+        else:
+            self.reassembler.evict()
+
+        # check if reconstructed data is encrypted
+        undecided = []
+        classified = []
+        for msg in self.reassembler.take():
+            if msg.type in self.total_type_counts:
+                self.total_type_counts[msg.type]["total"] += 1
+                self.count_series("type_series", msg.start, msg.type, (0, 0, 1))
+                if not msg.valid:
+                    print(f"Invalid hex payload in {msg.type} message on channel {msg.channel}, len: {msg.length}")
+                elif msg.decision is not None:
+                    self.total_type_counts[msg.type]["enc"] += msg.decision
+                    self.count_series("type_series", msg.start, msg.type, (0, int(msg.decision), 0))
+                    classified.append(msg)
+                else:
+                    undecided.append(msg)
+                    classified.append(msg)
+            else:
+                print(f"Unknown message type: {msg.type}")
+
+        # One classifier call for all messages of the batch
+        if undecided:
+            if self.classifier.histogram:
+                counts = np.stack([msg.hist.counts for msg in undecided])
+                encrypted = self.classifier.classify([msg.tail() for msg in undecided], counts)
+            else:
+                encrypted = self.classifier.classify([msg.view() for msg in undecided])
+            for msg, enc in zip(undecided, encrypted.tolist()):
+                self.total_type_counts[msg.type]["enc"] += enc
+                self.count_series("type_series", msg.start, msg.type, (0, int(enc), 0))
+                msg.decision = enc
+
+        if self.log_frames:
+            for msg in classified:
+                self.frame_rows.append((msg.start, msg.channel, framelog.type_code(msg.type), int(msg.decision),
+                                        NAN, NAN, msg.length // 2, -1))
+
+    def relieve_pressure(self, max_wait=BACKPRESSURE_WAIT):
+        """
+        Called before a batch is handed to the reassembler. With the backpressure policy and the open messages
+        over the memory watermark, holds the caller back, so its input queue fills up and the capture is throttled,
+        while messages whose channel went quiet are closed by wall clock. Sheds messages after max_wait seconds.
+        The other policies keep the reassembler below the watermark by themselves.
+        """
+        if not self.reassembler.overloaded():
+            return
+        t0 = time.monotonic()
+        while True:
+            with self.lock:
+                self.reassembler.evict_stale(self.reassembler.idle_timeout)
+                if not self.reassembler.overloaded():
+                    break
+                if time.monotonic() - t0 >= max_wait:
+                    self.reassembler.shed()
+                    break
+            time.sleep(0.1)
+        with self.lock:
+            self.reassembler.stats["backpressure"] += 1
+            self.reassembler.stats["backpressure_ms"] += int((time.monotonic() - t0) * 1000)
+            self.reconstruct_packets()
+
+    def process_frame(self, frame_type, timestamp, idx, data):
+        """
+        Counts a tokenized frame and hands it to the reassembler.
+        """
         # Count the occurrences of each LCW type
-        if frame_type in all_types:
-            all_types[frame_type] += 1
-            all_types["total"] += 1
+        if frame_type in self.all_types:
+            self.all_types[frame_type] += 1
+            self.all_types["total"] += 1
+            self.channel_counts[idx] += 1
+            # One dict update per frame, spread over the type and channel series by take_series()
+            key = (int(timestamp) // SERIES_WINDOW, frame_type, idx)
+            self.frame_series[key] = self.frame_series.get(key, 0) + 1
 
         # Filter by type
-        if frame_type not in lcw_types:
+        if frame_type not in FRAME_EXTRACTORS:
             return
 
-        data = None
-        
-        if frame_type == "IIP" or frame_type == "IDA" or frame_type == "VOC" or frame_type == "VDA" or frame_type == "VOZ":
-            data_match = re.search(r'\[([0-9a-fA-F.][0-9a-fA-F.]+)\]', line)
-            if data_match:
-                data = data_match.group(1)
-                data = data.replace(".", "")
-        elif frame_type == "IIQ" or frame_type == "IIR":
-            data_match = re.search(r'\[([0-9a-fA-F][0-9a-fA-F]+)\]', line)
-            if data_match:
-                data = data_match.group(1)
-                data = data.replace(" ", "")
-        elif frame_type == "IIU" or frame_type == "VO6":
-            data_match = re.search(r'\[([0-1]+)\]', line)
-            if data_match:
-                data = data_match.group(1)
-                data = data.replace(" ", "")
-                try:
-                    data = hex(int(data, 2))[2:]
-                except ValueError:
-                    print(f"ValueError: {data}, line: {line}")
-        elif frame_type == "MSG":
-            data_match = re.search(r'msg:([0-9a-fA-F]+).', line)
-            if data_match:
-                data = data_match.group(1)
-        elif frame_type == "NXT":
-            data_match = re.search(r'\> ([0-1 ]+)', line)
-            if data_match:
-                data = data_match.group(1)
-                data = data.replace(" ", "")
-                try:
-                    data = hex(int(data, 2))[2:]
-                except ValueError:
-                    # print(f"ValueError: {data}, line: {line}")
-                    data = None        
-        m = {
-            "type": frame_type,
-            "time": time,
-            "channel": idx,
-            "data": data
-        }
+        self.reassembler.add(frame_type, timestamp, idx, data)
 
+    def process_line(self, line):
+        """
+        Processes a line of data, extracts frequency and timestamp, and groups it.
+        """
+        try:
+            token = tokenize_line(line)
+            if token is not None:
+                self.process_frame(*token)
 
-        channels_buf[idx].append(m)
+        except Exception as e:
+            print(f"Error processing line: {e}")
+            print(f"Line content: {line.strip()}")
 
-    except Exception as e:
-        print(f"Error processing line: {e}")
-        print(f"Line content: {line.strip()}")
-        print(f"{line.strip()}\n")
+    def parse_by_line(self, lines, final=False):
+        """
+        Splits the input lines into chunks based on the LCW types.
+        The whole batch is tokenized and channelized at once.
+        """
+        try:
+            if self.log_frames:
+                for frame_type, timestamp, idx, data, rest in tokenize_lines((line for line in lines if line.strip()), with_rest=True):
+                    self.process_frame(frame_type, timestamp, idx, data)
+                    snr, noise, length = frame_details(rest)
+                    self.frame_rows.append((timestamp, idx, framelog.type_code(frame_type), -1, snr, noise, length, -1))
+            else:
+                for frame in tokenize_lines(line for line in lines if line.strip()):
+                    self.process_frame(*frame)
+
+            self.reconstruct_packets(final=final)
+            self.flush_frames()
+
+        except Exception as e:
+            print(f"Error splitting lines: {e}")
+            return None
+
+    def get_prr(self, lines):
+        try:
+            # BER calculation
+            # Calculate the packet reception rate per SNR index calculated per received frame,
+            # over the bits whose errors could be measured (IBC, IRA or LCW, see ber.measure_ber),
+            # for the whole batch of lines at once
+            types, bit_errors, checked, snr, noise, len_bits = batch_measure_ber(lines)
+            # No SNR on A: lines (NaN), SNRs outside the bins would wrap around or overflow
+            rows = np.flatnonzero((types >= 0) & np.isfinite(snr))
+            prr_id = np.array([int(round(x, 1) * 10) for x in snr[rows].tolist()], dtype=np.int64)
+            valid = (prr_id >= 0) & (prr_id < GRANULARITY)
+            rows, prr_id = rows[valid], prr_id[valid]
+            prr = (1 - bit_errors[rows] / checked[rows]) ** checked[rows]
+            self.prr_buf += np.bincount(prr_id, weights=prr, minlength=GRANULARITY)
+            self.prr_count_frames += np.bincount(prr_id, minlength=GRANULARITY)
+            # PRR series rows by the window of each frame
+            windows = np.array([split_line(lines[row])[1] // SERIES_WINDOW for row in rows.tolist()], dtype=np.int64)
+            keys, inverse = np.unique(windows * GRANULARITY + prr_id, return_inverse=True)
+            sums = np.bincount(inverse, weights=prr, minlength=len(keys))
+            counts = np.bincount(inverse, minlength=len(keys))
+            for key, prr_sum, count in zip(keys.tolist(), sums.tolist(), counts.tolist()):
+                window, idx = divmod(key, GRANULARITY)
+                self.count_series("prr_series", window * SERIES_WINDOW, idx, (prr_sum, count))
+            if self.log_frames:
+                for i, line in enumerate(lines):
+                    res = None
+                    if types[i] >= 0:
+                        res = (FRAME_TYPES[types[i]], int(bit_errors[i]), int(checked[i]), float(snr[i]),
+                               float(noise[i]), int(len_bits[i]))
+                    self.log_raw(line, res)
+            self.flush_frames()
+        except Exception as e:
+            print(f"An error occurred while calculating PRR: {e}")
+            return None
+
+    def log_raw(self, line, res):
+        split = split_line(line)
+        if split is None:
+            return
+        timestamp, freq = split[1], split[2]
+        if res is None:
+            bit_errors, snr, noise, checked = -1, NAN, NAN, -1
+        else:
+            frame_type, bit_errors, checked, snr, noise, len_bits = res
+        self.frame_rows.append((timestamp, util.channelize_str(freq), framelog.type_code("RAW"), -1, snr, noise, checked, bit_errors))
+
+    def parse_iridium_traffic(self, parser, final=False):
+        """
+        Collects the frames parsed so far by the iridium-parser worker and processes them.
+        With final set, the parser input is closed and all remaining frames are drained.
+        """
+        try:
+            if final:
+                output_lines = parser.close()
+            else:
+                parser.flush()
+                # The parser runs ahead on its own, an empty read just means no frames were parsed since the last one
+                output_lines = parser.read()
+
+            self.parse_by_line(output_lines, final=final)
+
+        except Exception as e:
+            print(f"An error occurred while parsing: {e}")
+            return None
+
+    def print_stats(self):
+        print(self.reassembler.report())
+        print(self.total_type_counts)
+        print(self.all_types)
+        print(self.prr_count_frames)
 
 
-def parse_by_line(lines):
+# Payload extractors per frame type, they only see the part of the line after the frequency
+HEX_DOTTED = re.compile(r'\[([0-9a-fA-F.][0-9a-fA-F.]+)\]')
+HEX_PLAIN = re.compile(r'\[([0-9a-fA-F][0-9a-fA-F]+)\]')
+BITS_BRACKETED = re.compile(r'\[([0-1]+)\]')
+MSG_HEX = re.compile(r'msg:([0-9a-fA-F]+).')
+NXT_BITS = re.compile(r'\> ([0-1 ]+)')
+
+def bits_to_hex(bits):
     """
-    Splits the input lines into chunks based on the LCW types.
+    Converts a string of bits to hex, keeping leading zero nibbles.
     """
-    try:
-        lines = lines.strip().split('\n')
-        for line in lines:
-            if line.strip():
-                process_line(line)
+    return "%0*x" % ((len(bits) + 3) // 4, int(bits, 2))
 
-        reconstruct_packets()
+def extract_dotted_hex(rest):
+    data_match = HEX_DOTTED.search(rest)
+    return data_match.group(1).replace(".", "") if data_match else None
 
-    except Exception as e:
-        print(f"Error splitting lines: {e}")
+def extract_hex(rest):
+    data_match = HEX_PLAIN.search(rest)
+    return data_match.group(1) if data_match else None
+
+def extract_bits(rest):
+    data_match = BITS_BRACKETED.search(rest)
+    return bits_to_hex(data_match.group(1)) if data_match else None
+
+def extract_msg(rest):
+    data_match = MSG_HEX.search(rest)
+    return data_match.group(1) if data_match else None
+
+def extract_nxt(rest):
+    data_match = NXT_BITS.search(rest)
+    if not data_match:
         return None
+    bits = data_match.group(1).replace(" ", "")
+    return bits_to_hex(bits) if bits else None
 
-def get_prr(lines):
-    try:
-        # BER calculation
-        # Calculate the packet reception rate per SNR index calculated per received frame
-        for line in lines:
-            res = calculate_ber(line)
-            if res is not None:
-                bit_errors, snr, noise, len_bits = res
-                packet_reception_rate = np.power((1 - (bit_errors/len_bits)), len_bits)
-                prr_id = int(round(float(snr), 1) * 10)
-                prr_buf[prr_id] += packet_reception_rate
-                prr_count_frames[prr_id] += 1
-    except Exception as e:
-        print(f"An error occurred while calculating PRR: {e}")
+def extract_nothing(rest):
+    return None
+
+FRAME_EXTRACTORS = {
+    "IIP": extract_dotted_hex,
+    "IDA": extract_dotted_hex,
+    "VOC": extract_dotted_hex,
+    "VDA": extract_dotted_hex,
+    "VOZ": extract_dotted_hex,
+    "IIQ": extract_hex,
+    "IIR": extract_hex,
+    "IIU": extract_bits,
+    "VO6": extract_bits,
+    "MSG": extract_msg,
+    "NXT": extract_nxt,
+    "VOD": extract_nothing,
+    "MS3": extract_nothing,
+}
+
+def split_line(line):
+    """
+    Splits a parsed frame into type, timestamp, frequency and the rest of the line.
+    Returns None for lines that are skipped.
+    """
+    parts = line.split(None, 4)
+    if len(parts) < 4:
+        print(f"Skipping line due to insufficient parts: {line.strip()}")
         return None
 
+    frame_type = parts[0][:-1]
+    if frame_type == "ERR":
+        # Skip error lines
+        return None
 
-def parse_iridium_traffic(lines:str, debug=False):
-    try:
-        iridium_parser = subprocess.Popen(
-            ["iridium-parser.py" , "--harder", "--uw-ec"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if debug: print("iridium-parser PID: ", iridium_parser.pid)
-        stdout, stderr = iridium_parser.communicate(input=lines)
-
-        if stderr and "Warning" in stderr:
-                if debug: print("Warning from iridium-toolkit:", stderr.strip())
-        elif stderr:
-            print("Error from iridium-toolkit:", stderr.strip())
-            return None 
-        output_lines = stdout.strip()
-        if not output_lines:
-            print("No output received from iridium-toolkit.")
-            return None
-        if iridium_parser.returncode != 0:
-            print(f"Error parsing with iridium-toolkit: {output_lines.strip()}")
-            return None
-        
-        parse_by_line(output_lines)
+    # Timestamp is the start of the recording from the file name plus the millisecond offset
+    name = parts[1].split("-", 2)
+    if len(name) > 1 and name[1].isdigit():
+        timestamp = int(name[1]) + float(parts[2]) / 1000
+    else: # fallback if the timestamp is not in expected format, and just use milisecond offset
+        timestamp = float(parts[2]) / 1000
 
-    except FileNotFoundError:
-        print("iridium-toolkit is not installed or not in PATH.")
+    return frame_type, timestamp, int(parts[3]), parts[4] if len(parts) > 4 else None
+
+def extract_payload(frame_type, rest):
+    # Only frame types we reassemble need their payload extracted
+    extractor = FRAME_EXTRACTORS.get(frame_type)
+    if extractor is None or rest is None:
         return None
-    except Exception as e:
-        print(f"An error occurred while parsing: {e}")
+    return extractor(rest)
+
+def tokenize_line(line):
+    """
+    Splits a parsed frame into type, timestamp, channel index and payload in a single pass.
+    Returns None for lines that are skipped, frame types that are not tracked come back without a payload.
+    """
+    split = split_line(line)
+    if split is None:
+        return None
+    frame_type, timestamp, freq, rest = split
+
+    idx = util.channelize_str(freq)
+    if idx < 0 or idx >= len(channel_map):
+        print(f"Invalid channel index: {idx} for frequency {freq}")
         return None
+    return frame_type, timestamp, idx, extract_payload(frame_type, rest)
+
+def frame_details(rest):
+    """
+    SNR, noise and length in bits from the part of a parsed frame after the frequency.
+    """
+    try:
+        fields = rest.split(None, 3)
+        level, noise, snr = fields[1].split("|")
+        return float(snr), float(noise), int(fields[2])
+    except (AttributeError, IndexError, ValueError):
+        return NAN, NAN, -1
+
+def tokenize_lines(lines, with_rest=False):
+    """
+    Batch form of tokenize_line: splits all lines, then channelizes their frequencies in one vectorized call.
+    Yields (frame_type, timestamp, idx, data) for every frame in the band, with the rest of the line appended if with_rest is set.
+    """
+    frames = []
+    for line in lines:
+        try:
+            split = split_line(line)
+        except Exception as e:
+            print(f"Error processing line: {e}")
+            print(f"Line content: {line.strip()}")
+            continue
+        if split is not None:
+            frames.append(split)
+    if not frames:
+        return
+
+    indices, out_of_band = util.channelize_array([frame[2] for frame in frames], channels=len(channel_map))
+    for (frame_type, timestamp, freq, rest), idx, skip in zip(frames, indices.tolist(), out_of_band.tolist()):
+        if skip:
+            print(f"Invalid channel index: {idx} for frequency {freq}")
+            continue
+        if with_rest:
+            yield frame_type, timestamp, idx, extract_payload(frame_type, rest), rest
+        else:
+            yield frame_type, timestamp, idx, extract_payload(frame_type, rest)
+
+def raw_channel(line):
+    """
+    Returns the channel index of a RAW line from gr-iridium, used to pick the shard of a line.
+    """
+    parts = line.split(None, 4)
+    if len(parts) < 4:
+        return None
+    return util.channelize_str(int(parts[3]))
+
+def shard_worker(shard, lines_queue, results_queue, flush=None, reassembly=None, classifier="entropy", log_frames=False,
+                 debug=False):
+    """
+    Worker process of the sharded pipeline. Owns its own iridium-parser, reassembly buffers and counters
+    for the channels routed to it and reports counter deltas to the coordinator every MERGE_INTERVAL seconds.
+    """
+    # Always report the end, otherwise the coordinator waits for this shard until it notices the exit
+    try:
+        state = PipelineState(db_path=None, reassembly=reassembly, classifier=classifier, log_frames=log_frames)  # Workers never write to the database, the coordinator does
+        parser = ParserWorker(debug=debug)
+        try:
+            parser.start()
+        except FileNotFoundError:
+            print("iridium-toolkit is not installed or not in PATH.")
+            parser = None
+
+        batcher = Batcher(**(flush or default_flush()))
+        last_merge = time.monotonic()
+        while True:
+            timeout = batcher.timeout()
+            try:
+                batch = lines_queue.get(timeout=1.0 if timeout is None else min(timeout, 1.0))
+            except queue.Empty:
+                batch = []
+            if batch is None:
+                break
+
+            if parser is not None:
+                parser.send_lines(batch)
+            for line in batch:
+                batcher.add(line)
+            reason = batcher.due()
+            if reason:
+                buffer = batcher.take(reason)
+                if parser is not None:
+                    state.relieve_pressure()
+                    state.parse_iridium_traffic(parser)
+                state.get_prr(buffer)
 
-def run_data_collection(config_path=None, sigmf_file=None, debug=False):
+            if time.monotonic() - last_merge >= MERGE_INTERVAL:
+                results_queue.put((shard, state.take_stats()))
+                last_merge = time.monotonic()
+
+        if parser is not None:
+            state.parse_iridium_traffic(parser, final=True)
+        state.get_prr(batcher.take("final"))
+        if debug: print(f"shard {shard} flushes: {batcher.report()}")
+        results_queue.put((shard, state.take_stats()))
+    finally:
+        results_queue.put((shard, None))
+
+def read_capture(process, stages, debug=False):
+    """
+    Reads gr-iridium output and hands every line to the given stages. Runs in its own thread.
+    """
+    # gr-iridium reports its status on stderr, drain it so the extractor never blocks on a full pipe
+    def drain_stderr():
+        for line in process.stderr:
+            if debug: print("gr-iridium:", line.strip())
+    threading.Thread(target=drain_stderr, daemon=True).start()
+
+    for line in process.stdout:
+        line = line.strip()
+        if not line:
+            continue
+        for stage in stages:
+            stage.put(line)
+
+def wait_for_capture(process, reader, stages, debug=False):
+    """
+    Waits until the capture ends or SIGTERM/SIGINT is received, then stops the extractor so the stages can drain.
+    'q' on an interactive terminal stops the capture as well.
+    """
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}, stopping capture...")
+        stop.set()
+    previous = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+    watch_stdin = sys.stdin is not None and sys.stdin.isatty()
+    if watch_stdin:
+        print("Input q to quit the process")
+    last_report = time.monotonic()
     try:
+        while reader.is_alive() and not stop.is_set():
+            if watch_stdin and sys.stdin in select.select([sys.stdin], [], [], 1.0)[0]:
+                user_input = sys.stdin.read(1)
+                if user_input.lower() == 'q':
+                    print("User requested to quit. Exiting loop...")
+                    stop.set()
+            elif not watch_stdin:
+                stop.wait(1.0)
+
+            if debug and time.monotonic() - last_report >= REPORT_INTERVAL:
+                for stage in stages:
+                    print(stage.report())
+                last_report = time.monotonic()
+
+        if stop.is_set():
+            process.terminate()
+        reader.join()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+def series_upsert(table):
+    """
+    Conflict clause that adds a row to the existing row of its window and key.
+    """
+    key, columns = SERIES_TABLES[table]
+    sums = ", ".join(f"{column} = {column} + excluded.{column}" for column in columns)
+    return f"ON CONFLICT (window_start, window_length, {key}) DO UPDATE SET {sums}"
+
+def merge_changes(pending, changes):
+    """
+    Combines two take_changes() results for one write: newer totals win, time series deltas add up.
+    """
+    for key in ("all_stats", "encryption_stats", "prr_stats", "channel_stats", "checkpoint"):
+        pending[key].update(changes[key])
+    for key in SERIES_TABLES:
+        series = pending[key]
+        for row, counts in changes[key].items():
+            previous = series.get(row)
+            series[row] = counts if previous is None else tuple(a + b for a, b in zip(previous, counts))
+    return pending
+
+def start_writer(state):
+    return DbWriter(f"writer {state.db_path}", state.write_changes, merge_changes).start()
+
+def default_flush():
+    return {"max_lines": BUFFER_SIZE, "max_bytes": FLUSH_BYTES, "max_age_ms": FLUSH_AGE_MS}
+
+def run_data_collection(config_path=None, sigmf_file=None, workers=1, flush=None, state=None, debug=False):
+    try:
+        state = state or PipelineState()
         if config_path != None:
             # Start gr-iridium and pipe its output to this script
             print("testing gr-iridium with config path:", config_path)
             process = subprocess.Popen(
-                ["iridium-extractor", "-D", "4", config_path],
+                EXTRACTOR_CMD + [config_path],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True
             )  
         elif sigmf_file != None:
             process = subprocess.Popen(
-                ["iridium-extractor","-D", "4", sigmf_file],
+                EXTRACTOR_CMD + [sigmf_file],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True
@@ -392,60 +1020,355 @@ def run_data_collection(config_path=None, sigmf_file=None, debug=False):
             print("Please provide a config path or a SigMF file for processing.")
             return
         
-        print("Input q to quit the process")
-        
-        buffer = []
         if debug:
             print("gr-iridium PID: ", process.pid)
 
-        for line in process.stdout:
-            # Add line to buffer and increment line count
-            buffer.append(line.strip())
+        # Buffers are processed on whichever comes first: line count, byte size or age
+        flush = flush or default_flush()
+        if workers > 1:
+            run_shards(process, state, workers, flush, debug=debug)
+        else:
+            run_stages(process, state, flush, debug=debug)
 
-            # Check for 'q' key press to quit
-            if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-                user_input = sys.stdin.read(1)
-                if user_input.lower() == 'q':
-                    print("User requested to quit. Exiting loop...")
-                    process.terminate()
-                    break  # Process the buffer when it reaches BUFFER_SIZE lines
-
-            if len(buffer) >= BUFFER_SIZE:
-                print(f"Processing {BUFFER_SIZE} buffered lines...")
-                lines = '\n'.join(buffer)
-                parse_iridium_traffic(lines, debug=debug)
-                get_prr(buffer)
-
-                # Clear the buffer and reset line count
-                buffer.clear()
-                update_db()  # Update the database with current statistics
-        
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
-        
-        # Process any remaining lines in the buffer
-        lines = '\n'.join(buffer)
-        print(f"Processing remaining {len(buffer)} lines...")
-        parse_iridium_traffic(lines, debug=debug)
-        get_prr(buffer)
-        # Clear the buffer and reset line count
-        buffer.clear()
-        update_db()  # Final update to the database
+def run_stages(process, state, flush, debug=False):
+    """
+    Processes the capture in this process with threaded stages: capture -> parse / BER+PRR -> DbWriter.
+    """
+    # One iridium-parser for the whole run, fed line by line as the bursts come in
+    parser = ParserWorker(debug=debug)
+    try:
+        parser.start()
+    except FileNotFoundError:
+        print("iridium-toolkit is not installed or not in PATH.")
+        process.terminate()
+        return
+
+    # Every batch hands what it changed to the writer thread, which merges whatever queued up into one write
+    writer = start_writer(state)
+
+    def parse_stage(lines, final):
+        if lines: print(f"Processing {len(lines)} buffered lines...")
+        state.relieve_pressure()
+        with state.lock:
+            state.parse_iridium_traffic(parser, final=final)
+            changes = state.take_changes()
+        writer.put(changes)
+
+    def prr_stage(lines, final):
+        with state.lock:
+            state.get_prr(lines)
+            changes = state.take_changes()
+        writer.put(changes)
+
+    parse = Stage("parse", parse_stage, flush=flush, on_item=parser.send).start()
+    prr = Stage("prr", prr_stage, flush=flush).start()
+    stages = [parse, prr, writer]
+
+    reader = threading.Thread(target=read_capture, args=(process, [parse, prr], debug), daemon=True)
+    reader.start()
+
+    wait_for_capture(process, reader, stages, debug=debug)
+
+    # Drain the stages in pipeline order, the writer finishes with the final statistics
+    print("Processing remaining buffered lines...")
+    parse.stop()
+    prr.stop()
+    writer.stop()
+    if debug:
+        for stage in stages:
+            print(stage.report())
+
+def run_shards(process, state, workers, flush, debug=False):
+    """
+    Processes the capture in worker processes, each owning the channels with index % workers == shard.
+    The coordinator only reads the capture, merges counter deltas into state and persists them.
+    """
+    writer = start_writer(state)
+
+    def merge(delta):
+        with state.lock:
+            state.merge_stats(delta)
+            changes = state.take_changes()
+        writer.put(changes)
+
+    pool = ShardPool(workers, shard_worker, raw_channel, merge, args=(flush, state.reassembly, state.classifier.name, state.log_frames, debug)).start()
+
+    reader = threading.Thread(target=read_capture, args=(process, [pool], debug), daemon=True)
+    reader.start()
+
+    wait_for_capture(process, reader, [pool, writer], debug=debug)
+
+    print("Waiting for shard workers to finish...")
+    pool.stop()
+    writer.stop()
+    if debug:
+        print(pool.report())
+        print(writer.report())
+
+def run_async(sources, states, flush=None, debug=False):
+    """
+    Runs every source (gr-iridium config file or SigMF recording) as its own extractor and parser
+    in a single asyncio event loop until all of them end or SIGTERM/SIGINT is received.
+    """
+    asyncio.run(collect_async(sources, states, flush or default_flush(), debug=debug))
+
+async def collect_async(sources, states, flush, debug=False):
+    """
+    Awaitable form of run_async, for embedding the pipeline in an existing event loop.
+    Source i is processed into states[i], sources can share a state to merge them into one database.
+    """
+    # Writes happen in a writer thread per database so the event loop keeps reading the sources
+    writers = {id(state): start_writer(state) for state in states}
+
+    def handlers(state):
+        writer = writers[id(state)]
+        # Receivers see the same channels, so sources sharing a state reassemble in a state of their own
+        # and merge their counter deltas into the shared one, like the shard workers do
+        source_state = state
+        if sum(other is state for other in states) > 1:
+            source_state = PipelineState(db_path=None, reassembly=state.reassembly, classifier=state.classifier.name,
+                                         log_frames=state.log_frames)
 
+        def take_changes():
+            if source_state is not state:
+                with source_state.lock:
+                    delta = source_state.take_stats()
+            with state.lock:
+                if source_state is not state:
+                    state.merge_stats(delta)
+                return state.take_changes()
+
+        def on_parsed(lines, final):
+            if lines: print(f"Processing {len(lines)} parsed frames...")
+            with source_state.lock:
+                source_state.parse_by_line(lines, final=final)
+            # Waiting here would stall the event loop and every other source, so overflow is shed right away
+            source_state.relieve_pressure(max_wait=0)
+            writer.put(take_changes())
+
+        def on_raw(lines, final):
+            with source_state.lock:
+                source_state.get_prr(lines)
+            writer.put(take_changes())
+        return on_parsed, on_raw
+
+    capture_sources = [
+        AsyncSource(source, EXTRACTOR_CMD + [source], *handlers(state), flush=flush, debug=debug)
+        for source, state in zip(sources, states)
+    ]
+    try:
+        await run_sources(capture_sources)
+    finally:
+        for writer in writers.values():
+            await asyncio.to_thread(writer.stop)
+            if debug: print(writer.report())
+
+def ingest_chunk(task, mode, reassembly=None, classifier="entropy", log_frames=False, debug=False):
+    """
+    Processes one chunk of a recorded file in a pool worker and returns the counter deltas, the messages at the
+    chunk boundaries (see Reassembler.take_boundary) and the line count. The deltas and boundaries are None if the chunk failed.
+    mode is "bits" for gr-iridium output, which is run through iridium-parser, or "parsed" for iridium-toolkit output.
+    """
+    state = PipelineState(db_path=None, reassembly=reassembly, classifier=classifier, log_frames=log_frames)
+    # Messages may continue from the previous chunk or into the next one, run_offline joins them
+    state.reassembler.hold_heads()
+    lines = []
+    try:
+        lines = ingest.read_chunk(task)
+        if mode == "bits":
+            parser = ParserWorker(debug=debug)
+            parser.start()
+            parser.send_lines(lines)
+            parsed = parser.close()
+        else:
+            parsed = lines
+
+        # A file cannot be throttled, overflow is shed right away
+        for i in range(0, len(parsed), BUFFER_SIZE):
+            state.relieve_pressure(max_wait=0)
+            state.parse_by_line(parsed[i:i + BUFFER_SIZE])
+        state.reassembler.flush()
+        state.reconstruct_packets()
+        boundary = state.reassembler.take_boundary()
+        if mode == "bits":
+            for i in range(0, len(lines), BUFFER_SIZE):
+                state.get_prr(lines[i:i + BUFFER_SIZE])
+
+    except FileNotFoundError:
+        print("iridium-toolkit is not installed or not in PATH.")
+        return None, None, len(lines)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        print(f"An error occurred while processing a chunk of {task[1]}: {e}")
+        return None, None, len(lines)
+    return state.take_stats(), boundary, len(lines)
+
+def offset_key(path):
+    return f"offset {os.path.abspath(path)}"
+
+def run_offline(paths, mode, state=None, workers=None, resume=False, debug=False):
+    """
+    Re-runs the statistics over recorded files, processing their chunks in parallel
+    and merging the results into the database as the chunks complete.
+    Chunks are merged in file order and the position after the last merged chunk of a file is written
+    in the same transaction as its counters, so with resume set an interrupted run continues from there.
+    Messages that cross a chunk boundary are joined as they are merged. A chunk that fails is not merged and
+    neither are the later chunks of its file, so resume retries the file from that chunk.
+    """
+    state = state or PipelineState()
+    workers = workers or os.cpu_count() or 1
+    total_lines = 0
+    chunks = 0
+    failed = {}  # Path: chunks not merged since the first failed chunk of the file
+    start = time.monotonic()
+
+    offsets = {}
+    if resume:
+        checkpoint = state.load_checkpoint()
+        for path in paths:
+            if offset_key(path) in checkpoint:
+                offsets[path] = json.loads(checkpoint[offset_key(path)])
+                print(f"Resuming {path} at {'line' if ingest.compression(path) else 'byte'} {offsets[path]}")
+    else:
+        state.save_checkpoint({offset_key(path): None for path in paths})
+    positions = dict(offsets)
+
+    writer = start_writer(state)
+    carry = {}  # Messages open at the end of the last merged chunk, by channel
+    carry_path = None
+
+    def collect(path, position, result):
+        nonlocal total_lines, chunks, carry, carry_path
+        delta, boundary, n_lines = result.get()
+        if delta is None or path in failed:
+            if path not in failed:
+                print(f"Chunk of {path} ending at {position} failed, neither it nor the rest of the file is counted.")
+            failed[path] = failed.get(path, 0) + 1
+            delta, boundary = None, ([], [])
+        with state.lock:
+            if path != carry_path:
+                state.reassembler.stitch(carry, [], [])
+                carry, carry_path = {}, path
+            if delta is not None:
+                state.merge_stats(delta)
+                state.pending_checkpoint[offset_key(path)] = json.dumps(position)
+            carry = state.reassembler.stitch(carry, *boundary)
+            state.reconstruct_packets()
+            state.flush_frames()
+            changes = state.take_changes()
+        writer.put(changes)
+        if delta is None:
+            return
+        total_lines += n_lines
+        chunks += 1
+        elapsed = time.monotonic() - start
+        print(f"Chunk {chunks}: {total_lines} lines in {elapsed:.1f}s ({total_lines / max(elapsed, 1e-9):.0f} lines/s)")
+
+    with mp.get_context(MP_START_METHOD).Pool(workers) as pool:
+        # Bound the chunks in flight, compressed inputs are decompressed by this process ahead of the workers
+        in_flight = deque()
+        for task in ingest.plan_chunks(paths, offsets=offsets):
+            # Position after the chunk: byte offset, or lines read for compressed files
+            positions[task[1]] = task[3] if task[0] == "range" else positions.get(task[1], 0) + len(task[2])
+            in_flight.append((task[1], positions[task[1]], pool.apply_async(ingest_chunk, (task, mode, state.reassembly, state.classifier.name, state.log_frames, debug))))
+            while len(in_flight) >= 2 * workers:
+                collect(*in_flight.popleft())
+        while in_flight:
+            collect(*in_flight.popleft())
+    with state.lock:
+        state.reassembler.stitch(carry, [], [])
+        state.reconstruct_packets()
+        state.flush_frames()
+        writer.put(state.take_changes())
+    writer.stop()
+    if debug: print(writer.report())
+
+    elapsed = time.monotonic() - start
+    print(f"Processed {total_lines} lines from {len(paths)} files in {elapsed:.1f}s "
+          f"({total_lines / max(elapsed, 1e-9):.0f} lines/s) with {workers} workers")
+    for path, skipped in failed.items():
+        print(f"{skipped} chunks of {path} were not processed, run again with --resume to retry them.")
 
 if __name__ == "__main__":
     print("Starting Iridium data processing pipeline...")
-    init_db()  # Initialize the database
 
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Process Iridium data using gr-iridium and iridium-toolkit.")
-    parser.add_argument("--config", type=str, help="Path to the gr-iridium configuration file.")
-    parser.add_argument("--sigmf", type=str, help="Path to the SigMF file for offline processing.")
+    parser.add_argument("--config", type=str, nargs="+", default=[], help="Path to the gr-iridium configuration file(s), one per receiver.")
+    parser.add_argument("--sigmf", type=str, nargs="+", default=[], help="Path to the SigMF file(s) for offline processing.")
+    parser.add_argument("--db", type=str, nargs="+", default=[DB_PATH], help="Database file, or one per --config/--sigmf source to keep receivers apart.")
+    parser.add_argument("--frame-log", type=str, nargs="+", help="Append every frame to a binary log for later analysis (see framelog.py), one per --db.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the sources in an asyncio event loop, implied by more than one source.")
+    parser.add_argument("--from-bits", type=str, nargs="+", help="Recorded gr-iridium output files (optionally gzip/xz compressed) to reprocess.")
+    parser.add_argument("--from-parsed", type=str, nargs="+", help="Recorded iridium-toolkit output files (optionally gzip/xz compressed) to reprocess.")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint in --db: reopen the messages that were open and, with --from-bits/--from-parsed, skip the input already processed.")
+    parser.add_argument("--rollup", action="store_true", help="Only compact old rows of the time series tables in --db and exit.")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT, help="Close a message once its channel saw no frame for this many seconds.")
+    parser.add_argument("--reorder-window", type=float, default=REORDER_WINDOW, help="Seconds a frame is held back to put late frames of its channel in order, 0 disables reordering.")
+    parser.add_argument("--classifier", choices=list(CLASSIFIERS), default="entropy", help="How reassembled messages are judged encrypted, compare them with benchmark.py classifiers.")
+    parser.add_argument("--early-decision", type=int, help="Classify a message once this many bytes leave no doubt and release its buffer.")
+    parser.add_argument("--max-message-kb", type=int, default=MAX_MESSAGE_BYTES // 1024, help="Max payload buffered for one open message.")
+    parser.add_argument("--max-open-mb", type=int, default=MAX_OPEN_BYTES // (1024 * 1024), help="Memory watermark for the payload of all open messages.")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default="close", help="What to do when a message or all open messages reach their limit.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, frames are sharded by channel. Defaults to 1 for live capture and all cores for offline files.")
+    parser.add_argument("--flush-lines", type=int, default=BUFFER_SIZE, help="Process the buffered lines once this many are buffered.")
+    parser.add_argument("--flush-bytes", type=int, default=FLUSH_BYTES, help="Process the buffered lines once they reach this size in bytes.")
+    parser.add_argument("--flush-ms", type=int, default=FLUSH_AGE_MS, help="Process the buffered lines once the oldest waited this many milliseconds.")
+    parser.add_argument("--debug", action="store_true", help="Print gr-iridium output, stage queue depths and stalls, flush reasons and database writer statistics.")
     args = parser.parse_args()
+    flush = {"max_lines": args.flush_lines, "max_bytes": args.flush_bytes, "max_age_ms": args.flush_ms}
 
-    # Pass arguments to run_data_collection
-    run_data_collection(config_path=args.config, sigmf_file=args.sigmf, debug=False)
-    print(total_type_counts)
-    print(all_types)
-    print(prr_count_frames)
\ No newline at end of file
+    sources = args.config + args.sigmf
+    if len(args.db) > 1 and len(args.db) != len(sources):
+        parser.error("--db takes a single database or one per --config/--sigmf source")
+    if args.frame_log and len(args.frame_log) != len(args.db):
+        parser.error("--frame-log takes one file per --db")
+
+    reassembly = {
+        "idle_timeout": args.idle_timeout,
+        "reorder_window": args.reorder_window,
+        "early_decision": args.early_decision,
+        "max_message_bytes": args.max_message_kb * 1024,
+        "max_open_bytes": args.max_open_mb * 1024 * 1024,
+        "policy": args.overflow,
+    }
+    states = [PipelineState(db_path, reassembly=reassembly, classifier=args.classifier) for db_path in args.db]
+    for state in states:
+        state.init_db()  # Initialize the database
+    for state, path in zip(states, args.frame_log or []):
+        state.open_frame_log(path)
+    offline = bool(args.from_bits or args.from_parsed)
+    if not args.resume and not args.rollup:
+        for state in states:
+            state.clear_checkpoint()
+    elif args.resume and not offline:
+        if (args.workers or 1) > 1 or len(sources) > len(states):
+            # Open messages live in the shard workers or the state of each source, which are not checkpointed
+            print("Open messages are not resumed with --workers or sources sharing a --db, only the counters carry over.")
+            for state in states:
+                state.clear_checkpoint()
+        else:
+            for state in states:
+                state.resume()
+
+    if args.rollup:
+        for state in states:
+            state.rollup()
+            state.close_db()
+        sys.exit(0)
+    elif args.from_bits:
+        run_offline(args.from_bits, "bits", state=states[0], workers=args.workers, resume=args.resume, debug=args.debug)
+    elif args.from_parsed:
+        run_offline(args.from_parsed, "parsed", state=states[0], workers=args.workers, resume=args.resume, debug=args.debug)
+    elif args.use_async or len(sources) > 1:
+        run_async(sources, states if len(states) > 1 else states * len(sources), flush=flush, debug=args.debug)
+    else:
+        # Pass arguments to run_data_collection
+        run_data_collection(config_path=args.config[0] if args.config else None,
+                            sigmf_file=args.sigmf[0] if args.sigmf else None,
+                            workers=args.workers or 1, flush=flush, state=states[0], debug=args.debug)
+    for state in states:
+        state.print_stats()
+        state.close_db()
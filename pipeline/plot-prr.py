@@ -1,13 +1,15 @@
 import sqlite3
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
+import framelog
+
 prr_buf = np.zeros(1000)
 prr_count_frames = np.zeros(1000)
 
 
 def read_prr_stats(db_path):
-    global prr_buf, prr_count_frames
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     cursor.execute("SELECT prr_sum, count FROM prr_stats")
@@ -19,6 +21,19 @@ def read_prr_stats(db_path):
         
     conn.close()
 
+def read_frame_log(path):
+    """Computes the PRR per SNR from the RAW records of a frame log (pipeline.py --frame-log)."""
+    global prr_buf, prr_count_frames
+    log = framelog.read_log(path)
+    raw = log[(log["type"] == framelog.type_code("RAW")) & (log["bit_errors"] >= 0) & (log["length"] > 0)]
+    prr = np.power(1 - raw["bit_errors"] / raw["length"], raw["length"])
+    # Same binning as get_prr: frames without an SNR or outside the histogram are skipped, not clipped into the edge bins
+    scaled = np.round(raw["snr"].astype(np.float64), 1) * 10
+    valid = np.isfinite(scaled) & (scaled >= 0) & (scaled < len(prr_buf))
+    prr, prr_id = prr[valid], scaled[valid].astype(np.int64)
+    prr_buf = np.bincount(prr_id, weights=prr, minlength=len(prr_buf))
+    prr_count_frames = np.bincount(prr_id, minlength=len(prr_buf))
+
 def plot_ppr(filename='ppr.png'):
     disp = (prr_buf*100)/prr_count_frames
     x = np.arange(len(disp)) / 10
@@ -32,8 +47,12 @@ def plot_ppr(filename='ppr.png'):
     plt.savefig(filename)
 
 
-db_path = "./iridium_metadata.db"
-read_prr_stats(db_path)
+# python plot-prr.py [frames.log], reads the database unless a frame log is given
+if len(sys.argv) > 1:
+    read_frame_log(sys.argv[1])
+else:
+    db_path = "./iridium_metadata.db"
+    read_prr_stats(db_path)
 plot_ppr()
 
 
@@ -0,0 +1,193 @@
+# Queries over the statistics database written by pipeline.py
+# Answers only come from the totals and time series tables the pipeline keeps up to date while it runs
+# (all_stats, encryption_stats, prr_stats, channel_stats and the *_series tables, see PipelineState.init_db),
+# so they take milliseconds whatever the size of the capture, and the live database is only opened read-only:
+#   python query.py types [--since 2024-05-01] [--until 2024-05-02T12:00] [--bucket 3600]
+#   python query.py encryption [--format csv]
+#   python query.py prr [--snr-step 1]
+#   python query.py channels [--since ...]
+# Without --since/--until/--bucket the all-time totals are read, otherwise the time series windows that start
+# in the range, summed per bucket. Old windows are rolled up into hours and days (pipeline.py --rollup),
+# so buckets shorter than that only split recent data.
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+DB_PATH = "iridium_metadata.db"
+SNR_SCALE = 10  # PRR bins per dB, see pipeline.get_prr
+
+
+def connect(db_path):
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+def parse_time(value):
+    """
+    Unix seconds or an ISO 8601 date/time, UTC unless it has an offset.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a unix time or ISO date: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def use_series(args):
+    return args.since is not None or args.until is not None or args.bucket is not None
+
+def series_filter(args):
+    """
+    Bucket expression, WHERE clause and parameters for a query on a time series table.
+    """
+    clauses = []
+    params = []
+    if args.since is not None:
+        clauses.append("window_start >= ?")
+        params.append(int(args.since))
+    if args.until is not None:
+        clauses.append("window_start < ?")
+        params.append(int(args.until))
+    bucket = f"window_start - window_start % {int(args.bucket)}" if args.bucket else "NULL"
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return bucket, where, params
+
+def window_fields(window):
+    if window is None:
+        return {}
+    return {"window": window, "time": datetime.fromtimestamp(window, timezone.utc).isoformat()}
+
+def ratio(part, whole):
+    return round(part / whole, 6) if whole else None
+
+def query_types(conn, args):
+    """
+    Frame type mix: frames per type and their share of all frames.
+    """
+    if use_series(args):
+        bucket, where, params = series_filter(args)
+        rows = conn.execute(f'''
+            SELECT {bucket}, type, SUM(count) FROM type_series {where}
+            GROUP BY 1, type HAVING SUM(count) > 0 ORDER BY 1, type
+        ''', params).fetchall()
+    else:
+        rows = [(None, frame_type, count) for frame_type, count in conn.execute('SELECT type, count FROM all_stats WHERE count > 0 ORDER BY type')]
+
+    totals = {window: count for window, frame_type, count in rows if frame_type == "total"}
+    return [
+        dict(window_fields(window), type=frame_type, count=count, share=ratio(count, totals.get(window)))
+        for window, frame_type, count in rows if frame_type != "total"
+    ]
+
+def query_encryption(conn, args):
+    """
+    Reassembled messages per type and the fraction judged encrypted.
+    """
+    if use_series(args):
+        bucket, where, params = series_filter(args)
+        rows = conn.execute(f'''
+            SELECT {bucket}, type, SUM(enc), SUM(total) FROM type_series {where}
+            GROUP BY 1, type HAVING SUM(total) > 0 ORDER BY 1, type
+        ''', params).fetchall()
+    else:
+        rows = [(None,) + row for row in conn.execute('SELECT type, enc, total FROM encryption_stats WHERE total > 0 ORDER BY type')]
+    return [
+        dict(window_fields(window), type=frame_type, encrypted=enc, messages=total, ratio=ratio(enc, total))
+        for window, frame_type, enc, total in rows
+    ]
+
+def query_prr(conn, args):
+    """
+    Packet reception rate per SNR bucket of snr_step dB.
+    """
+    step = max(1, int(round(args.snr_step * SNR_SCALE)))
+    if use_series(args):
+        bucket, where, params = series_filter(args)
+        rows = conn.execute(f'''
+            SELECT {bucket}, snr / ?, SUM(prr_sum), SUM(count) FROM prr_series {where}
+            GROUP BY 1, 2 HAVING SUM(count) > 0 ORDER BY 1, 2
+        ''', [step] + params).fetchall()
+    else:
+        # prr_stats holds one row per bin, id 1 being bin 0
+        rows = conn.execute('''
+            SELECT NULL, (id - 1) / ?, SUM(prr_sum), SUM(count) FROM prr_stats
+            GROUP BY 2 HAVING SUM(count) > 0 ORDER BY 2
+        ''', (step,)).fetchall()
+    return [
+        dict(window_fields(window), snr=bin * step / SNR_SCALE, prr=ratio(prr_sum, count), frames=count)
+        for window, bin, prr_sum, count in rows
+    ]
+
+def query_channels(conn, args):
+    """
+    Frames per channel and their share of all frames.
+    """
+    names = dict(conn.execute('SELECT channel, name FROM channel_stats'))
+    if use_series(args):
+        bucket, where, params = series_filter(args)
+        rows = conn.execute(f'''
+            SELECT {bucket}, channel, SUM(count) FROM channel_series {where}
+            GROUP BY 1, channel HAVING SUM(count) > 0 ORDER BY 1, channel
+        ''', params).fetchall()
+    else:
+        rows = [(None,) + row for row in conn.execute('SELECT channel, count FROM channel_stats WHERE count > 0 ORDER BY channel')]
+
+    totals = {}
+    for window, channel, count in rows:
+        totals[window] = totals.get(window, 0) + count
+    return [
+        dict(window_fields(window), channel=names.get(channel, str(channel)), index=channel, count=count,
+             share=ratio(count, totals[window]))
+        for window, channel, count in rows
+    ]
+
+def write_rows(rows, fmt, out=sys.stdout):
+    if fmt == "json":
+        json.dump(rows, out, indent=2)
+        out.write("\n")
+    elif rows:
+        writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+QUERIES = {
+    "types": query_types,
+    "encryption": query_encryption,
+    "prr": query_prr,
+    "channels": query_channels,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the statistics collected by pipeline.py.")
+    parser.add_argument("query", choices=list(QUERIES), help="types: frame type mix, encryption: encrypted messages per type, "
+                        "prr: packet reception rate per SNR, channels: frames per channel.")
+    parser.add_argument("--db", type=str, default=DB_PATH, help="Database written by pipeline.py.")
+    parser.add_argument("--since", type=parse_time, help="Only windows starting at or after this time (unix seconds or ISO date, UTC).")
+    parser.add_argument("--until", type=parse_time, help="Only windows starting before this time.")
+    parser.add_argument("--bucket", type=int, help="Sum the time series into buckets of this many seconds.")
+    parser.add_argument("--snr-step", type=float, default=1.0, help="Width of the SNR buckets of the prr query in dB.")
+    parser.add_argument("--format", choices=("json", "csv"), default="json", help="Output format.")
+    parser.add_argument("--timing", action="store_true", help="Report the query time on stderr.")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    try:
+        conn = connect(args.db)
+        rows = QUERIES[args.query](conn, args)
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"Cannot query {args.db}: {e}", file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - t0
+
+    write_rows(rows, args.format)
+    if args.timing:
+        print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms", file=sys.stderr)
@@ -0,0 +1,545 @@
+# Streaming reassembly of messages from frames
+# Heuristic: frames on the same channel, at most GAP_SECONDS apart, with the same frame type belong to one message
+# Messages stay open across processing batches and are closed by the gap rule or once they have been idle too long
+# The payload held by open messages is bounded per channel and in total, see OVERFLOW_POLICIES
+# Frames are put back in time order per channel within a small reorder window before they reach a message
+# The open messages can be checkpointed as JSON and restored after a restart, see Reassembler.checkpoint
+import heapq
+import json
+from collections import Counter, OrderedDict
+from time import monotonic
+
+from util import ByteHistogram
+
+GAP_SECONDS = 10  # A frame further than this from the previous one on its channel starts a new message
+IDLE_TIMEOUT = 30  # Seconds of frame time after which an open message without new frames is closed
+MIN_MESSAGE_LEN = 256  # Messages with fewer hex characters are too short to judge and are dropped
+MAX_MESSAGE_BYTES = 64 * 1024  # Max payload of one open message
+MAX_OPEN_BYTES = 64 * 1024 * 1024  # Memory watermark for the payload of all open messages
+REORDER_WINDOW = 1.0  # Seconds of frame time a frame is held back to let earlier frames of its channel arrive
+HIST_BLOCK = 4096  # Payload bytes collected before they are added to the byte histogram of a message
+LOW_WATERMARK = 0.8  # Shedding stops once the open payload is below this fraction of the watermark
+
+# What happens when a message reaches MAX_MESSAGE_BYTES or all open messages reach MAX_OPEN_BYTES:
+#   drop-oldest  - keep only the newest bytes of the message, drop the least recently active messages
+#   close        - close the message and classify what it has, close the least recently active messages
+#   backpressure - close messages at their cap, but hold upstream while over the watermark (see PipelineState)
+OVERFLOW_POLICIES = ("drop-oldest", "close", "backpressure")
+
+
+class Message:
+    """
+    A message being reassembled on one channel.
+    Frame payloads arrive as hex and are decoded straight into a growable byte buffer, so a long session costs
+    linear time and the classifier can read the buffer without another copy or conversion.
+    The buffer is added to a byte histogram block by block, so the entropy at close time needs no second pass.
+    With early_bytes set, the message is classified once that many bytes leave no doubt and the buffer is released.
+    """
+    __slots__ = ("id", "channel", "type", "start", "last", "seen", "payload", "nibble", "length", "invalid",
+                 "hist", "counted", "early_bytes", "decision")
+
+    def __init__(self, channel, time, early_bytes=None, id=None):
+        self.id = id  # Unique per reassembler, also across checkpoints
+        self.channel = channel
+        self.type = None
+        self.start = time
+        self.last = time
+        self.seen = None  # Wall clock time of the last frame
+        self.payload = bytearray()
+        self.nibble = ""  # Hex digit left over from a frame with an odd number of digits
+        self.length = 0  # Number of hex digits received
+        self.invalid = False
+        self.hist = ByteHistogram()
+        self.counted = 0  # Bytes of the buffer already in the histogram
+        self.early_bytes = early_bytes
+        self.decision = None  # Early classification result
+
+    def append(self, data):
+        self.length += len(data)
+        if self.nibble:
+            data = self.nibble + data
+        self.nibble = data[-1] if len(data) % 2 else ""
+        try:
+            chunk = bytes.fromhex(data[:len(data) - len(self.nibble)])
+        except ValueError:
+            self.invalid = True
+            return
+        if self.decision is not None:
+            return
+        self.payload += chunk
+        pending = len(self.payload) - self.counted
+        # Counted block by block, and once more as the message reaches early_bytes
+        if pending >= HIST_BLOCK or (self.early_bytes and self.hist.total < self.early_bytes <= self.hist.total + pending):
+            self.count()
+            self.decide()
+
+    def decide(self):
+        """
+        Takes the early decision once early_bytes are counted and the entropy leaves no doubt, releasing the buffer.
+        """
+        if self.early_bytes and self.decision is None and self.hist.total >= self.early_bytes:
+            self.decision = self.hist.decide()
+            if self.decision is not None:
+                self.payload = bytearray()
+                self.counted = 0
+
+    def extend(self, other):
+        """
+        Appends the later part of the same message, reassembled from the next chunk of a recording.
+        """
+        self.last = max(self.last, other.last)
+        self.type = self.type or other.type
+        self.length += other.length
+        # An odd hex digit at the end of this part cannot be paired with the next part any more
+        self.invalid = self.invalid or other.invalid or bool(self.nibble)
+        self.nibble = other.nibble
+        if self.decision is not None:
+            return
+        self.count()
+        other.count()
+        self.hist.counts += other.hist.counts
+        self.hist.total += other.hist.total
+        if other.decision is not None:
+            self.decision = other.decision
+            self.payload = bytearray()
+        else:
+            self.payload += other.payload
+        self.counted = len(self.payload)
+        self.decide()
+
+    def count(self):
+        """
+        Adds the bytes received since the last call to the histogram.
+        """
+        if len(self.payload) > self.counted:
+            self.hist.update(memoryview(self.payload)[self.counted:])
+            self.counted = len(self.payload)
+
+    def trim(self, n):
+        """
+        Drops the oldest n bytes of the buffer, they stay in the histogram.
+        """
+        self.count()
+        del self.payload[:n]
+        self.counted = len(self.payload)
+
+    def tail(self):
+        """
+        The bytes of the buffer not yet in the histogram.
+        """
+        return memoryview(self.payload)[self.counted:]
+
+    @property
+    def valid(self):
+        """
+        False if a frame was not valid hex or the hex digits do not add up to whole bytes.
+        """
+        return not self.invalid and not self.nibble
+
+    def view(self):
+        return memoryview(self.payload)
+
+    def snapshot(self):
+        """
+        Copy of the fields that make up the message, for dump_checkpoint().
+        """
+        return {"id": self.id, "channel": self.channel, "type": self.type, "start": self.start, "last": self.last,
+                "payload": bytes(self.payload), "nibble": self.nibble, "length": self.length, "invalid": self.invalid,
+                "counts": self.hist.counts.tolist(), "counted": self.counted, "early_bytes": self.early_bytes,
+                "decision": self.decision}
+
+    @classmethod
+    def restore(cls, fields):
+        """
+        Rebuilds a message from the JSON form of its snapshot, raises ValueError if the fields do not add up.
+        """
+        def check(valid, name):
+            if not valid:
+                raise ValueError(f"invalid {name} in checkpointed message")
+
+        def is_int(value):
+            return isinstance(value, int) and not isinstance(value, bool)
+
+        check(isinstance(fields, dict), "message")
+        check(is_int(fields["id"]) and fields["id"] >= 0, "id")
+        check(is_int(fields["channel"]) and fields["channel"] >= 0, "channel")
+        check(fields["type"] is None or isinstance(fields["type"], str), "type")
+        check(all(isinstance(fields[key], (int, float)) and not isinstance(fields[key], bool) for key in ("start", "last")), "time")
+        check(isinstance(fields["payload"], str), "payload")
+        payload = bytes.fromhex(fields["payload"])
+        check(fields["nibble"] == "" or (isinstance(fields["nibble"], str) and len(fields["nibble"]) == 1
+                                         and fields["nibble"] in "0123456789abcdefABCDEF"), "nibble")
+        check(is_int(fields["length"]) and fields["length"] >= 0, "length")
+        check(isinstance(fields["invalid"], bool), "invalid")
+        counts = fields["counts"]
+        check(isinstance(counts, list) and len(counts) == 256 and all(is_int(c) and c >= 0 for c in counts), "counts")
+        check(is_int(fields["counted"]) and 0 <= fields["counted"] <= len(payload), "counted")
+        check(fields["early_bytes"] is None or is_int(fields["early_bytes"]), "early_bytes")
+        check(fields["decision"] is None or isinstance(fields["decision"], bool), "decision")
+
+        msg = cls(fields["channel"], float(fields["start"]), fields["early_bytes"], fields["id"])
+        msg.type = fields["type"]
+        msg.last = float(fields["last"])
+        msg.payload = bytearray(payload)
+        msg.nibble = fields["nibble"]
+        msg.length = fields["length"]
+        msg.invalid = fields["invalid"]
+        msg.hist.counts[:] = counts
+        msg.hist.total = sum(counts)
+        msg.counted = fields["counted"]
+        msg.decision = fields["decision"]
+        return msg
+
+
+def dump_checkpoint(snapshot):
+    """
+    JSON text of a Reassembler.checkpoint() snapshot, with the payloads as hex.
+    """
+    messages = [dict(fields, payload=fields["payload"].hex()) for fields in snapshot["messages"]]
+    return json.dumps(dict(snapshot, messages=messages))
+
+
+class ReorderBuffer:
+    """
+    Holds frames per channel in a min-heap keyed on their time and releases them in time order
+    once the channel has seen a frame more than window seconds newer. O(log w) per frame for w held frames.
+    Frames older than the last frame released on their channel can no longer be placed and are dropped.
+    """
+
+    def __init__(self, window=REORDER_WINDOW):
+        self.window = window
+        self.heaps = {}
+        self.newest = {}  # Newest frame time per channel
+        self.released = {}  # Time of the last frame released per channel
+        self.seq = 0  # Keeps frames with equal times in arrival order
+
+    def push(self, channel, time, frame):
+        """
+        Adds a frame and returns the frames of its channel that are now due, in time order.
+        Returns None if the frame came too late and was dropped.
+        """
+        if time < self.released.get(channel, time):
+            return None
+        heap = self.heaps.get(channel)
+        if heap is None:
+            heap = self.heaps[channel] = []
+        self.seq += 1
+        heapq.heappush(heap, (time, self.seq, frame))
+        if time > self.newest.get(channel, time - 1):
+            self.newest[channel] = time
+        return self._release(channel, self.newest[channel] - self.window)
+
+    def _release(self, channel, until):
+        heap = self.heaps[channel]
+        due = []
+        while heap and heap[0][0] <= until:
+            time, _, frame = heapq.heappop(heap)
+            self.released[channel] = time
+            due.append(frame)
+        return due
+
+    def release(self, until=None):
+        """
+        Returns the held frames of all channels up to the given time (default: all of them) in time order per channel.
+        """
+        due = []
+        for channel, heap in self.heaps.items():
+            if heap:
+                due.extend(self._release(channel, float("inf") if until is None else until))
+        return due
+
+    def held(self):
+        return sum(len(heap) for heap in self.heaps.values())
+
+
+class Reassembler:
+    """
+    Keeps one open message per channel and does O(1) work per frame.
+    Open messages are ordered by their last activity, so idle ones are found at the front without a full scan.
+    Closed messages long enough to classify are collected until take() is called.
+    """
+
+    def __init__(self, gap=GAP_SECONDS, idle_timeout=IDLE_TIMEOUT, min_len=MIN_MESSAGE_LEN,
+                 max_message_bytes=MAX_MESSAGE_BYTES, max_open_bytes=MAX_OPEN_BYTES, policy="close",
+                 reorder_window=REORDER_WINDOW, early_decision=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.gap = gap
+        self.idle_timeout = idle_timeout
+        self.min_len = min_len
+        self.max_message_bytes = max_message_bytes
+        self.max_open_bytes = max_open_bytes
+        self.policy = policy
+        self.early_decision = early_decision  # Bytes after which a message may be classified before it closes
+        self.reorder = ReorderBuffer(reorder_window) if reorder_window else None
+        self.open = OrderedDict()
+        self.open_bytes = 0  # Payload held by all open messages
+        self.closed = []
+        self.now = None  # Newest frame time seen on any channel
+        self.next_id = 0
+        self.stats = Counter()
+        # With hold_heads(): first message per channel, or None once it can no longer continue an earlier chunk
+        self.heads = None
+        self.held = []  # Closed first messages
+        self.first = None  # Time of the first frame
+
+    def add(self, frame_type, time, channel, data):
+        """
+        Adds a frame to the open message of its channel, closing that message first if the gap is too large.
+        With a reorder window the frame is held back until the frames before it had the chance to arrive.
+        """
+        self.stats["frames"] += 1
+        if self.first is None:
+            self.first = time
+        if self.now is None or time > self.now:
+            self.now = time
+        if self.reorder is None:
+            self._add(frame_type, time, channel, data)
+            return
+        due = self.reorder.push(channel, time, (frame_type, time, channel, data))
+        if due is None:
+            self.stats["late_frames"] += 1
+            return
+        for frame in due:
+            self._add(*frame)
+
+    def _release(self, until=None):
+        if self.reorder is not None:
+            for frame in self.reorder.release(until):
+                self._add(*frame)
+
+    def _add(self, frame_type, time, channel, data):
+        msg = self.open.get(channel)
+        if msg is not None and time > msg.last + self.gap:
+            self.stats["closed_gap"] += 1
+            self._close(channel)
+            msg = None
+
+        if msg is None:
+            msg = Message(channel, time, self.early_decision, self.next_id)
+            self.next_id += 1
+            self.open[channel] = msg
+            if self.heads is not None and channel not in self.heads:
+                window = self.reorder.window if self.reorder is not None else 0
+                self.heads[channel] = msg if time <= self.first + self.gap + window else None
+        else:
+            self.open.move_to_end(channel)
+            msg.last = max(msg.last, time)
+        msg.seen = monotonic()
+
+        # Frames of another type do not end a message, they are just not part of it
+        if data and (msg.type is None or msg.type == frame_type):
+            msg.type = frame_type
+            size = len(msg.payload)
+            msg.append(data)
+            self.open_bytes += len(msg.payload) - size
+            if len(msg.payload) > self.max_message_bytes:
+                self._overflow(channel, msg)
+
+        if self.open_bytes > self.max_open_bytes and self.policy != "backpressure":
+            self.shed()
+
+    def _overflow(self, channel, msg):
+        if self.policy == "drop-oldest":
+            # Ring buffer: keep the newest max_message_bytes
+            excess = len(msg.payload) - self.max_message_bytes
+            msg.trim(excess)
+            self.open_bytes -= excess
+            self.stats["dropped_bytes"] += excess
+        else:
+            self.stats["forced_close"] += 1
+            self._close(channel)
+
+    def overloaded(self):
+        return self.open_bytes > self.max_open_bytes
+
+    def shed(self):
+        """
+        Frees open messages, least recently active first, until the open payload is below the low watermark.
+        """
+        self.stats["shed"] += 1
+        while self.open and self.open_bytes > self.max_open_bytes * LOW_WATERMARK:
+            channel = next(iter(self.open))
+            if self.policy == "drop-oldest":
+                msg = self.open.pop(channel)
+                self.open_bytes -= len(msg.payload)
+                self.stats["dropped_messages"] += 1
+                self.stats["dropped_bytes"] += len(msg.payload)
+            else:
+                self.stats["forced_close"] += 1
+                self._close(channel)
+
+    def evict_stale(self, seconds):
+        """
+        Closes messages that have not seen a frame for the given number of wall clock seconds.
+        Used while upstream is held back, when frame time does not advance.
+        """
+        self._release()
+        limit = monotonic() - seconds
+        while self.open:
+            channel, msg = next(iter(self.open.items()))
+            if msg.seen is not None and msg.seen >= limit:
+                break
+            self.stats["closed_idle"] += 1
+            self._close(channel)
+
+    def _close(self, channel):
+        msg = self.open.pop(channel)
+        self.open_bytes -= len(msg.payload)
+        if self.heads is not None and self.heads.get(channel) is msg:
+            self.held.append(msg)
+            return
+        self.finish(msg)
+
+    def finish(self, msg):
+        """
+        Hands a closed message on for classification if it is long enough.
+        """
+        if not msg.length:
+            return
+        if msg.length > self.min_len:
+            self.stats["messages"] += 1
+            self.closed.append(msg)
+        else:
+            self.stats["too_short"] += 1
+
+    def evict(self, now=None):
+        """
+        Closes messages that have not seen a frame for idle_timeout seconds before now (default: newest frame time).
+        """
+        now = self.now if now is None else now
+        if now is None:
+            return
+        # Frames held back on channels that went quiet
+        if self.reorder is not None:
+            self._release(now - self.reorder.window)
+        while self.open:
+            channel, msg = next(iter(self.open.items()))
+            if msg.last + self.idle_timeout >= now:
+                break
+            self.stats["closed_idle"] += 1
+            self._close(channel)
+
+    def close_all(self):
+        self._release()
+        for channel in list(self.open):
+            self._close(channel)
+
+    def flush(self):
+        """
+        Adds the frames held for reordering to their messages.
+        """
+        self._release()
+
+    def hold_heads(self):
+        """
+        For a chunk of a longer recording: the first message of a channel that starts within the gap of the first frame
+        may continue a message of the previous chunk, so it is not classified but returned by take_boundary().
+        """
+        self.heads = {}
+
+    def take_boundary(self):
+        """
+        Returns the held first messages and the messages still open, for stitch() in the process that merges the chunks.
+        A message still open since the start of the chunk is in both lists.
+        """
+        heads = self.held + [msg for channel, msg in (self.heads or {}).items() if msg is not None and self.open.get(channel) is msg]
+        tails = list(self.open.values())
+        self.held = []
+        self.open.clear()
+        self.open_bytes = 0
+        return heads, tails
+
+    def stitch(self, carry, heads, tails):
+        """
+        Joins the first messages of a chunk to the messages open at the end of the previous chunk of the file,
+        carry maps their channels to them, with the gap rule of a single pass over the file.
+        Messages that ended at the boundary are closed, the open ones are returned as the carry for the next chunk.
+        """
+        open_ids = {id(msg) for msg in tails}
+        joined = {}
+        for msg in heads:
+            prev = carry.pop(msg.channel, None)
+            if (prev is not None and msg.start <= prev.last + self.gap
+                    and (prev.type is None or msg.type is None or prev.type == msg.type)):
+                if (self.policy == "drop-oldest"
+                        or len(prev.payload) + len(msg.payload) <= self.max_message_bytes):
+                    prev.extend(msg)
+                    if self.policy == "drop-oldest" and len(prev.payload) > self.max_message_bytes:
+                        excess = len(prev.payload) - self.max_message_bytes
+                        prev.trim(excess)
+                        self.stats["dropped_bytes"] += excess
+                    self.stats["joined"] += 1
+                    if id(msg) in open_ids:
+                        joined[msg.channel] = prev
+                    else:
+                        self.finish(prev)
+                    continue
+                self.stats["forced_close"] += 1
+            if prev is not None:
+                self.finish(prev)
+            if id(msg) not in open_ids:
+                self.finish(msg)
+        for prev in carry.values():
+            self.finish(prev)
+        return {msg.channel: joined.get(msg.channel, msg) for msg in tails}
+
+    def open_ids(self):
+        return [msg.id for msg in self.open.values()]
+
+    def checkpoint(self):
+        """
+        Snapshot of the open messages, turned into text by dump_checkpoint().
+        Only copies, so it can be taken under the pipeline lock and serialized outside of it.
+        Frames still held for reordering are not included.
+        """
+        return {"next_id": self.next_id, "now": self.now, "messages": [msg.snapshot() for msg in self.open.values()]}
+
+    def restore(self, data, ids):
+        """
+        Reopens the messages of a dump_checkpoint() text whose id is in ids, the messages open when the counters were
+        last saved. Messages closed and counted since the checkpoint was taken are left out, so nothing is counted twice.
+        Returns the number of messages restored, raises ValueError if the checkpoint is not valid.
+        """
+        try:
+            state = json.loads(data)
+            next_id, now = state["next_id"], state["now"]
+            if not isinstance(next_id, int) or not (now is None or isinstance(now, (int, float))):
+                raise ValueError("invalid checkpoint header")
+            messages = [Message.restore(fields) for fields in state["messages"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"incomplete checkpoint: {e}")
+        keep = set(ids)
+        self.next_id = max(self.next_id, next_id)
+        if now is not None and (self.now is None or now > self.now):
+            self.now = now
+        restored = 0
+        for msg in messages:
+            if msg.id not in keep or msg.channel in self.open:
+                continue
+            msg.seen = monotonic()
+            self.open[msg.channel] = msg
+            self.open_bytes += len(msg.payload)
+            restored += 1
+        return restored
+
+    def take(self):
+        """
+        Returns the messages closed since the last call.
+        """
+        closed = self.closed
+        self.closed = []
+        return closed
+
+    def report(self):
+        held = self.reorder.held() if self.reorder is not None else 0
+        return (f"reassembly: {self.stats['frames']} frames, {held} held for reordering, "
+                f"{self.stats['late_frames']} late frames dropped, "
+                f"{len(self.open)} open ({self.open_bytes} bytes), "
+                f"{self.stats['messages']} messages, {self.stats['too_short']} too short, "
+                f"{self.stats['joined']} joined across chunks, "
+                f"closed by gap {self.stats['closed_gap']} / idle {self.stats['closed_idle']}, "
+                f"overflow ({self.policy}): {self.stats['forced_close']} forced closes, "
+                f"{self.stats['dropped_messages']} dropped messages, {self.stats['dropped_bytes']} dropped bytes, "
+                f"{self.stats['backpressure']} backpressure waits ({self.stats['backpressure_ms']} ms)")
+
@@ -0,0 +1,162 @@
+# Multi-process sharding for the pipeline
+# Lines are routed to worker processes by a key (the channel index), so everything that is reassembled
+# per channel stays inside one worker and the workers only have to exchange counters with the coordinator
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+from stages import Batcher
+
+SHARD_BATCH = 200  # Lines sent to a worker per queue message, amortizes pickling and locking
+SHARD_BATCH_AGE_MS = 200  # Max time a line waits for its batch to fill up on a quiet shard
+SHARD_QUEUE_SIZE = 64  # Max number of batches waiting in front of a worker
+POLL_INTERVAL = 1.0  # Seconds between liveness checks of the workers while waiting on their queues
+# Workers are started fresh instead of forked, the coordinator already runs threads (reader, writer, parser pipes)
+# whose locks a forked child could inherit in a held state
+MP_START_METHOD = "spawn"
+
+
+class ShardPool:
+    """
+    Runs target(shard_id, lines_queue, results_queue, *args) in n worker processes.
+    Lines are sent in batches to the worker selected by key(line) % n, a None batch tells a worker to finish.
+    A batch is sent once it holds batch_size lines or its oldest line is older than max_age_ms.
+    Workers put (shard_id, result) on the results queue and (shard_id, None) once they are done,
+    on_result(result) is called from a collector thread in the coordinator for every result.
+    A worker that exits without sending (shard_id, None) is given up on: its lines are dropped and counted.
+    """
+
+    def __init__(self, n, target, key, on_result, args=(), batch_size=SHARD_BATCH, max_age_ms=SHARD_BATCH_AGE_MS,
+                 maxsize=SHARD_QUEUE_SIZE):
+        self.name = "shards"
+        self.n = n
+        self.key = key
+        self.on_result = on_result
+
+        ctx = mp.get_context(MP_START_METHOD)
+        self.lines = [ctx.Queue(maxsize=maxsize) for _ in range(n)]
+        self.results = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=target, args=(shard, self.lines[shard], self.results) + tuple(args), daemon=True)
+            for shard in range(n)
+        ]
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.ticker = threading.Thread(target=self._tick, daemon=True)
+        self.running = True
+
+        # The reader thread adds lines while the ticker flushes batches that got too old
+        self.lock = threading.Lock()
+        self.pending = [Batcher(batch_size, max_age_ms=max_age_ms) for _ in range(n)]
+        self.sent = [0 for _ in range(n)]
+        self.lost = [0 for _ in range(n)]  # Lines sent to a worker that died
+        self.finished = [False for _ in range(n)]
+        self.merged = 0
+        self.stall_time = 0.0
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.collector.start()
+        self.ticker.start()
+        return self
+
+    def shard_of(self, line):
+        try:
+            key = self.key(line)
+        except Exception:
+            key = None
+        return 0 if key is None else key % self.n
+
+    def put(self, line):
+        shard = self.shard_of(line)
+        with self.lock:
+            reason = self.pending[shard].add(line)
+            if reason:
+                self._send(shard, reason)
+
+    def _tick(self):
+        while self.running:
+            time.sleep(0.05)
+            with self.lock:
+                for shard in range(self.n):
+                    reason = self.pending[shard].due()
+                    if reason:
+                        self._send(shard, reason)
+
+    def _put(self, shard, batch):
+        """
+        Queues a batch for a worker, blocking while its queue is full. Returns False if the worker died.
+        """
+        try:
+            self.lines[shard].put_nowait(batch)
+            return True
+        except queue.Full:
+            pass
+        t0 = time.monotonic()
+        try:
+            while self.processes[shard].exitcode is None:
+                try:
+                    self.lines[shard].put(batch, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stall_time += time.monotonic() - t0
+
+    def _send(self, shard, reason):
+        batch = self.pending[shard].take(reason)
+        if self.finished[shard] or not self._put(shard, batch):
+            self.lost[shard] += len(batch)
+            return
+        self.sent[shard] += len(batch)
+
+    def _check_workers(self):
+        # Only called once the results queue ran empty, so whatever a dead worker sent was merged already
+        for shard, process in enumerate(self.processes):
+            if not self.finished[shard] and process.exitcode is not None:
+                print(f"Shard {shard} exited with code {process.exitcode} before finishing, its lines are dropped")
+                self.finished[shard] = True
+
+    def _collect(self):
+        while not all(self.finished):
+            try:
+                shard, result = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if result is None:
+                self.finished[shard] = True
+                continue
+            try:
+                self.on_result(result)
+            except Exception as e:
+                print(f"Error merging results of shard {shard}: {e}")
+            self.merged += 1
+
+    def stop(self, timeout=None):
+        """
+        Sends the remaining lines, tells the workers to finish and waits until all their results are merged.
+        """
+        self.running = False
+        self.ticker.join()
+        for shard in range(self.n):
+            if self.pending[shard].items:
+                self._send(shard, "final")
+            if not self.finished[shard]:
+                self._put(shard, None)
+        self.collector.join(timeout)
+        for process in self.processes:
+            process.join(timeout)
+
+    def depth(self):
+        try:
+            return sum(q.qsize() for q in self.lines)
+        except NotImplementedError:  # qsize is not available on macOS
+            return -1
+
+    def report(self):
+        return (f"{self.name}: {self.n} workers, depth {self.depth()} batches, sent {sum(self.sent)}, "
+                f"per worker {self.sent}, lost {sum(self.lost)}, merged {self.merged}, stalled {self.stall_time:.2f}s, "
+                f"flushes: {[batcher.report() for batcher in self.pending]}")
@@ -0,0 +1,152 @@
+# Threaded stages for the pipeline
+# Every stage owns a bounded input queue and a worker thread, so a slow stage (SQLite, entropy, BER)
+# only backs up its own queue instead of stalling the capture reading gr-iridium output
+import queue
+import threading
+import time
+from collections import Counter
+
+QUEUE_SIZE = 10000  # Max number of items waiting in front of a stage
+
+_STOP = object()
+
+
+class Batcher:
+    """
+    Collects items until max_lines items, max_bytes bytes or an age of max_age_ms is reached, whichever comes first.
+    Counts why every batch was flushed so the limits can be tuned per deployment.
+    """
+
+    def __init__(self, max_lines=1, max_bytes=None, max_age_ms=None):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.max_age = max_age_ms / 1000 if max_age_ms else None
+        self.items = []
+        self.size = 0
+        self.started = None
+        self.reasons = Counter()
+
+    def add(self, item):
+        """
+        Adds an item and returns the flush reason if the batch is now due, None otherwise.
+        """
+        if not self.items:
+            self.started = time.monotonic()
+        self.items.append(item)
+        if self.max_bytes:
+            self.size += len(item)
+        return self.due()
+
+    def due(self):
+        if not self.items:
+            return None
+        if len(self.items) >= self.max_lines:
+            return "lines"
+        if self.max_bytes and self.size >= self.max_bytes:
+            return "bytes"
+        if self.max_age and time.monotonic() - self.started >= self.max_age:
+            return "age"
+        return None
+
+    def timeout(self):
+        """
+        Seconds until the current batch is due by age, None if there is nothing to wait for.
+        """
+        if not self.items or not self.max_age:
+            return None
+        return max(0.0, self.started + self.max_age - time.monotonic())
+
+    def take(self, reason):
+        self.reasons[reason] += 1
+        items = self.items
+        self.items = []
+        self.size = 0
+        self.started = None
+        return items
+
+    def report(self):
+        return ", ".join(f"{reason} {count}" for reason, count in sorted(self.reasons.items())) or "none"
+
+
+class Stage:
+    """
+    Runs handler(batch, final) in a dedicated thread on batches of items taken from a bounded queue.
+    Batches are flushed by a Batcher built from the flush arguments (max_lines, max_bytes, max_age_ms).
+    on_item(item) is called for every item as soon as it is dequeued, before it is added to the batch.
+    Tracks queue depth, the time producers spent blocked on a full queue and the time spent in the handler.
+    """
+
+    def __init__(self, name, handler, flush=None, maxsize=QUEUE_SIZE, on_item=None):
+        self.name = name
+        self.handler = handler
+        self.batcher = Batcher(**(flush or {}))
+        self.on_item = on_item
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        self.received = 0
+        self.processed = 0
+        self.stall_time = 0.0
+        self.busy_time = 0.0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, item):
+        """
+        Queues an item, blocking while the stage is full. The time spent blocked is counted as stall time.
+        """
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            t0 = time.monotonic()
+            self.queue.put(item)
+            self.stall_time += time.monotonic() - t0
+
+    def stop(self, timeout=None):
+        """
+        Lets the stage finish what is queued, runs the handler a final time and waits for the thread.
+        """
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    def _handle(self, batch, final=False):
+        t0 = time.monotonic()
+        try:
+            self.handler(batch, final)
+        except Exception as e:
+            print(f"Error in {self.name} stage: {e}")
+        self.busy_time += time.monotonic() - t0
+        self.processed += len(batch)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.batcher.timeout())
+            except queue.Empty:
+                # Nothing arrived before the batch got too old
+                reason = self.batcher.due()
+                if reason:
+                    self._handle(self.batcher.take(reason))
+                continue
+
+            if item is _STOP:
+                self._handle(self.batcher.take("final"), final=True)
+                return
+            self.received += 1
+            if self.on_item is not None:
+                try:
+                    self.on_item(item)
+                except Exception as e:
+                    print(f"Error in {self.name} stage: {e}")
+            reason = self.batcher.add(item)
+            if reason:
+                self._handle(self.batcher.take(reason))
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def report(self):
+        return (f"{self.name}: depth {self.depth()}/{self.queue.maxsize}, processed {self.processed}, "
+                f"stalled {self.stall_time:.2f}s, busy {self.busy_time:.2f}s, flushes: {self.batcher.report()}")
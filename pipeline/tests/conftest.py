@@ -0,0 +1,5 @@
+# The pipeline modules import each other by bare name, so the tests run with pipeline/ on the path
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,134 @@
+import os
+import random
+import sys
+
+import pytest
+
+import ber
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gr-iridiumtx", "utils"))
+from iridium_message import IridiumMessage
+
+SAMPLE_BITS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gr-iridiumtx", "sample_data", "ring-alerts.bits")
+ENCODER = IridiumMessage()
+
+
+def raw_line(bits):
+    return f"RAW: i-1740053316-t1 0001000.0000 1626299928 N:20.00-100.00 I:00000000001 100% 0.00197 {len(bits) // 2:3d} {bits}"
+
+def random_bits(rng, n):
+    return format(rng.getrandbits(n), f"0{n}b")
+
+def encode_lcw(ft, lcw_type, code, lcw3):
+    """LCW bits as gr-iridiumtx transmits them."""
+    lcw1 = format(ENCODER.bch_encode(ft, 29, input_len=3, gen_len=5), "07b")
+    lcw2 = format(ENCODER.bch_encode(lcw_type << 4 | code, 465, input_len=6, gen_len=9), "014b")[:-1]
+    lcw3 = format(ENCODER.bch_encode(lcw3, 41, input_len=21, gen_len=6), "026b")
+    return ENCODER.flip_bits(ENCODER.interleave_lcw(lcw1, lcw2, lcw3))
+
+def encode_ibc(rng):
+    """IBC header and 4 blocks of random BCH(31,21) words as gr-iridiumtx interleaves them."""
+    header = rng.choice([h for h in range(64) if ber.HEADER_ERRORS[h] == 0])
+    blocks = ""
+    for _ in range(4):
+        words = []
+        for _ in range(2):
+            word = format(ENCODER.bch_encode(rng.getrandbits(21), ber.ringalert_bch_poly), "031b")
+            words.append(word + str(word.count("1") % 2))
+        blocks += ENCODER.interleave2(*words)
+    return format(header, "06b") + blocks
+
+def flip(bits, *positions):
+    bits = list(bits)
+    for position in positions:
+        bits[position] = "1" if bits[position] == "0" else "0"
+    return "".join(bits)
+
+
+@pytest.mark.parametrize("access", [ber.iridium_access, ber.uplink_access])
+def test_lcw_accepted(access):
+    rng = random.Random(1)
+    for lcw_type, codes in ber.LCW_CODES.items():
+        for code in codes:
+            for ft in ber.LCW_FT:
+                lcw = encode_lcw(ft, lcw_type, code, rng.getrandbits(21))
+                result = ber.measure_ber(raw_line(access + lcw + random_bits(rng, 266)))
+                assert result[:3] == ("LCW", 0, ber.ACCESS_BITS + ber.LCW_BITS)
+
+def test_lcw_bit_errors():
+    rng = random.Random(2)
+    lcw = encode_lcw(3, 0, 15, rng.getrandbits(21))
+    for errors in range(1, ber.LCW_MAX_ERRORS + 1):
+        positions = rng.sample(range(ber.LCW_BITS), errors)
+        result = ber.measure_ber(raw_line(ber.uplink_access + flip(lcw, *positions) + random_bits(rng, 266)))
+        assert result is not None and result[:2] == ("LCW", errors)
+
+def test_lcw_unknown_fields_rejected():
+    rng = random.Random(3)
+    for lcw_type in range(4):
+        for code in range(16):
+            for ft in range(8):
+                if ft in ber.LCW_FT and code in ber.LCW_CODES.get(lcw_type, ()):
+                    continue
+                lcw = encode_lcw(ft, lcw_type, code, rng.getrandbits(21))
+                assert ber.measure_ber(raw_line(ber.uplink_access + lcw + random_bits(rng, 266))) is None
+
+@pytest.mark.parametrize("access", [ber.iridium_access, ber.uplink_access])
+def test_noise_rejected(access):
+    rng = random.Random(4)
+    bursts = 5000
+    types = {}
+    for _ in range(bursts):
+        result = ber.measure_ber(raw_line(access + random_bits(rng, rng.randrange(ber.LCW_BITS, 420))))
+        if result is not None:
+            types[result[0]] = types.get(result[0], 0) + 1
+    # Random bits pass the LCW checks about 0.13% of the time, IBC and IRA practically never
+    assert types.get("LCW", 0) <= bursts // 200
+    assert types.get("IBC", 0) + types.get("IRA", 0) <= 2
+
+def test_recorded_ring_alerts():
+    with open(SAMPLE_BITS) as f:
+        lines = [line for line in f if line.startswith("RAW:")]
+    results = [ber.measure_ber(line) for line in lines]
+    assert {result[0] for result in results if result is not None} == {"IRA"}
+    assert sum(result is not None for result in results) >= len(lines) - 2
+
+def test_ibc_block_order():
+    bits = ber.iridium_access + encode_ibc(random.Random(5))
+    assert ber.measure_ber(raw_line(bits))[:3] == ("IBC", 0, len(bits))
+    assert ber.calculate_ber(raw_line(flip(bits, 40, 100)))[0] == 2
+
+def test_batch_matches_scalar():
+    rng = random.Random(6)
+    with open(SAMPLE_BITS) as f:
+        lines = [line.rstrip("\n") for line in f if line.startswith("RAW:")]
+    for _ in range(300):
+        lcw_type = rng.choice(list(ber.LCW_CODES))
+        lcw = encode_lcw(rng.choice(ber.LCW_FT), lcw_type, rng.choice(ber.LCW_CODES[lcw_type]), rng.getrandbits(21))
+        bits = rng.choice((ber.iridium_access, ber.uplink_access)) + lcw + random_bits(rng, rng.randrange(0, 300))
+        lines.append(raw_line(flip(bits, *rng.sample(range(len(bits)), rng.choice((0, 1, 2, 3))))))
+    for _ in range(200):
+        bits = ber.iridium_access + encode_ibc(rng) + random_bits(rng, rng.randrange(0, 40))
+        lines.append(raw_line(flip(bits, *rng.sample(range(len(bits)), rng.choice((0, 1, 2, 3, 6))))))
+    for _ in range(2000):
+        bits = rng.choice((ber.iridium_access, ber.uplink_access)) + random_bits(rng, rng.randrange(1, 420))
+        lines.append(raw_line(bits[:rng.randrange(10, len(bits) + 1)]))
+    # Recorded ring alerts with bit errors, A: lines and lines that are no bursts
+    for line in lines[:14]:
+        prefix, bits = line.rsplit(" ", 1)
+        lines.append(prefix + " " + flip(bits, *rng.sample(range(len(bits)), rng.choice((1, 4, 10)))))
+    lines.append(lines[0].replace("N:20.53-104.41", "A:OK"))
+    lines += ["", "RAW: garbage", "IRA: i-1740053316-t1 0001000.0000 1626299928 100% -40.00|-100.00|20.00 DL"]
+
+    types, bit_errors, checked, snr, noise, len_bits = ber.batch_measure_ber(lines)
+    measured = 0
+    for row, line in enumerate(lines):
+        res = ber.measure_ber(line)
+        if res is None:
+            assert types[row] == -1
+            continue
+        measured += 1
+        assert (ber.FRAME_TYPES[types[row]], bit_errors[row], checked[row], len_bits[row]) == (res[0], res[1], res[2], res[5])
+        assert snr[row] == res[3] or (res[3] != res[3] and snr[row] != snr[row])
+    assert measured > 400
+    assert len(ber.batch_measure_ber([])[0]) == 0
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import gzip
+import os
+import random
+import shutil
+import sqlite3
+
+import pytest
+
+import pipeline
+from parser_worker import PARSER_CMD
+from pipeline import PipelineState, start_writer
+
+SAMPLE_BITS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "gr-iridiumtx", "sample_data", "ring-alerts.bits")
+
+
+def new_state(tmp_path):
+    state = PipelineState(db_path=str(tmp_path / "stats.db"))
+    state.init_db()
+    return state
+
+def test_rollup_error_does_not_replay_changes(tmp_path):
+    state = new_state(tmp_path)
+    rollups = []
+
+    def locked_rollup(now=None):
+        rollups.append(now)
+        raise sqlite3.OperationalError("database is locked")
+
+    state.rollup = locked_rollup
+    state.last_rollup = 0
+    writer = start_writer(state)
+    for i in range(5):
+        state.process_frame("IRA", 1740053316.0 + i, 3, None)
+    writer.put(state.take_changes())
+    # Before the fix the writer retried the committed changes as long as the rollup found the database locked
+    writer.stop(timeout=10)
+    assert not writer.thread.is_alive()
+
+    conn = state.connect()
+    assert conn.execute("SELECT count FROM all_stats WHERE type = 'IRA'").fetchone() == (5,)
+    assert conn.execute("SELECT SUM(count) FROM type_series WHERE type = 'IRA'").fetchone() == (5,)
+    assert len(rollups) == 1 and writer.retries == 0 and writer.failed == 0
+    state.close_db()
+
+def test_series_bucketed_by_frame_time(tmp_path):
+    state = new_state(tmp_path)
+    start = 1740053316  # Recording of Feb 20 2025, as in the file name of gr-iridium output
+    state.process_frame("IRA", start + 1.5, 3, None)
+    state.process_frame("IRA", start + 2.0, 3, None)
+    state.process_frame("IBC", start + 61.0, 4, None)
+    with open(SAMPLE_BITS) as f:
+        state.get_prr([line for line in f if line.startswith("RAW:")])
+    changes = state.take_changes()
+
+    window = start // pipeline.SERIES_WINDOW * pipeline.SERIES_WINDOW
+    assert changes["type_series"][(window, "IRA")] == (2, 0, 0)
+    assert changes["type_series"][(window + pipeline.SERIES_WINDOW, "IBC")] == (1, 0, 0)
+    assert changes["type_series"][(window, "total")] == (2, 0, 0)
+    assert changes["channel_series"][(window, 3)] == (2,)
+    # The sample bursts were recorded over about an hour and a half from the start of the file
+    prr_windows = {row_window for row_window, _ in changes["prr_series"]}
+    assert min(prr_windows) >= window and max(prr_windows) < window + 2 * 3600
+    assert sum(count for _, count in changes["prr_series"].values()) == state.prr_count_frames.sum()
+    assert state.take_changes() is None
+    state.close_db()
+
+def test_series_merged_from_workers(tmp_path):
+    state = new_state(tmp_path)
+    worker = PipelineState(db_path=str(tmp_path / "worker.db"))
+    worker.process_frame("IRA", 1740053316.0, 3, None)
+    state.merge_stats(worker.take_stats())
+    worker.process_frame("IRA", 1740053317.0, 3, None)
+    state.merge_stats(worker.take_stats())
+    window = 1740053316 // pipeline.SERIES_WINDOW * pipeline.SERIES_WINDOW
+    assert state.take_changes()["type_series"][(window, "IRA")] == (2, 0, 0)
+    state.close_db()
+
+def test_async_sources_reassemble_apart(tmp_path, monkeypatch):
+    state = new_state(tmp_path)
+    # The same frame heard by two receivers on one channel is one message per receiver
+    line = "IDA: i-1740053316-t1 000001000.0000 1626270833 100% -40.00|-100.00|20.00 179 DL [00.11.22.33.44.55.66.77]"
+    sources = []
+
+    class FakeSource:
+        def __init__(self, name, cmd, on_parsed, on_raw, flush=None, debug=False):
+            sources.append((on_parsed, on_raw))
+
+    async def run_sources(capture_sources):
+        for on_parsed, on_raw in sources:
+            on_parsed([line], False)
+        for on_parsed, on_raw in sources:
+            on_parsed([], True)
+            on_raw([], True)
+
+    monkeypatch.setattr(pipeline, "AsyncSource", FakeSource)
+    monkeypatch.setattr(pipeline, "run_sources", run_sources)
+    asyncio.run(pipeline.collect_async(["a.conf", "b.conf"], [state, state], pipeline.default_flush()))
+
+    assert state.all_types["IDA"] == 2
+    assert state.reassembler.stats["frames"] == 2 and state.reassembler.stats["too_short"] == 2
+    assert not state.reassembler.open
+    assert state.connect().execute("SELECT count FROM all_stats WHERE type = 'IDA'").fetchone() == (2,)
+    state.close_db()
+
+def ida_line(timestamp, freq, payload):
+    return (f"IDA: i-1740053316-t1 {(timestamp - 1740053316) * 1000:012.4f} {freq} 100% -40.00|-100.00|20.00 179 DL "
+            f"[{'.'.join(payload[i:i + 2] for i in range(0, len(payload), 2))}]")
+
+def run_chunked(tmp_path, lines, chunk_lines):
+    path = tmp_path / "parsed.txt.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(lines) + "\n")
+    state = PipelineState(db_path=str(tmp_path / f"chunks-{chunk_lines}.db"))
+    state.init_db()
+    plan_chunks = pipeline.ingest.plan_chunks
+    pipeline.ingest.plan_chunks = functools.partial(plan_chunks, chunk_lines=chunk_lines)
+    try:
+        pipeline.run_offline([str(path)], "parsed", state=state, workers=2)
+    finally:
+        pipeline.ingest.plan_chunks = plan_chunks
+    return state
+
+def test_offline_messages_cross_chunks(tmp_path):
+    rng = random.Random(7)
+    lines = []
+    for i in range(40):
+        # A message over the whole file on one channel, two separated by more than GAP_SECONDS on another
+        lines.append(ida_line(1740053400 + i, 1626270833, rng.randbytes(8).hex()))
+        if i < 15 or i >= 26:
+            lines.append(ida_line(1740053400 + i, 1622000000, rng.randbytes(16).hex()))
+    whole = run_chunked(tmp_path, lines, len(lines))
+    chunked = run_chunked(tmp_path, lines, 7)
+    for state in (whole, chunked):
+        assert state.total_type_counts["IDA"]["total"] == 3
+        assert state.reassembler.stats["messages"] == 3 and state.reassembler.stats["too_short"] == 0
+        state.close_db()
+    assert chunked.reassembler.stats["joined"] > 0
+
+@pytest.mark.skipif(shutil.which(PARSER_CMD[0]) is not None, reason="needs iridium-toolkit to be missing")
+def test_offline_failed_chunks_not_checkpointed(tmp_path):
+    state = new_state(tmp_path)
+    pipeline.run_offline([SAMPLE_BITS], "bits", state=state, workers=1)
+    checkpoint = state.load_checkpoint()
+    assert pipeline.offset_key(SAMPLE_BITS) not in checkpoint
+    assert state.prr_count_frames.sum() == 0
+    state.close_db()
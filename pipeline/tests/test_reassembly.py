@@ -0,0 +1,213 @@
+import json
+import random
+
+import pytest
+
+from pipeline import PipelineState
+from reassembly import MIN_MESSAGE_LEN, Message, Reassembler, dump_checkpoint
+
+
+def hex_payload(rng, n):
+    return rng.randbytes(n).hex()
+
+def test_checkpoint_restore():
+    rng = random.Random(1)
+    reassembler = Reassembler(reorder_window=0, early_decision=4096)
+    reassembler.add("IDA", 1.0, 3, hex_payload(rng, 5000))
+    reassembler.add("IDA", 1.0, 4, hex_payload(rng, 100) + "a")
+    text = dump_checkpoint(reassembler.checkpoint())
+
+    restored = Reassembler(reorder_window=0)
+    assert restored.restore(text, reassembler.open_ids()) == 2
+    for channel, msg in reassembler.open.items():
+        copy = restored.open[channel]
+        assert (copy.id, copy.type, copy.start, copy.length, copy.nibble, copy.decision, copy.counted) == \
+               (msg.id, msg.type, msg.start, msg.length, msg.nibble, msg.decision, msg.counted)
+        assert copy.payload == msg.payload and (copy.hist.counts == msg.hist.counts).all()
+    assert restored.open_bytes == reassembler.open_bytes
+    assert restored.next_id == reassembler.next_id
+
+def test_restore_rejects_invalid_checkpoints():
+    reassembler = Reassembler(reorder_window=0)
+    reassembler.add("IDA", 1.0, 3, "00" * 200)
+    state = json.loads(dump_checkpoint(reassembler.checkpoint()))
+    broken = [
+        b"\x80\x05pickle",
+        "{}",
+        json.dumps(dict(state, next_id="1")),
+        json.dumps(dict(state, messages=[dict(state["messages"][0], payload="xyz")])),
+        json.dumps(dict(state, messages=[dict(state["messages"][0], counts=[0] * 255)])),
+        json.dumps(dict(state, messages=[dict(state["messages"][0], counted=10 ** 6)])),
+        json.dumps(dict(state, messages=[dict(state["messages"][0], channel=None)])),
+    ]
+    for text in broken:
+        with pytest.raises(ValueError):
+            Reassembler().restore(text, [0])
+
+@pytest.mark.parametrize("early_bytes", [600, 1000, 5000])
+def test_early_decision_at_early_bytes(early_bytes):
+    rng = random.Random(2)
+    msg = Message(3, 1.0, early_bytes)
+    while msg.length // 2 + 50 < early_bytes:
+        msg.append(hex_payload(rng, 50))
+        assert msg.decision is None
+    msg.append(hex_payload(rng, 50))
+    assert msg.decision is True and not msg.payload
+    assert msg.hist.total < early_bytes + 50
+
+def test_early_decision_plain_text():
+    msg = Message(3, 1.0, 200)
+    for _ in range(10):
+        msg.append(b"a plain text message, ".hex())
+    assert msg.decision is False
+
+def frames(reassembler, channel, times, rng, size=200):
+    sent = []
+    for time in times:
+        data = hex_payload(rng, size)
+        reassembler.add("IDA", time, channel, data)
+        sent.append(data)
+    return sent
+
+def test_message_spans_batches():
+    rng = random.Random(3)
+    reassembler = Reassembler(reorder_window=0)
+    sent = []
+    for batch in range(3):
+        sent += frames(reassembler, 5, [batch * 4 + i for i in range(4)], rng)
+        # The end of a batch only closes messages that went idle
+        reassembler.evict()
+        assert not reassembler.take() and 5 in reassembler.open
+    frames(reassembler, 5, [11 + reassembler.gap + 1], rng)
+    closed = reassembler.take()
+    assert len(closed) == 1 and reassembler.stats["closed_gap"] == 1
+    assert closed[0].payload == bytes.fromhex("".join(sent))
+    assert (closed[0].start, closed[0].last) == (0, 11)
+
+def test_idle_messages_closed():
+    rng = random.Random(4)
+    reassembler = Reassembler(reorder_window=0)
+    frames(reassembler, 1, [0, 1], rng)
+    frames(reassembler, 2, [20], rng)
+    reassembler.evict(now=1 + reassembler.idle_timeout + 1)
+    assert [msg.channel for msg in reassembler.take()] == [1]
+    assert list(reassembler.open) == [2] and reassembler.stats["closed_idle"] == 1
+
+def test_short_messages_dropped():
+    rng = random.Random(5)
+    reassembler = Reassembler(reorder_window=0)
+    frames(reassembler, 1, [0], rng, size=MIN_MESSAGE_LEN // 2)
+    reassembler.close_all()
+    assert not reassembler.take() and reassembler.stats["too_short"] == 1
+
+def test_frames_reordered_within_window():
+    rng = random.Random(6)
+    reassembler = Reassembler(reorder_window=1.0)
+    times = [0.0, 0.5, 0.3, 0.2, 0.9, 0.6]
+    sent = frames(reassembler, 7, times, rng)
+    # Nothing is released before the channel has seen a frame a window newer
+    assert 7 not in reassembler.open
+    sent += frames(reassembler, 7, [2.0], rng)
+    times.append(2.0)
+    assert reassembler.open[7].last == 0.9
+    reassembler.close_all()
+    msg = reassembler.take()[0]
+    assert msg.payload == bytes.fromhex("".join(data for _, data in sorted(zip(times, sent))))
+
+def test_late_frames_dropped():
+    rng = random.Random(7)
+    reassembler = Reassembler(reorder_window=1.0)
+    sent = frames(reassembler, 7, [0.0, 1.0, 2.5], rng)
+    frames(reassembler, 7, [0.5], rng)
+    assert reassembler.stats["late_frames"] == 1
+    reassembler.close_all()
+    assert reassembler.take()[0].payload == bytes.fromhex("".join(sent))
+
+def test_overflow_close():
+    rng = random.Random(8)
+    reassembler = Reassembler(reorder_window=0, max_message_bytes=500)
+    frames(reassembler, 1, range(5), rng)
+    closed = reassembler.take()
+    assert len(closed) == 1 and len(closed[0].payload) == 600 and reassembler.stats["forced_close"] == 1
+    assert len(reassembler.open[1].payload) == 400 and reassembler.open_bytes == 400
+
+def test_overflow_drop_oldest():
+    rng = random.Random(9)
+    reassembler = Reassembler(reorder_window=0, max_message_bytes=500, policy="drop-oldest")
+    sent = frames(reassembler, 1, range(5), rng)
+    msg = reassembler.open[1]
+    assert msg.payload == bytes.fromhex("".join(sent))[-500:]
+    assert reassembler.stats["dropped_bytes"] == 500 and reassembler.open_bytes == 500
+    # The dropped bytes stay in the histogram
+    assert msg.hist.total + len(msg.tail()) == 1000
+
+@pytest.mark.parametrize("policy", ["close", "drop-oldest"])
+def test_shed_least_recently_active(policy):
+    rng = random.Random(10)
+    reassembler = Reassembler(reorder_window=0, max_open_bytes=1000, policy=policy)
+    for channel in range(3):
+        frames(reassembler, channel, [channel], rng, size=300)
+    frames(reassembler, 0, [3], rng, size=300)
+    # Channel 0 was active last, 1 and 2 were freed to get below the low watermark
+    assert reassembler.stats["shed"] == 1
+    assert list(reassembler.open) == [0] and reassembler.open_bytes == 600
+    if policy == "close":
+        assert sorted(msg.channel for msg in reassembler.take()) == [1, 2]
+    else:
+        assert not reassembler.take() and reassembler.stats["dropped_messages"] == 2
+
+def test_stitch_across_chunks():
+    rng = random.Random(11)
+    first = Reassembler(reorder_window=0)
+    second = Reassembler(reorder_window=0)
+    second.hold_heads()
+    sent = frames(first, 1, [0, 1, 2], rng)
+    frames(first, 2, [0], rng)
+    heads, tails = first.take_boundary()
+    carry = {msg.channel: msg for msg in tails}
+
+    # Channel 1 continues into the second chunk and ends there, channel 3 starts in it and is still open at its end
+    sent += frames(second, 1, [3, 4], rng)
+    frames(second, 1, [20], rng)
+    frames(second, 3, [4], rng)
+    assert not second.take()
+    heads, tails = second.take_boundary()
+    assert sorted(msg.channel for msg in heads) == [1, 3]
+    assert sorted(msg.channel for msg in tails) == [1, 3]
+
+    merge = Reassembler(reorder_window=0)
+    carry = merge.stitch(carry, heads, tails)
+    closed = merge.take()
+    # Channel 2 did not continue, the first message of channel 1 was joined and closed by the later one
+    assert sorted(msg.channel for msg in closed) == [1, 2] and merge.stats["joined"] == 1
+    assert [msg.payload for msg in closed if msg.channel == 1] == [bytes.fromhex("".join(sent))]
+    assert sorted(carry) == [1, 3] and carry[1].start == 20
+
+def test_resume_counts_every_message_once(tmp_path):
+    rng = random.Random(12)
+    db_path = str(tmp_path / "stats.db")
+    reassembly = {"reorder_window": 0}
+    state = PipelineState(db_path=db_path, reassembly=reassembly)
+    state.init_db()
+    for channel in (1, 2):
+        for time in range(3):
+            state.process_frame("IDA", 1740053316.0 + time, channel, hex_payload(rng, 200))
+    # Both messages are checkpointed, then the one of channel 1 ends and is counted before the restart
+    state.last_checkpoint = 0
+    state.write_changes(state.take_changes())
+    state.process_frame("IDA", 1740053316.0 + 20, 1, hex_payload(rng, 10))
+    state.reconstruct_packets()
+    assert state.total_type_counts["IDA"]["total"] == 1
+    state.write_changes(state.take_changes())
+    state.close_db()
+
+    resumed = PipelineState(db_path=db_path, reassembly=reassembly)
+    resumed.init_db()
+    resumed.resume()
+    # The checkpointed message of channel 1 was counted before the restart, so only channel 2 is reopened
+    assert sorted(resumed.reassembler.open) == [2]
+    assert len(resumed.reassembler.open[2].payload) == 600
+    resumed.reconstruct_packets(final=True)
+    resumed.write_changes(resumed.take_changes())
+    assert resumed.connect().execute("SELECT total FROM encryption_stats WHERE type = 'IDA'").fetchone() == (2,)
+    resumed.close_db()
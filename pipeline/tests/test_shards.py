@@ -0,0 +1,43 @@
+import os
+
+from shards import ShardPool
+
+
+def count_worker(shard, lines_queue, results_queue):
+    try:
+        count = 0
+        while True:
+            batch = lines_queue.get()
+            if batch is None:
+                break
+            count += len(batch)
+        results_queue.put((shard, count))
+    finally:
+        results_queue.put((shard, None))
+
+def dying_worker(shard, lines_queue, results_queue):
+    # Shard 1 is killed without reporting its end, as on an OOM kill
+    if shard == 1:
+        lines_queue.get()
+        os._exit(1)
+    count_worker(shard, lines_queue, results_queue)
+
+def run_pool(target, lines):
+    results = []
+    pool = ShardPool(2, target, int, results.append, batch_size=10, maxsize=2).start()
+    for line in lines:
+        pool.put(line)
+    pool.stop(timeout=30)
+    assert not pool.collector.is_alive()
+    return pool, results
+
+def test_lines_reach_their_shard():
+    pool, results = run_pool(count_worker, [str(i) for i in range(1000)])
+    assert sorted(results) == [500, 500]
+    assert pool.sent == [500, 500] and sum(pool.lost) == 0
+
+def test_dead_worker_does_not_hang():
+    # More batches than fit into the queue of the dead shard, sending them used to block for good
+    pool, results = run_pool(dying_worker, [str(i) for i in range(1000)])
+    assert results == [500]
+    assert pool.sent[0] == 500 and pool.sent[1] + pool.lost[1] == 500 and pool.lost[1] > 0
@@ -0,0 +1,27 @@
+import numpy as np
+
+import util
+from util import base_freq, channel_width
+
+
+def test_channelize_band_edges():
+    freqs = [
+        base_freq - 1,                      # just below the band
+        base_freq - channel_width + 1,      # truncation would round this up to channel 0
+        base_freq,
+        base_freq + channel_width - 1,
+        base_freq + channel_width,
+        base_freq + 5 * channel_width + 0.5,
+    ]
+    chans, out_of_band = util.channelize_array(freqs)
+    assert list(chans) == [-1, -1, 0, 0, 1, 5]
+    assert list(out_of_band) == [True, True, False, False, False, False]
+    assert [util.channelize_str(f) for f in freqs] == list(chans)
+
+
+def test_channelize_channel_limit():
+    freqs = np.array([base_freq + 239.5 * channel_width, base_freq + 240.5 * channel_width])
+    chans, out_of_band = util.channelize_array(freqs, channels=240)
+    assert list(chans) == [239, 240]
+    assert list(out_of_band) == [False, True]
+    assert [util.channelize_str(f) for f in freqs] == [239, 240]
@@ -1,47 +1,77 @@
+import math
+
 import numpy as np
-from scipy.stats import entropy
 
 # it needs at least 64 bytes to calculate entropy correctly
-def calculate_entropy(data):
-    """Calculate the entropy of a data string using scipy."""
-    if not data or len(data) < 64:
-        return None
-    
-    # Convert the data to an array of byte values
-    byte_array = np.frombuffer(data, dtype=np.uint8)
-    
-    # Calculate the frequency of each byte value
-    byte_frequencies = np.bincount(byte_array, minlength=256) / len(byte_array)
-    
-    # Calculate the entropy
-    return entropy(byte_frequencies, base=2)
-
-def is_hex_encrypted(hex_string):
-    """Check if the hex string is likely to be encrypted based on entropy."""
-    # Convert the hex string to raw bytes
-    try:
-        # Convert the hex string to raw bytes
-        bytes_data = bytes.fromhex(hex_string)
-    except ValueError:
-        # If the hex string is invalid, return False
-        print(f"Invalid hex string: {hex_string}")  
-        print(f"len: {len(hex_string)}")
-        return False
-    # bytes_data = bytes.fromhex(hex_string)
-    
-    # Calculate the entropy of the bytes data
-    entropy_value = calculate_entropy(bytes_data)
-    if not entropy_value:
-        return False
-    
-    # print(f"entropy: {entropy_value} - {hex_string}")
-
-    # Arbitrary threshold for detecting high entropy (indicative of encryption)
-    # Higher cause most of the data can be encoded or compressed which increases the entropy
-    threshold = 7.0
-    
-    return entropy_value > threshold
+MIN_ENTROPY_BYTES = 64
+# Arbitrary threshold for detecting high entropy (indicative of encryption)
+ENTROPY_THRESHOLD = 7.0
+EARLY_MARGIN = 0.5  # Entropy distance from the threshold at which a running estimate is trusted
+
+def counts_entropy(counts, total):
+    """Entropy in bits per byte of a 256 bin byte histogram."""
+    p = counts[counts > 0] / total
+    return float(-(p * np.log2(p)).sum())
+
+def batch_histograms(buffers, counts=None):
+    """
+    Byte histograms of many buffers in one pass: the buffers are concatenated and every byte is offset by
+    256 times the index of its buffer, so a single bincount yields a (len(buffers), 256) histogram.
+    counts optionally holds histograms of earlier bytes of each buffer to add.
+    """
+    n = len(buffers)
+    lengths = np.fromiter((len(buffer) for buffer in buffers), dtype=np.int64, count=n)
+    codes = np.repeat(np.arange(n, dtype=np.int32) * 256, lengths)
+    codes += np.frombuffer(b"".join(buffers), dtype=np.uint8)
+    hist = np.bincount(codes, minlength=256 * n).reshape(n, 256)
+    return hist if counts is None else hist + counts
+
+def batch_entropy(buffers, counts=None):
+    """
+    Entropy of many byte buffers at once from their batch_histograms.
+    Buffers with less than MIN_ENTROPY_BYTES bytes in total get NaN.
+    """
+    hist = batch_histograms(buffers, counts)
+    totals = hist.sum(axis=1)
+
+    # H = log2(N) - sum(c * log2(c)) / N, summed over the non-empty bins only
+    nonzero = np.flatnonzero(hist)
+    c = hist.ravel()[nonzero].astype(np.float64)
+    sums = np.bincount(nonzero // 256, weights=c * np.log2(c), minlength=len(hist))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropies = np.log2(totals) - sums / totals
+    entropies[totals < MIN_ENTROPY_BYTES] = np.nan
+    return entropies
 
+class ByteHistogram:
+    """
+    Running byte histogram of a stream, updated as data arrives so the entropy can be read out
+    at any time from the 256 counts instead of another pass over the data.
+    """
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = np.zeros(256, dtype=np.int64)
+        self.total = 0
+
+    def update(self, data):
+        byte_array = np.frombuffer(data, dtype=np.uint8)
+        self.counts += np.bincount(byte_array, minlength=256)
+        self.total += len(byte_array)
+
+    def entropy(self):
+        if self.total < MIN_ENTROPY_BYTES:
+            return None
+        return counts_entropy(self.counts, self.total)
+
+    def decide(self, margin=EARLY_MARGIN):
+        """
+        Early decision: True or False once the entropy is clearly above or below the threshold, None while in doubt.
+        """
+        entropy_value = self.entropy()
+        if entropy_value is None or abs(entropy_value - ENTROPY_THRESHOLD) < margin:
+            return None
+        return entropy_value > ENTROPY_THRESHOLD
 
 # function taken from iridium-toolkit
 # https://github.com/muccc/iridium-toolkit
@@ -54,11 +84,23 @@ channel_width=1e7/(30*8) # 30 sub-bands with 8 "frequency accesses" each
 
 # return index instead subband.access
 def channelize_str(freq):
-    fbase = freq-base_freq
-    freq_chan = int(fbase / channel_width)
-    sb = int(freq_chan/8)+1
-    fa = (freq_chan % 8)+1
-    sx = freq_chan-30*8+1
-    foff = fbase%channel_width
-    freq_off = foff-(channel_width/2)
-    return freq_chan
\ No newline at end of file
+    # floor, not int(): frequencies just below the band must map to -1 like in channelize_array
+    return math.floor((freq-base_freq) / channel_width)
+
+def channelize_array(freqs, channels=None, details=False):
+    """
+    Vectorized channelize_str for an array of frequencies in Hz.
+    Returns the channel indices and a mask of the frequencies below the band or at/above the given number of channels.
+    With details set, the subband, frequency access and offset from the channel center are returned as well.
+    """
+    fbase = np.asarray(freqs, dtype=np.float64) - base_freq
+    freq_chan = np.floor(fbase / channel_width).astype(np.int64)
+    out_of_band = freq_chan < 0
+    if channels is not None:
+        out_of_band |= freq_chan >= channels
+    if not details:
+        return freq_chan, out_of_band
+    sb = freq_chan // 8 + 1
+    fa = freq_chan % 8 + 1
+    freq_off = fbase % channel_width - channel_width / 2
+    return freq_chan, out_of_band, sb, fa, freq_off